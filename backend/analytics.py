@@ -0,0 +1,298 @@
+import bisect
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, case, or_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from models import LabProgressDB, SessionRollupDB, SessionStatus, UserSessionDB
+
+logger = logging.getLogger(__name__)
+
+ALL_LABS = "*"
+PERIODS = ("hour", "day", "total")
+EPOCH = datetime(1970, 1, 1)
+COMPLETION_STEP = 999  # Sentinel written by POST /sessions/{uuid}/complete
+
+# Upper bounds of the usage histogram buckets; the last bucket is open-ended
+CPU_BUCKETS_MILLICORES = [50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000]
+MEMORY_BUCKETS_MIB = [128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536]
+
+COUNTERS = (
+    "sessions_started",
+    "sessions_completed",
+    "sessions_ended",
+    "total_duration_seconds",
+)
+
+
+def bucket_start(period: str, at: datetime) -> datetime:
+    if period == "hour":
+        return at.replace(minute=0, second=0, microsecond=0)
+    if period == "day":
+        return at.replace(hour=0, minute=0, second=0, microsecond=0)
+    return EPOCH
+
+
+def histogram_percentile(counts: Optional[List[int]], bounds: List[int], pct: float):
+    """Approximates a percentile as the upper bound of the bucket containing it."""
+    if not counts or not sum(counts):
+        return None
+    target = sum(counts) * pct / 100
+    seen = 0
+    for i, count in enumerate(counts):
+        seen += count
+        if seen >= target:
+            return float(bounds[i]) if i < len(bounds) else float(bounds[-1])
+    return float(bounds[-1])
+
+
+class AnalyticsRecorder:
+    """Maintains hourly/daily/all-time session rollups incrementally.
+
+    Every lifecycle event is folded into the matching bucket rows with a single
+    upsert per row, so reading stats only touches a handful of rollup rows no
+    matter how much session history has accumulated.
+    """
+
+    def __init__(self, db_session_factory):
+        self.db_session_factory = db_session_factory
+
+    # --- Lifecycle hooks ---
+
+    def record_started(self, lab_id: str, count: int = 1, at: Optional[datetime] = None):
+        self._record(lab_id, at, {"sessions_started": count}, track_concurrency=True)
+
+    def record_ended(self, lab_id: str, start_time: Optional[datetime], at: Optional[datetime] = None):
+        at = at or datetime.utcnow()
+        duration = (at - start_time).total_seconds() if start_time else 0.0
+        self._record(
+            lab_id, at, {"sessions_ended": 1, "total_duration_seconds": max(duration, 0.0)}
+        )
+
+    def record_completed(self, lab_id: str, at: Optional[datetime] = None):
+        self._record(lab_id, at, {"sessions_completed": 1})
+
+    def record_usage(self, usages: List[Dict], at: Optional[datetime] = None):
+        """Folds one usage sweep (quota `used` maps) into the usage histograms."""
+        from kubernetes.utils import parse_quantity  # Importing kubernetes is slow; sweeps already loaded it
+
+        at = at or datetime.utcnow()
+        cpu = [0] * (len(CPU_BUCKETS_MILLICORES) + 1)
+        memory = [0] * (len(MEMORY_BUCKETS_MIB) + 1)
+        for usage in usages:
+            try:
+                if usage.get("cpu"):
+                    millicores = float(parse_quantity(usage["cpu"]) * 1000)
+                    cpu[bisect.bisect_left(CPU_BUCKETS_MILLICORES, millicores)] += 1
+                if usage.get("memory"):
+                    mib = float(parse_quantity(usage["memory"]) / (1024 * 1024))
+                    memory[bisect.bisect_left(MEMORY_BUCKETS_MIB, mib)] += 1
+            except ValueError as e:
+                logger.debug("Skipping unparsable usage %s: %s", usage, e)
+
+        db: Session = self.db_session_factory()
+        try:
+            # Usage sweeps only run on the leader, so read-modify-write is safe here
+            for period in ("hour", "day"):
+                self._upsert(db, period, bucket_start(period, at), ALL_LABS, {}, {})
+                row = (
+                    db.query(SessionRollupDB)
+                    .filter(
+                        SessionRollupDB.period == period,
+                        SessionRollupDB.bucket_start == bucket_start(period, at),
+                        SessionRollupDB.lab_id == ALL_LABS,
+                    )
+                    .one()
+                )
+                row.cpu_usage_histogram = self._add(row.cpu_usage_histogram, cpu)
+                row.memory_usage_histogram = self._add(row.memory_usage_histogram, memory)
+            db.commit()
+        except Exception as e:
+            logger.error("Failed to record usage analytics: %s", e)
+            db.rollback()
+        finally:
+            db.close()
+
+    # --- Queries ---
+
+    def stats(self, db: Session, now: Optional[datetime] = None) -> Dict:
+        now = now or datetime.utcnow()
+        rows = (
+            db.query(SessionRollupDB)
+            .filter(
+                or_(
+                    and_(
+                        SessionRollupDB.period == "day",
+                        SessionRollupDB.bucket_start == bucket_start("day", now),
+                    ),
+                    SessionRollupDB.period == "total",
+                )
+            )
+            .all()
+        )
+        today = {r.lab_id: r for r in rows if r.period == "day"}
+        total = {r.lab_id: r for r in rows if r.period == "total"}
+        today_all = today.get(ALL_LABS)
+        total_all = total.get(ALL_LABS)
+
+        popular_labs = dict(
+            sorted(
+                ((lab, r.sessions_started or 0) for lab, r in total.items() if lab != ALL_LABS),
+                key=lambda item: item[1],
+                reverse=True,
+            )
+        )
+
+        avg_duration = None
+        if today_all and today_all.sessions_ended:
+            avg_duration = today_all.total_duration_seconds / today_all.sessions_ended / 60
+
+        cpu_hist = today_all.cpu_usage_histogram if today_all else None
+        mem_hist = today_all.memory_usage_histogram if today_all else None
+        return {
+            "total_sessions_all_time": total_all.sessions_started if total_all else 0,
+            "total_sessions_today": today_all.sessions_started if today_all else 0,
+            "completions_today": today_all.sessions_completed if today_all else 0,
+            "avg_duration_minutes_today": avg_duration,
+            "peak_concurrency_today": today_all.peak_concurrency if today_all else 0,
+            "popular_labs": popular_labs,
+            "cpu_millicores_today": {
+                f"p{p}": histogram_percentile(cpu_hist, CPU_BUCKETS_MILLICORES, p)
+                for p in (50, 95, 99)
+            },
+            "memory_mib_today": {
+                f"p{p}": histogram_percentile(mem_hist, MEMORY_BUCKETS_MIB, p)
+                for p in (50, 95, 99)
+            },
+        }
+
+    def backfill_if_empty(self):
+        """Builds rollups from existing session history the first time it runs."""
+        db: Session = self.db_session_factory()
+        try:
+            if db.query(SessionRollupDB.id).first() is not None:
+                return
+
+            counters = defaultdict(lambda: defaultdict(float))
+            lab_by_session = {}
+            history = db.query(
+                UserSessionDB.id,
+                UserSessionDB.lab_id,
+                UserSessionDB.start_time,
+                UserSessionDB.status,
+                UserSessionDB.updated_at,
+            ).yield_per(1000)
+            for row in history:
+                lab_by_session[row.id] = row.lab_id
+                if row.start_time:
+                    self._accumulate(counters, row.lab_id, row.start_time, "sessions_started", 1)
+                if row.status in (SessionStatus.EXPIRED, SessionStatus.TERMINATED) and row.start_time:
+                    # The last write to a finished session is (roughly) when it ended
+                    ended = row.updated_at or row.start_time
+                    self._accumulate(counters, row.lab_id, ended, "sessions_ended", 1)
+                    self._accumulate(
+                        counters,
+                        row.lab_id,
+                        ended,
+                        "total_duration_seconds",
+                        max((ended - row.start_time).total_seconds(), 0.0),
+                    )
+
+            completions = db.query(LabProgressDB.session_id, LabProgressDB.completed_at).filter(
+                LabProgressDB.step_completed == COMPLETION_STEP
+            )
+            for row in completions:
+                if row.session_id in lab_by_session and row.completed_at:
+                    self._accumulate(
+                        counters, lab_by_session[row.session_id], row.completed_at, "sessions_completed", 1
+                    )
+
+            db.bulk_insert_mappings(
+                SessionRollupDB,
+                [
+                    {
+                        "period": period,
+                        "bucket_start": start,
+                        "lab_id": lab_id,
+                        **{
+                            c: values.get(c, 0) if c == "total_duration_seconds" else int(values.get(c, 0))
+                            for c in COUNTERS
+                        },
+                        "peak_concurrency": 0,
+                    }
+                    for (period, start, lab_id), values in counters.items()
+                ],
+            )
+            db.commit()
+            logger.info("Backfilled %s analytics rollup rows from history", len(counters))
+        except Exception as e:
+            logger.error("Failed to backfill analytics rollups: %s", e)
+            db.rollback()
+        finally:
+            db.close()
+
+    # --- Internals ---
+
+    def _record(self, lab_id: str, at: Optional[datetime], increments: Dict, track_concurrency=False):
+        at = at or datetime.utcnow()
+        db: Session = self.db_session_factory()
+        try:
+            maxima = {}
+            if track_concurrency:
+                # Active sessions are a small indexed set, not the whole history
+                maxima["peak_concurrency"] = (
+                    db.query(UserSessionDB)
+                    .filter(UserSessionDB.status == SessionStatus.ACTIVE)
+                    .count()
+                )
+            for period in PERIODS:
+                start = bucket_start(period, at)
+                self._upsert(db, period, start, lab_id, increments, {})
+                self._upsert(db, period, start, ALL_LABS, increments, maxima)
+            db.commit()
+        except Exception as e:
+            # Analytics must never break the lifecycle operation being recorded
+            logger.error("Failed to record analytics for lab %s: %s", lab_id, e)
+            db.rollback()
+        finally:
+            db.close()
+
+    def _upsert(self, db: Session, period, start, lab_id, increments: Dict, maxima: Dict):
+        table = SessionRollupDB.__table__
+        insert = postgresql.insert if db.bind.dialect.name == "postgresql" else sqlite.insert
+        stmt = insert(table).values(
+            period=period, bucket_start=start, lab_id=lab_id, **increments, **maxima
+        )
+        updates = {c: table.c[c] + stmt.excluded[c] for c in increments}
+        updates.update(
+            {
+                c: case((stmt.excluded[c] > table.c[c], stmt.excluded[c]), else_=table.c[c])
+                for c in maxima
+            }
+        )
+        if updates:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["period", "bucket_start", "lab_id"], set_=updates
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing(
+                index_elements=["period", "bucket_start", "lab_id"]
+            )
+        db.execute(stmt)
+
+    @staticmethod
+    def _add(current: Optional[List[int]], delta: List[int]) -> List[int]:
+        if not current or len(current) != len(delta):
+            return list(delta)
+        return [a + b for a, b in zip(current, delta)]
+
+    @staticmethod
+    def _accumulate(counters, lab_id, at, counter, amount):
+        for period in PERIODS:
+            start = bucket_start(period, at)
+            counters[(period, start, lab_id)][counter] += amount
+            counters[(period, start, ALL_LABS)][counter] += amount
@@ -0,0 +1,229 @@
+import asyncio
+import json
+import logging
+import tempfile
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import List, Optional, Set
+
+from sqlalchemy import DateTime, delete, insert, literal, select
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.orm import Session
+
+from models import (
+    LabProgressArchiveDB,
+    LabProgressDB,
+    SessionArchiveDB,
+    SessionStatus,
+    UserSessionDB,
+)
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATUSES = (SessionStatus.EXPIRED, SessionStatus.TERMINATED, SessionStatus.ERROR)
+
+
+class SessionArchiver:
+    """Moves finished sessions out of the hot sessions table.
+
+    Sessions that finished more than `retention` ago are copied to
+    sessions_archive (with their lab_progress rows) and deleted from the live
+    tables in batches, one transaction per batch, so status queries and counts
+    only ever scan recent history. If a batch fails its sessions are archived
+    one at a time, and any whose rows are rejected are quarantined (skipped by this
+    process and logged) so one bad row cannot stall archiving. Archived rows
+    can be exported to Parquet.
+    """
+
+    def __init__(
+        self,
+        db_session_factory,
+        retention: timedelta = timedelta(days=7),
+        batch_size: int = 1000,
+        max_batches: int = 50,
+    ):
+        self.db_session_factory = db_session_factory
+        self.retention = retention
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.quarantined: Set[int] = set()
+
+    async def archive_finished(self):
+        moved = await asyncio.to_thread(self._archive_batches)
+        if moved:
+            logger.info("Archived %s finished session(s)", moved)
+
+    def _archive_batches(self) -> int:
+        cutoff = datetime.utcnow() - self.retention
+        moved = 0
+        # Bounded per run so a large first-time backlog is spread over several runs
+        for _ in range(self.max_batches):
+            count = self._archive_batch(cutoff)
+            moved += count
+            if count < self.batch_size:
+                break
+        return moved
+
+    def _archive_batch(self, cutoff: datetime) -> int:
+        """Archives up to batch_size sessions; returns how many were selected."""
+        db: Session = self.db_session_factory()
+        try:
+            query = db.query(UserSessionDB.id).filter(
+                UserSessionDB.status.in_(FINISHED_STATUSES),
+                UserSessionDB.updated_at < cutoff,
+            )
+            if self.quarantined:
+                query = query.filter(UserSessionDB.id.notin_(self.quarantined))
+            ids = [row.id for row in query.order_by(UserSessionDB.id).limit(self.batch_size)]
+        except Exception as e:
+            logger.error("Failed to select sessions to archive: %s", e)
+            return 0
+        finally:
+            db.close()
+        if not ids:
+            return 0
+
+        try:
+            self._move(ids)
+        except (IntegrityError, DataError) as e:
+            logger.error("Failed to archive a batch of %s session(s), retrying one by one: %s", len(ids), e)
+            for session_id in ids:
+                try:
+                    self._move([session_id])
+                except (IntegrityError, DataError) as e:
+                    logger.error("Quarantining session %s, which could not be archived: %s", session_id, e)
+                    self.quarantined.add(session_id)
+                except Exception as e:
+                    logger.error("Failed to archive sessions: %s", e)
+                    return 0
+        except Exception as e:
+            # Not caused by the rows themselves (e.g. the DB is unreachable): try again next run
+            logger.error("Failed to archive sessions: %s", e)
+            return 0
+        return len(ids)
+
+    def _move(self, ids: List[int]):
+        """Copies the sessions and their progress to the archive and deletes them, in one transaction."""
+        db: Session = self.db_session_factory()
+        try:
+            now = literal(datetime.utcnow(), DateTime)
+            sessions = UserSessionDB.__table__
+            session_columns = [c.name for c in SessionArchiveDB.__table__.columns if c.name != "archived_at"]
+            db.execute(
+                insert(SessionArchiveDB.__table__).from_select(
+                    [*session_columns, "archived_at"],
+                    select(*(sessions.c[c] for c in session_columns), now).where(
+                        sessions.c.id.in_(ids)
+                    ),
+                )
+            )
+            progress = LabProgressDB.__table__
+            progress_columns = [c.name for c in LabProgressArchiveDB.__table__.columns]
+            db.execute(
+                insert(LabProgressArchiveDB.__table__).from_select(
+                    progress_columns,
+                    select(*(progress.c[c] for c in progress_columns)).where(
+                        progress.c.session_id.in_(ids)
+                    ),
+                )
+            )
+            db.execute(delete(progress).where(progress.c.session_id.in_(ids)))
+            db.execute(delete(sessions).where(sessions.c.id.in_(ids)))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    # --- Export ---
+
+    def export_parquet(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        chunk_size: int = 10000,
+    ) -> str:
+        """Writes archived sessions started in [start, end) to a zstd Parquet file; returns its path."""
+        # Only needed for exports, so keep it off the startup path
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = pa.schema(
+            [
+                ("id", pa.int64()),
+                ("session_uuid", pa.string()),
+                ("user_id", pa.string()),
+                ("lab_id", pa.string()),
+                ("sandbox_namespace", pa.string()),
+                ("status", pa.string()),
+                ("start_time", pa.timestamp("us")),
+                ("last_activity", pa.timestamp("us")),
+                ("expires_at", pa.timestamp("us")),
+                ("updated_at", pa.timestamp("us")),
+                ("archived_at", pa.timestamp("us")),
+                ("duration_seconds", pa.float64()),
+                ("resource_quota_used", pa.string()),  # JSON
+                ("steps_completed", pa.list_(pa.int32())),
+            ]
+        )
+
+        db: Session = self.db_session_factory()
+        output = tempfile.NamedTemporaryFile(suffix=".parquet", delete=False)
+        output.close()
+        try:
+            query = db.query(SessionArchiveDB).order_by(SessionArchiveDB.id)
+            if start:
+                query = query.filter(SessionArchiveDB.start_time >= start)
+            if end:
+                query = query.filter(SessionArchiveDB.start_time < end)
+
+            with pq.ParquetWriter(output.name, schema, compression="zstd") as writer:
+                batch = []
+                for row in query.yield_per(chunk_size):
+                    batch.append(row)
+                    if len(batch) >= chunk_size:
+                        writer.write_table(self._to_table(db, batch, schema, pa))
+                        batch = []
+                if batch:
+                    writer.write_table(self._to_table(db, batch, schema, pa))
+            return output.name
+        finally:
+            db.close()
+
+    @staticmethod
+    def _to_table(db: Session, rows, schema, pa):
+        steps = defaultdict(list)
+        for progress in db.query(
+            LabProgressArchiveDB.session_id, LabProgressArchiveDB.step_completed
+        ).filter(LabProgressArchiveDB.session_id.in_([r.id for r in rows])):
+            steps[progress.session_id].append(progress.step_completed)
+
+        return pa.Table.from_pylist(
+            [
+                {
+                    "id": r.id,
+                    "session_uuid": r.session_uuid,
+                    "user_id": r.user_id,
+                    "lab_id": r.lab_id,
+                    "sandbox_namespace": r.sandbox_namespace,
+                    "status": r.status.value if r.status else None,
+                    "start_time": r.start_time,
+                    "last_activity": r.last_activity,
+                    "expires_at": r.expires_at,
+                    "updated_at": r.updated_at,
+                    "archived_at": r.archived_at,
+                    "duration_seconds": (
+                        (r.updated_at - r.start_time).total_seconds()
+                        if r.updated_at and r.start_time
+                        else None
+                    ),
+                    "resource_quota_used": (
+                        json.dumps(r.resource_quota_used) if r.resource_quota_used else None
+                    ),
+                    "steps_completed": sorted(steps.get(r.id, [])),
+                }
+                for r in rows
+            ],
+            schema=schema,
+        )
@@ -1,16 +1,37 @@
+import asyncio
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import List, Optional
+from sqlalchemy import or_, update
 from sqlalchemy.orm import Session
 from models import UserSessionDB, SessionStatus
-from kubernetes_ops import KubernetesOps
+from k8s_client import BACKGROUND, k8s_priority
+from clusters import ClusterRegistry
+from analytics import AnalyticsRecorder
+from events import EventBus, session_payload
+from snapshots import SnapshotStore
 
 logger = logging.getLogger(__name__)
 
 
 class ExpiryController:
-    def __init__(self, db_session_factory, k8s_ops: KubernetesOps):
+    def __init__(
+        self,
+        db_session_factory,
+        clusters: ClusterRegistry,
+        event_bus: EventBus,
+        analytics: AnalyticsRecorder,
+        snapshots: SnapshotStore,
+        identity: Optional[str] = None,
+        provisioning_stale_after: timedelta = timedelta(minutes=5),
+    ):
         self.db_session_factory = db_session_factory
-        self.k8s_ops = k8s_ops
+        self.clusters = clusters
+        self.event_bus = event_bus
+        self.analytics = analytics
+        self.snapshots = snapshots
+        self.identity = identity
+        self.provisioning_stale_after = provisioning_stale_after
 
     async def check_expired_sessions(self):
         """Checks for expired sessions and cleans up resources."""
@@ -29,18 +50,39 @@ class ExpiryController:
 
             for session in expired_sessions:
                 logger.info(
-                    f"Session {session.session_uuid} for user {session.user_id} has expired."
+                    "Session %s for user %s has expired.", session.session_uuid, session.user_id
                 )
                 try:
-                    # Cleanup K8s
-                    self.k8s_ops.delete_sandbox_namespace(session.sandbox_namespace)
+                    # Cleanup K8s, keeping the learner's work for their next session
+                    ops = self.clusters.ops(session.cluster)
+                    with k8s_priority(BACKGROUND):
+                        await self.snapshots.save(
+                            ops,
+                            session.sandbox_namespace,
+                            session.user_id,
+                            session.lab_id,
+                            session.session_uuid,
+                        )
+                        await asyncio.to_thread(
+                            ops.delete_sandbox_namespace, session.sandbox_namespace
+                        )
 
-                    # Update DB status
-                    session.status = SessionStatus.EXPIRED
+                    # Update DB status, unless a DELETE ended the session during teardown
+                    ended = db.execute(
+                        update(UserSessionDB)
+                        .where(
+                            UserSessionDB.id == session.id,
+                            UserSessionDB.status == SessionStatus.ACTIVE,
+                        )
+                        .values(status=SessionStatus.EXPIRED)
+                    ).rowcount
                     db.commit()
+                    if ended == 1:
+                        self.event_bus.publish("expired", session_payload(session))
+                        self.analytics.record_ended(session.lab_id, session.start_time)
                 except Exception as e:
                     logger.error(
-                        f"Failed to cleanup expired session {session.session_uuid}: {e}"
+                        "Failed to cleanup expired session %s: %s", session.session_uuid, e
                     )
                     db.rollback()
         finally:
@@ -56,10 +98,134 @@ class ExpiryController:
                 .all()
             )
 
+            usages = []
             for session in active_sessions:
-                usage = self.k8s_ops.get_namespace_usage(session.sandbox_namespace)
+                with k8s_priority(BACKGROUND):
+                    usage = await asyncio.to_thread(
+                        self.clusters.ops(session.cluster).get_namespace_usage,
+                        session.sandbox_namespace,
+                    )
+                usages.append(usage)
                 session.resource_quota_used = usage
                 session.last_activity = datetime.utcnow()
                 db.commit()
+                self.event_bus.publish(
+                    "usage", session_payload(session, "resource_quota_used")
+                )
+
+            if usages:
+                self.analytics.record_usage(usages)
+        finally:
+            db.close()
+
+    # --- Provisioning handoff ---
+
+    def record_provisioning_step(self, session_id: int, step: Optional[str], owner: Optional[str] = None):
+        """Persists the provisioning step in progress (None once the sandbox is ready)."""
+        db: Session = self.db_session_factory()
+        try:
+            db.execute(
+                update(UserSessionDB)
+                .where(UserSessionDB.id == session_id)
+                .values(provisioning_step=step, provisioning_owner=owner if step else None)
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def finish_provisioning(
+        self, session_id: int, status: SessionStatus = SessionStatus.ACTIVE, **values
+    ) -> bool:
+        """Ends provisioning, setting `status` and `values`; False if the session was
+        ended meanwhile, in which case the row is left alone."""
+        db: Session = self.db_session_factory()
+        try:
+            finished = db.execute(
+                update(UserSessionDB)
+                .where(UserSessionDB.id == session_id, UserSessionDB.status == SessionStatus.ACTIVE)
+                .values(status=status, provisioning_step=None, provisioning_owner=None, **values)
+            ).rowcount
+            db.commit()
+            return finished == 1
+        finally:
+            db.close()
+
+    def release_provisioning(self, session_uuids: List[str]):
+        """Hands interrupted provisioning over to whichever replica resumes it next."""
+        db: Session = self.db_session_factory()
+        try:
+            db.execute(
+                update(UserSessionDB)
+                .where(UserSessionDB.session_uuid.in_(session_uuids))
+                .values(provisioning_owner=None)
+            )
+            db.commit()
+            logger.info("Released provisioning of %s session(s) for handoff", len(session_uuids))
+        finally:
+            db.close()
+
+    async def resume_interrupted_provisioning(self):
+        """Finishes sandboxes whose provisioning was released by a draining replica or
+        abandoned by one that died."""
+        stale = datetime.utcnow() - self.provisioning_stale_after
+        claimable = or_(UserSessionDB.provisioning_owner.is_(None), UserSessionDB.updated_at < stale)
+        db: Session = self.db_session_factory()
+        try:
+            sessions = (
+                db.query(UserSessionDB)
+                .filter(
+                    UserSessionDB.status == SessionStatus.ACTIVE,
+                    UserSessionDB.provisioning_step.isnot(None),
+                    claimable,
+                )
+                .all()
+            )
+            for session in sessions:
+                # Claim it, so a slow previous owner and this run don't both count as owner
+                claimed = db.execute(
+                    update(UserSessionDB)
+                    .where(UserSessionDB.id == session.id, claimable)
+                    .values(provisioning_owner=self.identity)
+                ).rowcount
+                db.commit()
+                if claimed:
+                    await self._resume(db, session)
         finally:
             db.close()
+
+    async def _resume(self, db: Session, session: UserSessionDB):
+        logger.info(
+            "Resuming provisioning of %s at step '%s'", session.session_uuid, session.provisioning_step
+        )
+
+        # Snapshot before handing off to a worker thread; the ORM session stays here
+        session_id = session.id
+        payload = {**session_payload(session), "status": "provisioning"}
+
+        def on_step(step: str):
+            self.record_provisioning_step(session_id, step, self.identity)
+            self.event_bus.publish("provisioning", {**payload, "step": step})
+
+        try:
+            await asyncio.to_thread(
+                self.clusters.ops(session.cluster).provision_sandbox,
+                session.sandbox_namespace,
+                session.user_id,
+                on_step=on_step,
+                start_at=session.provisioning_step,
+            )
+        except Exception as e:
+            logger.error("Resumed provisioning of %s failed: %s", session.session_uuid, e)
+            failed = await asyncio.to_thread(self.finish_provisioning, session_id, SessionStatus.ERROR)
+            db.refresh(session)
+            if failed:
+                self.event_bus.publish("failed", session_payload(session))
+            return
+
+        finished = await asyncio.to_thread(self.finish_provisioning, session_id)
+        db.refresh(session)
+        if not finished:
+            logger.info("Session %s was ended while its provisioning resumed", session.session_uuid)
+            return
+        self.event_bus.publish("created", session_payload(session))
+        await asyncio.to_thread(self.analytics.record_started, session.lab_id)
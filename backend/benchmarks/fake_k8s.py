@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""In-memory stand-in for the Kubernetes API server, for benchmarks.
+
+Serves the REST paths KubernetesOps uses (core and /apis groups, namespaced
+and cluster-scoped collections, /version, /openapi/v2) from a dict, with
+configurable latency and injected 500/429 errors. Deleting a namespace
+deletes everything in it; created pods are immediately Running.
+
+    cd backend && python benchmarks/fake_k8s.py --port 8443 --latency-ms 20
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# /api/v1[/namespaces/{ns}]/{plural}[/{name}] and /apis/{group}/{version}[...]
+PATH_RE = re.compile(
+    r"^/(?:api/(?P<core>v1)|apis/(?P<group>[^/]+)/(?P<version>[^/]+))"
+    r"(?:/namespaces/(?P<namespace>[^/]+))?"
+    r"/(?P<plural>[^/]+)(?:/(?P<name>[^/]+))?(?:/(?P<sub>[^/]+))?$"
+)
+
+VERSION_INFO = {
+    "major": "1",
+    "minor": "29",
+    "gitVersion": "v1.29.0-fake",
+    "gitCommit": "0000000",
+    "gitTreeState": "clean",
+    "buildDate": "2024-01-01T00:00:00Z",
+    "goVersion": "go1.21",
+    "compiler": "gc",
+    "platform": "linux/amd64",
+}
+
+
+def status(code, reason, message):
+    return {"kind": "Status", "apiVersion": "v1", "status": "Failure", "reason": reason, "message": message, "code": code}
+
+
+def matches_selector(obj, selector):
+    labels = obj.get("metadata", {}).get("labels") or {}
+    for term in filter(None, (selector or "").split(",")):
+        key, _, value = term.partition("=")
+        if labels.get(key.strip()) != value.strip():
+            return False
+    return True
+
+
+class FakeCluster:
+    """The object store and fault injection settings shared by all handler threads."""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, throttle_rate=0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        # (api prefix, namespace or "", plural) -> name -> object
+        self.objects = {}
+        self.requests = Counter()
+        self.injected = Counter()
+        self._resource_version = 0
+        self._lock = threading.Lock()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": dict(self.requests),
+                "injected": dict(self.injected),
+                "namespaces": len(self.objects.get(("v1", "", "namespaces"), {})),
+            }
+
+    def fault(self):
+        """Sleeps for the configured latency; returns an injected error response, if any."""
+        delay = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+        roll = random.random()
+        if roll < self.throttle_rate:
+            with self._lock:
+                self.injected[429] += 1
+            return 429, status(429, "TooManyRequests", "injected throttle")
+        if roll < self.throttle_rate + self.error_rate:
+            with self._lock:
+                self.injected[500] += 1
+            return 500, status(500, "InternalError", "injected error")
+        return None
+
+    def handle(self, method, path, query, body):
+        with self._lock:
+            self.requests[method] += 1
+        injected = self.fault()
+        if injected:
+            return injected
+
+        if path == "/version":
+            return 200, VERSION_INFO
+        if path == "/openapi/v2":
+            return 200, {"swagger": "2.0", "info": {"title": "fake", "version": "v1.29.0"}, "definitions": {}}
+
+        match = PATH_RE.match(path)
+        if not match:
+            return 404, status(404, "NotFound", f"unknown path {path}")
+        prefix = match["core"] or f"{match['group']}/{match['version']}"
+        namespace, plural, name = match["namespace"] or "", match["plural"], match["name"]
+        if match["sub"] == "log":
+            return 200, "fake log line\n"
+
+        with self._lock:
+            if method == "GET":
+                return self._get(prefix, namespace, plural, name, query)
+            if method == "POST":
+                return self._create(prefix, namespace, plural, body)
+            if method in ("PUT", "PATCH"):
+                return self._update(prefix, namespace, plural, name, body, merge=method == "PATCH")
+            if method == "DELETE":
+                return self._delete(prefix, namespace, plural, name)
+        return 405, status(405, "MethodNotAllowed", method)
+
+    # --- Store operations (called with the lock held) ---
+
+    def _next_version(self):
+        self._resource_version += 1
+        return str(self._resource_version)
+
+    def _get(self, prefix, namespace, plural, name, query):
+        if name is not None:
+            obj = self.objects.get((prefix, namespace, plural), {}).get(name)
+            if obj is None:
+                return 404, status(404, "NotFound", f'{plural} "{name}" not found')
+            return 200, obj
+        selector = query.get("labelSelector", [None])[0]
+        items = []
+        for (p, ns, pl), objs in self.objects.items():
+            # A collection without a namespace lists across all namespaces
+            if p == prefix and pl == plural and (ns == namespace or not namespace):
+                items.extend(o for o in objs.values() if matches_selector(o, selector))
+        kind = items[0]["kind"] + "List" if items and "kind" in items[0] else "List"
+        return 200, {
+            "kind": kind,
+            "apiVersion": prefix,
+            "metadata": {"resourceVersion": str(self._resource_version)},
+            "items": items,
+        }
+
+    def _create(self, prefix, namespace, plural, body):
+        metadata = body.setdefault("metadata", {})
+        name = metadata.get("name") or f"{metadata.get('generateName', 'obj-')}{uuid.uuid4().hex[:5]}"
+        if namespace and namespace not in self.objects.get(("v1", "", "namespaces"), {}):
+            return 404, status(404, "NotFound", f'namespaces "{namespace}" not found')
+        store = self.objects.setdefault((prefix, namespace, plural), {})
+        if name in store:
+            return 409, status(409, "AlreadyExists", f'{plural} "{name}" already exists')
+        metadata.update(
+            name=name,
+            uid=str(uuid.uuid4()),
+            resourceVersion=self._next_version(),
+            creationTimestamp=datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        )
+        if namespace:
+            metadata["namespace"] = namespace
+        if plural == "pods":
+            body["status"] = {"phase": "Running", "conditions": [{"type": "Ready", "status": "True"}]}
+        elif plural == "namespaces":
+            body["status"] = {"phase": "Active"}
+        elif plural == "resourcequotas":
+            body["status"] = {"hard": body.get("spec", {}).get("hard", {}), "used": {}}
+        store[name] = body
+        return 201, body
+
+    def _update(self, prefix, namespace, plural, name, body, merge):
+        store = self.objects.get((prefix, namespace, plural), {})
+        if name not in store:
+            return 404, status(404, "NotFound", f'{plural} "{name}" not found')
+        obj = {**store[name], **body} if merge else body
+        obj.setdefault("metadata", {})["resourceVersion"] = self._next_version()
+        store[name] = obj
+        return 200, obj
+
+    def _delete(self, prefix, namespace, plural, name):
+        store = self.objects.get((prefix, namespace, plural), {})
+        obj = store.pop(name, None)
+        if obj is None:
+            return 404, status(404, "NotFound", f'{plural} "{name}" not found')
+        if prefix == "v1" and plural == "namespaces":
+            for key in [k for k in self.objects if k[1] == name]:
+                del self.objects[key]
+        return 200, {"kind": "Status", "apiVersion": "v1", "status": "Success"}
+
+
+def make_handler(cluster):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _serve(self):
+            url = urlparse(self.path)
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+            code, payload = cluster.handle(self.command, url.path, parse_qs(url.query), body)
+            data = payload.encode() if isinstance(payload, str) else json.dumps(payload).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "text/plain" if isinstance(payload, str) else "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            if code == 429:
+                self.send_header("Retry-After", "1")
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _serve
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class FakeKubernetesServer:
+    """Runs a FakeCluster over HTTP on a background thread."""
+
+    def __init__(self, cluster: FakeCluster, host="127.0.0.1", port=0):
+        self.cluster = cluster
+        self.httpd = ThreadingHTTPServer((host, port), make_handler(cluster))
+        self.httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def write_kubeconfig(self, path):
+        kubeconfig = {
+            "apiVersion": "v1",
+            "kind": "Config",
+            "clusters": [{"name": "fake", "cluster": {"server": self.url}}],
+            "users": [{"name": "fake", "user": {"token": "fake"}}],
+            "contexts": [{"name": "fake", "context": {"cluster": "fake", "user": "fake"}}],
+            "current-context": "fake",
+        }
+        # JSON is valid YAML, so no YAML dependency is needed here
+        with open(path, "w") as f:
+            json.dump(kubeconfig, f)
+        return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8443)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--kubeconfig", help="write a kubeconfig pointing at the server to this path")
+    args = parser.parse_args()
+
+    cluster = FakeCluster(args.latency_ms, args.jitter_ms, args.error_rate, args.throttle_rate)
+    server = FakeKubernetesServer(cluster, port=args.port)
+    if args.kubeconfig:
+        server.write_kubeconfig(args.kubeconfig)
+    print(f"Fake Kubernetes API listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Replica scaling load test for the backend API.
+
+Drives concurrent read traffic against a deployed backend and reports request
+throughput and latency. With --deployment, the backend Deployment is scaled
+through each replica count in --replicas so the throughput per replica count can
+be compared directly, e.g.:
+
+    python benchmarks/loadtest.py --url http://localhost:8000 \\
+        --deployment playground-backend -n playground --replicas 1,2,4
+"""
+import argparse
+import asyncio
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+DEFAULT_PATHS = ["/healthz", "/labs", "/labs/foundations-01"]
+
+
+async def worker(client, paths, deadline, latencies, errors):
+    i = 0
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            resp = await client.get(path)
+            if resp.status_code >= 500:
+                errors.append(resp.status_code)
+                continue
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+async def run_load(url, paths, concurrency, duration, headers):
+    latencies, errors = [], []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, headers=headers, limits=limits, timeout=10.0) as client:
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(
+            *(worker(client, paths, deadline, latencies, errors) for _ in range(concurrency))
+        )
+    return latencies, errors
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def scale_deployment(deployment, namespace, replicas):
+    print(f"Scaling {deployment} to {replicas} replica(s)...")
+    subprocess.run(
+        ["kubectl", "scale", f"deployment/{deployment}", f"--replicas={replicas}", "-n", namespace],
+        check=True,
+    )
+    subprocess.run(
+        ["kubectl", "rollout", "status", f"deployment/{deployment}", "-n", namespace, "--timeout=180s"],
+        check=True,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", required=True, help="Backend base URL")
+    parser.add_argument("--paths", default=",".join(DEFAULT_PATHS), help="Comma separated GET paths")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds per measurement")
+    parser.add_argument("--user", default="loadtest-user", help="Value for x-auth-request-user")
+    parser.add_argument("--deployment", help="Backend Deployment to scale between runs")
+    parser.add_argument("-n", "--namespace", default="default")
+    parser.add_argument("--replicas", default="1", help="Comma separated replica counts")
+    args = parser.parse_args()
+
+    paths = [p.strip() for p in args.paths.split(",") if p.strip()]
+    headers = {"x-auth-request-user": args.user}
+    replica_counts = [int(r) for r in args.replicas.split(",")]
+
+    results = []
+    for replicas in replica_counts:
+        if args.deployment:
+            scale_deployment(args.deployment, args.namespace, replicas)
+        latencies, errors = asyncio.run(
+            run_load(args.url, paths, args.concurrency, args.duration, headers)
+        )
+        rps = len(latencies) / args.duration
+        results.append((replicas, rps, latencies, errors))
+        print(
+            f"replicas={replicas} rps={rps:.1f} "
+            f"p50={percentile(latencies, 50) * 1000:.1f}ms p99={percentile(latencies, 99) * 1000:.1f}ms "
+            f"errors={len(errors)}"
+        )
+
+    base_replicas, base_rps = results[0][0], results[0][1]
+    print("\nreplicas      rps  speedup  efficiency  mean_ms")
+    for replicas, rps, latencies, _ in results:
+        speedup = rps / base_rps if base_rps else 0.0
+        efficiency = speedup / (replicas / base_replicas) * 100
+        mean_ms = statistics.fmean(latencies) * 1000 if latencies else 0.0
+        print(f"{replicas:>8} {rps:>8.1f} {speedup:>8.2f} {efficiency:>10.0f}% {mean_ms:>8.1f}")
+
+    if any(errors for _, _, _, errors in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
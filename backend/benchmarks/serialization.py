@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Serialization micro-benchmarks for the hot read endpoints.
+
+Compares how fast the lab catalog (/labs, /labs/{id}) and admin session pages
+(/admin/sessions) turn into response bytes through FastAPI's default path
+(validate, jsonable_encoder, json.dumps), pydantic's own JSON encoder, orjson,
+and the pre-serialized catalog cache, and reports compressed payload sizes:
+
+    cd backend && python benchmarks/serialization.py --sessions 500
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import timeit
+import uuid
+from datetime import datetime, timedelta
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import models  # noqa: E402
+from responses import CatalogCache  # noqa: E402
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def load_catalog():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lab_catalog.json")
+    with open(path) as f:
+        return json.load(f)["labs"]
+
+
+def fake_sessions(count):
+    now = datetime.utcnow()
+    return [
+        {
+            "id": i,
+            "session_uuid": str(uuid.uuid4()),
+            "user_id": f"user{i % 97}@example.com",
+            "lab_id": "foundations-01",
+            "sandbox_namespace": f"sandbox-user{i % 97}-{i:06x}",
+            "start_time": now - timedelta(minutes=i),
+            "last_activity": now,
+            "expires_at": now + timedelta(hours=2),
+            "status": models.SessionStatus.ACTIVE,
+            "resource_quota_used": {"cpu": "250m", "memory": "512Mi", "pods": "3"},
+            "updated_at": now,
+        }
+        for i in range(count)
+    ]
+
+
+def default_path(model_type, data):
+    """What FastAPI does for a response_model endpoint with JSONResponse."""
+    validated = model_type.model_validate(data)
+    return json.dumps(jsonable_encoder(validated)).encode()
+
+
+def bench(name, fn, number):
+    seconds = min(timeit.repeat(fn, number=number, repeat=3))
+    size = len(fn())
+    print(f"  {name:<34} {number / seconds:>10,.0f} ops/s  {size:>9,} bytes")
+
+
+def report_sizes(name, body):
+    sizes = [f"raw {len(body):,}", f"gzip {len(gzip.compress(body, 6)):,}"]
+    if brotli is not None:
+        sizes.append(f"brotli {len(brotli.compress(body, quality=5)):,}")
+    print(f"  {name:<34} " + "  ".join(sizes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=500, help="sessions per admin page")
+    parser.add_argument("--number", type=int, default=200, help="iterations per measurement")
+    args = parser.parse_args()
+
+    labs = load_catalog()
+    lab = labs[0]
+    lab_models = [models.Lab.model_validate(l) for l in labs]
+    cache = CatalogCache()
+    cache.load(labs)
+    page = {"items": fake_sessions(args.sessions), "next_cursor": "abc", "sync_cursor": "def"}
+
+    print(f"/labs/{lab['id']} (single lab)")
+    bench("default (validate+encoder+json)", lambda: default_path(models.Lab, lab), args.number)
+    bench("pydantic model_dump_json", lambda: models.Lab.model_validate(lab).model_dump_json().encode(), args.number)
+    bench("orjson(model_dump)", lambda: orjson.dumps(models.Lab.model_validate(lab).model_dump(mode="json")), args.number)
+    bench("pre-serialized cache", lambda: cache.lab(lab["id"]).body, args.number)
+
+    print(f"/labs ({len(labs)} labs)")
+    bench("default (validate+encoder+json)", lambda: json.dumps(jsonable_encoder([models.Lab.model_validate(l) for l in labs])).encode(), args.number // 10 or 1)
+    bench("orjson(model_dump)", lambda: orjson.dumps([m.model_dump(mode="json") for m in lab_models]), args.number // 10 or 1)
+    bench("pre-serialized cache", lambda: cache.labs().body, args.number)
+
+    print(f"/admin/sessions ({args.sessions} sessions)")
+    bench("default (validate+encoder+json)", lambda: default_path(models.SessionPage, page), args.number // 10 or 1)
+    bench("orjson (no response_model)", lambda: orjson.dumps(page), args.number)
+
+    print("Compressed sizes")
+    report_sizes(f"/labs/{lab['id']}", cache.lab(lab["id"]).body)
+    report_sizes("/labs", cache.labs().body)
+    report_sizes("/admin/sessions", orjson.dumps(page))
+
+
+if __name__ == "__main__":
+    main()
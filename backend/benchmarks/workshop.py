@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""Workshop load test for one backend replica against a fake Kubernetes API.
+
+Starts the fake API server from fake_k8s.py in-process, launches
+`uvicorn main:app` as a subprocess pointed at it (SQLite by default, or
+--database-url for Postgres) with the fake kubectl from fake_bin/ on its
+PATH, and drives a scripted workshop: every user opens the catalog, starts a
+lab, runs commands in a shell, applies a manifest, records progress and ends
+the session while admins poll the dashboard. Reports throughput, p50/p99
+latencies and the replica's memory, and can save or compare a JSON baseline:
+
+    cd backend && python benchmarks/workshop.py --users 50 --save baseline.json
+    cd backend && python benchmarks/workshop.py --users 50 --compare baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from contextlib import asynccontextmanager
+
+import httpx
+import websockets
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+FAKE_BIN = os.path.join(BENCH_DIR, "fake_bin")
+sys.path.insert(0, BENCH_DIR)
+
+from fake_k8s import FakeCluster, FakeKubernetesServer  # noqa: E402
+
+MANIFEST = """apiVersion: v1
+kind: ConfigMap
+metadata:
+  name: benchmark
+data:
+  key: value
+"""
+
+
+class Recorder:
+    """Latency samples and error counts per operation."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = Counter()
+
+    @asynccontextmanager
+    async def measure(self, operation):
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.errors[operation] += 1
+            raise
+        self.samples[operation].append(time.perf_counter() - started)
+
+    def summary(self, wall_seconds):
+        operations = {}
+        for operation in sorted(set(self.samples) | set(self.errors)):
+            samples = sorted(self.samples[operation])
+            operations[operation] = {
+                "count": len(samples),
+                "errors": self.errors[operation],
+                "throughput": round(len(samples) / wall_seconds, 2),
+                "p50_ms": percentile_ms(samples, 50),
+                "p99_ms": percentile_ms(samples, 99),
+                "max_ms": round(samples[-1] * 1000, 1) if samples else None,
+            }
+        return operations
+
+
+def percentile_ms(samples, pct):
+    if not samples:
+        return None
+    index = min(len(samples) - 1, max(0, round(pct / 100 * len(samples)) - 1))
+    return round(samples[index] * 1000, 1)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def rss_mib(pid):
+    """Resident memory of a process from /proc (Linux), or None elsewhere."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+
+
+async def sample_memory(pid, samples, stop):
+    while not stop.is_set():
+        value = rss_mib(pid)
+        if value is not None:
+            samples.append(value)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=0.25)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start_replica(port, kubeconfig, database_url, args):
+    env = {
+        **os.environ,
+        "KUBECONFIG": kubeconfig,
+        "DATABASE_URL": database_url,
+        "PATH": f"{FAKE_BIN}{os.pathsep}{os.environ.get('PATH', '')}",
+        "MAX_CONCURRENT_SESSIONS": str(args.users * 2),
+        "FAKE_KUBECTL_LATENCY_MS": str(args.kubectl_latency_ms),
+    }
+    # Make sure the replica uses the fake cluster and real (header) authentication
+    for name in ("KUBERNETES_SERVICE_HOST", "ENVIRONMENT"):
+        env.pop(name, None)
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+
+
+async def wait_until_ready(client, replica, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if replica.poll() is not None:
+            raise SystemExit(f"Replica exited with code {replica.returncode}")
+        try:
+            response = await client.get("/healthz")
+            if response.status_code == 200 and response.json().get("ready"):
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise SystemExit(f"Replica not ready after {timeout:.0f}s")
+
+
+async def run_shell(ws_url, session_uuid, commands, rec):
+    async with rec.measure("shell_connect"):
+        shell = await websockets.connect(f"{ws_url}/shell/{session_uuid}", open_timeout=10)
+    async with shell:
+        for n in range(commands):
+            # The terminal echoes the command, so wait for the evaluated marker only
+            marker = f"bench-{n + 1000}"
+            async with rec.measure("shell_command"):
+                await shell.send(f"echo bench-$(({n} + 1000))\n")
+                output = ""
+                while marker not in output:
+                    output += await asyncio.wait_for(shell.recv(), timeout=10)
+
+
+async def workshop_user(index, client, ws_url, lab_id, args, rec, start_delay):
+    await asyncio.sleep(start_delay)
+    headers = {"x-auth-request-user": f"bench-user-{index}@example.com"}
+    try:
+        async with rec.measure("catalog"):
+            (await client.get("/labs", headers=headers)).raise_for_status()
+        async with rec.measure("create_session"):
+            response = await client.post("/sessions", json={"lab_id": lab_id}, headers=headers)
+            response.raise_for_status()
+    except Exception as e:
+        print(f"  user {index}: could not start a session: {e}")
+        return
+
+    session_uuid = response.json()["session_uuid"]
+    try:
+        await run_shell(ws_url, session_uuid, args.shell_commands, rec)
+        async with rec.measure("apply_manifest"):
+            response = await client.post(
+                f"/sessions/{session_uuid}/apply-manifest", json={"manifest": MANIFEST}, headers=headers
+            )
+            response.raise_for_status()
+        async with rec.measure("record_progress"):
+            response = await client.post(
+                f"/sessions/{session_uuid}/progress", json={"step_number": 1}, headers=headers
+            )
+            response.raise_for_status()
+    except Exception as e:
+        print(f"  user {index}: scenario failed: {e!r}")
+    finally:
+        try:
+            async with rec.measure("end_session"):
+                (await client.delete(f"/sessions/{session_uuid}", headers=headers)).raise_for_status()
+        except Exception as e:
+            print(f"  user {index}: could not end the session: {e}")
+
+
+async def admin_poller(client, interval, rec, stop):
+    headers = {"x-auth-request-user": "bench-admin@example.com"}
+    while not stop.is_set():
+        for operation, path in (("admin_sessions", "/admin/sessions?limit=50"), ("admin_stats", "/admin/stats")):
+            try:
+                async with rec.measure(operation):
+                    (await client.get(path, headers=headers)).raise_for_status()
+            except Exception:
+                pass
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run(args):
+    cluster = FakeCluster(args.latency_ms, args.jitter_ms, args.error_rate, args.throttle_rate)
+    fake = FakeKubernetesServer(cluster).start()
+    workdir = tempfile.mkdtemp(prefix="workshop-bench-")
+    kubeconfig = fake.write_kubeconfig(os.path.join(workdir, "kubeconfig"))
+    database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    port = free_port()
+    replica = start_replica(port, kubeconfig, database_url, args)
+    base_url = f"http://127.0.0.1:{port}"
+
+    rec = Recorder()
+    memory = []
+    stop_memory, stop_admins = asyncio.Event(), asyncio.Event()
+    limits = httpx.Limits(max_connections=args.users + args.admins + 10)
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+            await wait_until_ready(client, replica)
+            lab_id = args.lab or (await client.get("/labs")).json()[0]["id"]
+            baseline_rss = rss_mib(replica.pid)
+            memory_task = asyncio.create_task(sample_memory(replica.pid, memory, stop_memory))
+
+            print(f"Running workshop: {args.users} users on lab {lab_id}, {args.admins} admin pollers")
+            started = time.perf_counter()
+            admins = [asyncio.create_task(admin_poller(client, args.poll_interval, rec, stop_admins)) for _ in range(args.admins)]
+            await asyncio.gather(*(
+                workshop_user(i, client, f"ws://127.0.0.1:{port}", lab_id, args, rec, args.ramp_seconds * i / args.users)
+                for i in range(args.users)
+            ))
+            wall = time.perf_counter() - started
+            stop_admins.set()
+            await asyncio.gather(*admins)
+            stop_memory.set()
+            await memory_task
+    finally:
+        replica.terminate()
+        try:
+            replica.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            replica.kill()
+        fake.stop()
+
+    return {
+        "config": {
+            "users": args.users,
+            "admins": args.admins,
+            "shell_commands": args.shell_commands,
+            "latency_ms": args.latency_ms,
+            "jitter_ms": args.jitter_ms,
+            "error_rate": args.error_rate,
+            "throttle_rate": args.throttle_rate,
+            "database": "postgresql" if args.database_url else "sqlite",
+        },
+        "wall_seconds": round(wall, 2),
+        "operations": rec.summary(wall),
+        "replica": {
+            "idle_rss_mib": round(baseline_rss, 1) if baseline_rss else None,
+            "peak_rss_mib": round(max(memory), 1) if memory else None,
+        },
+        "fake_k8s": cluster.stats(),
+    }
+
+
+def print_report(result):
+    print(f"\nCompleted in {result['wall_seconds']}s")
+    print(f"  {'operation':<16} {'count':>6} {'errors':>6} {'ops/s':>8} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for operation, stats in result["operations"].items():
+        print(
+            f"  {operation:<16} {stats['count']:>6} {stats['errors']:>6} {stats['throughput']:>8} "
+            f"{stats['p50_ms'] or '-':>9} {stats['p99_ms'] or '-':>9} {stats['max_ms'] or '-':>9}"
+        )
+    replica = result["replica"]
+    print(f"Replica memory: idle {replica['idle_rss_mib']} MiB, peak {replica['peak_rss_mib']} MiB")
+    print(f"Fake API server: {result['fake_k8s']}")
+
+
+def compare(result, baseline, tolerance):
+    """Prints p99 and throughput changes against a baseline; returns True on regression."""
+    regressed = False
+    print(f"\nAgainst baseline (tolerance {tolerance:.0%})")
+    for operation, old in baseline["operations"].items():
+        new = result["operations"].get(operation)
+        if not new or not old.get("p99_ms") or not new.get("p99_ms"):
+            continue
+        change = new["p99_ms"] / old["p99_ms"] - 1
+        worse = change > tolerance or new["errors"] > old["errors"]
+        regressed |= worse
+        print(f"  {operation:<16} p99 {old['p99_ms']:>8} -> {new['p99_ms']:>8} ms ({change:+.0%}){'  REGRESSION' if worse else ''}")
+    old_peak, new_peak = baseline["replica"].get("peak_rss_mib"), result["replica"].get("peak_rss_mib")
+    if old_peak and new_peak:
+        change = new_peak / old_peak - 1
+        worse = change > tolerance
+        regressed |= worse
+        print(f"  {'peak memory':<16} {old_peak:>8} -> {new_peak:>8} MiB ({change:+.0%}){'  REGRESSION' if worse else ''}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--admins", type=int, default=2, help="concurrent admin dashboard pollers")
+    parser.add_argument("--poll-interval", type=float, default=2.0)
+    parser.add_argument("--ramp-seconds", type=float, default=5.0, help="spread user arrivals over this long")
+    parser.add_argument("--shell-commands", type=int, default=5)
+    parser.add_argument("--lab", help="lab id (default: first lab in the catalog)")
+    parser.add_argument("--database-url", help="Postgres URL; defaults to a temporary SQLite file")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="fake API server latency")
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--kubectl-latency-ms", type=float, default=50.0)
+    parser.add_argument("--save", help="write the results as a JSON baseline")
+    parser.add_argument("--compare", help="compare against a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p99/memory regression")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    print_report(result)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Saved baseline to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(result, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
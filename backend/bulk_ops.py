@@ -0,0 +1,589 @@
+import asyncio
+import json
+import logging
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from analytics import AnalyticsRecorder
+from capacity_planner import CapacityPlanner
+from clusters import ClusterRegistry, NoCapacityError
+from events import EventBus
+from k8s_client import BACKGROUND, k8s_priority
+from kubernetes_ops import sandbox_namespace_name
+from models import (
+    BulkJob,
+    BulkJobDB,
+    BulkJobResultDB,
+    BulkSessionFilter,
+    LabDB,
+    SessionStatus,
+    UserSessionDB,
+)
+from snapshots import SnapshotStore
+
+logger = logging.getLogger(__name__)
+
+# Finished jobs are kept around this long so late stream readers can replay them
+JOB_RETENTION = timedelta(hours=1)
+# How often a replica that isn't running a job polls the DB for its new results
+STORED_RESULTS_POLL_SECONDS = 1.0
+
+
+class BulkOperation:
+    """State of one bulk job: a summary plus an append-only result log.
+
+    The replica running the job streams from memory; every result is also
+    written to bulk_jobs/bulk_job_results, so the job can be read from any
+    replica behind the load balancer.
+    """
+
+    def __init__(self, action: str, total: int, db_session_factory=None):
+        self.job = BulkJob(
+            job_id=str(uuid.uuid4())[:8],
+            action=action,
+            total=total,
+            created_at=datetime.utcnow(),
+        )
+        self.results: List[Dict] = []
+        self.db_session_factory = db_session_factory
+        self._changed = asyncio.Condition()
+
+    async def record(self, item: str, ok: bool, detail: Optional[str] = None):
+        result = {"item": item, "ok": ok}
+        if detail:
+            result["detail"] = detail
+        if ok:
+            self.job.completed += 1
+        else:
+            self.job.failed += 1
+        async with self._changed:
+            self.results.append(result)
+            self._changed.notify_all()
+        await asyncio.to_thread(self._store, result)
+
+    async def finish(self):
+        async with self._changed:
+            self.job.done = True
+            self._changed.notify_all()
+        await asyncio.to_thread(self._store, None)
+
+    def save(self):
+        """Inserts the job row; called once before any item runs."""
+        if self.db_session_factory is None:
+            return
+        db: Session = self.db_session_factory()
+        try:
+            db.add(BulkJobDB(**self.job.model_dump()))
+            db.commit()
+        finally:
+            db.close()
+
+    def _store(self, result: Optional[Dict]):
+        """Appends a result (or marks the job done) in the DB; counters are incremented
+        in SQL, since results of concurrent items are written from different threads."""
+        if self.db_session_factory is None:
+            return
+        db: Session = self.db_session_factory()
+        try:
+            if result is None:
+                values = {"done": True}
+            else:
+                db.add(BulkJobResultDB(job_id=self.job.job_id, **result))
+                counter = "completed" if result["ok"] else "failed"
+                values = {counter: getattr(BulkJobDB, counter) + 1}
+            db.execute(update(BulkJobDB).where(BulkJobDB.job_id == self.job.job_id).values(**values))
+            db.commit()
+        except Exception as e:
+            # Only other replicas' view of the job suffers; the job itself goes on
+            logger.warning("Failed to store bulk job %s progress: %s", self.job.job_id, e)
+            db.rollback()
+        finally:
+            db.close()
+
+    async def stream(self):
+        """Yields every per-item result as NDJSON, replaying history first."""
+        sent = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(
+                    lambda: len(self.results) > sent or self.job.done
+                )
+                pending = self.results[sent:]
+                done = self.job.done
+            for result in pending:
+                yield json.dumps(result) + "\n"
+            sent += len(pending)
+            if done:
+                yield json.dumps({"done": True, **self.job.model_dump(mode="json")}) + "\n"
+                return
+
+
+class BulkOperationManager:
+    """Runs admin bulk operations concurrently with bounded parallelism.
+
+    Kubernetes calls are blocking, so each item runs in a worker thread gated by
+    a semaphore; the DB side of terminate and extend is a single bulk statement
+    issued once the per-item Kubernetes work is done. Provisioned sessions get
+    their rows up front instead, like single sessions, so they count against
+    capacity right away and an interrupted build can be resumed.
+    """
+
+    def __init__(
+        self,
+        db_session_factory,
+        clusters: ClusterRegistry,
+        event_bus: EventBus,
+        analytics: AnalyticsRecorder,
+        snapshots: SnapshotStore,
+        max_parallel: int = 10,
+        max_sessions: int = 5,
+        identity: Optional[str] = None,
+        capacity_planner: Optional[CapacityPlanner] = None,
+    ):
+        self.db_session_factory = db_session_factory
+        self.clusters = clusters
+        self.event_bus = event_bus
+        self.analytics = analytics
+        self.snapshots = snapshots
+        self.max_parallel = max_parallel
+        self.max_sessions = max_sessions
+        # Provisioning owner recorded on the rows this replica is building
+        self.identity = identity
+        # Reservations and warm sandboxes of planned events
+        self.capacity_planner = capacity_planner
+        self.jobs: Dict[str, BulkOperation] = {}
+        self._tasks = set()
+
+    def running_tasks(self) -> List[asyncio.Task]:
+        return [task for task in self._tasks if not task.done()]
+
+    def get(self, job_id: str) -> Optional[BulkOperation]:
+        return self.jobs.get(job_id)
+
+    def load_job(self, job_id: str) -> Optional[BulkJob]:
+        """The job's summary, from memory if it runs here, else from the DB."""
+        op = self.jobs.get(job_id)
+        if op is not None:
+            return op.job
+        db: Session = self.db_session_factory()
+        try:
+            row = db.query(BulkJobDB).filter(BulkJobDB.job_id == job_id).first()
+            return BulkJob.model_validate(row, from_attributes=True) if row else None
+        finally:
+            db.close()
+
+    def stream_results(self, job_id: str):
+        """NDJSON result stream of a job run by any replica, or None if it doesn't exist."""
+        op = self.jobs.get(job_id)
+        if op is not None:
+            return op.stream()
+        if self.load_job(job_id) is None:
+            return None
+        return self._stream_stored(job_id)
+
+    async def purge_expired(self):
+        purged = await asyncio.to_thread(self._purge_expired)
+        if purged:
+            logger.info("Purged %s finished bulk job(s)", purged)
+
+    def select_sessions(self, db: Session, session_filter: BulkSessionFilter):
+        """Returns active sessions matching the filter.
+
+        Every criterion that is set applies, so an explicitly empty list
+        matches nothing rather than everything.
+        """
+        query = db.query(UserSessionDB).filter(
+            UserSessionDB.status == SessionStatus.ACTIVE
+        )
+        if session_filter.session_uuids is not None:
+            query = query.filter(
+                UserSessionDB.session_uuid.in_(session_filter.session_uuids)
+            )
+        if session_filter.lab_id is not None:
+            query = query.filter(UserSessionDB.lab_id == session_filter.lab_id)
+        if session_filter.user_ids is not None:
+            query = query.filter(UserSessionDB.user_id.in_(session_filter.user_ids))
+        if session_filter.started_after:
+            query = query.filter(UserSessionDB.start_time >= session_filter.started_after)
+        if session_filter.started_before:
+            query = query.filter(UserSessionDB.start_time <= session_filter.started_before)
+        return query.all()
+
+    # The public operations do their DB work in a worker thread, then run the
+    # per-item work as a background task on the event loop
+
+    async def terminate(self, session_filter: BulkSessionFilter) -> BulkOperation:
+        targets, provisioning = await asyncio.to_thread(self._terminate_targets, session_filter)
+        op = await self._register("terminate", len(targets) + len(provisioning))
+        self._spawn(self._run_terminate(op, targets, provisioning))
+        return op
+
+    async def extend(self, session_filter: BulkSessionFilter, hours: int) -> BulkOperation:
+        new_expiry = await asyncio.to_thread(self._extend, session_filter, hours)
+        for session_uuid, expires_at in new_expiry.items():
+            self.event_bus.publish(
+                "extended", {"session_uuid": session_uuid, "expires_at": expires_at}
+            )
+
+        op = await self._register("extend", len(new_expiry))
+        self._spawn(self._record_all(op, list(new_expiry), f"extended by {hours}h"))
+        return op
+
+    async def provision(self, lab_id: str, user_ids: List[str]) -> BulkOperation:
+        user_ids = list(dict.fromkeys(user_ids))
+        rejected, rows = await asyncio.to_thread(self._admit_provision, lab_id, user_ids)
+        op = await self._register("provision", len(user_ids))
+        self._spawn(self._run_provision(op, lab_id, rejected, rows))
+        return op
+
+    def _terminate_targets(self, session_filter: BulkSessionFilter) -> Tuple[List[tuple], List[str]]:
+        """Returns (sessions to tear down, uuids of matching sessions still being provisioned).
+
+        Deleting a namespace that is still being built would race the build,
+        so those sessions are skipped.
+        """
+        db: Session = self.db_session_factory()
+        try:
+            targets, provisioning = [], []
+            for s in self.select_sessions(db, session_filter):
+                if s.provisioning_step is not None:
+                    provisioning.append(s.session_uuid)
+                else:
+                    targets.append((
+                        s.id, s.session_uuid, s.sandbox_namespace, s.cluster,
+                        s.user_id, s.lab_id, s.start_time,
+                    ))
+            return targets, provisioning
+        finally:
+            db.close()
+
+    def _extend(self, session_filter: BulkSessionFilter, hours: int) -> Dict[str, datetime]:
+        """Extends the matching sessions; returns their new expiry by session uuid."""
+        db: Session = self.db_session_factory()
+        try:
+            sessions = self.select_sessions(db, session_filter)
+            ids = [s.id for s in sessions]
+            new_expiry = {
+                s.session_uuid: s.expires_at + timedelta(hours=hours) for s in sessions
+            }
+            if ids:
+                db.execute(
+                    update(UserSessionDB)
+                    .where(UserSessionDB.id.in_(ids))
+                    .values(expires_at=UserSessionDB.expires_at + timedelta(hours=hours))
+                )
+                db.commit()
+            return new_expiry
+        finally:
+            db.close()
+
+    def _admit_provision(self, lab_id: str, user_ids: List[str]) -> Tuple[Dict[str, str], List[Dict]]:
+        """Admits users like create_session does and inserts their session rows.
+
+        Returns (reason per rejected user, rows of admitted sessions with ids).
+        Seats held for other labs' planned events are off limits, and warm
+        sandboxes of this lab are claimed before new ones are placed.
+        """
+        db: Session = self.db_session_factory()
+        try:
+            busy = {
+                row.user_id
+                for row in db.query(UserSessionDB.user_id).filter(
+                    UserSessionDB.status == SessionStatus.ACTIVE,
+                    UserSessionDB.user_id.in_(user_ids),
+                )
+            }
+            active = (
+                db.query(UserSessionDB)
+                .filter(UserSessionDB.status == SessionStatus.ACTIVE)
+                .count()
+            )
+            # Same admission rule as create_session: other labs' reserved seats are off limits
+            held = self.capacity_planner.held_for_others(db, lab_id) if self.capacity_planner else 0
+            capacity = self.max_sessions - active - held
+
+            lab = db.query(LabDB).filter(LabDB.id == lab_id).first()
+            rejected: Dict[str, str] = {}
+            rows: List[Dict] = []
+            # Place the whole batch up front so it is spread across clusters
+            planned = Counter()
+            clusters_full = False
+            for user_id in user_ids:
+                if user_id in busy:
+                    rejected[user_id] = "User already has an active session"
+                    continue
+                if len(rows) >= capacity:
+                    rejected[user_id] = "Maximum concurrent playground sessions reached"
+                    continue
+                session_uuid = str(uuid.uuid4())[:8]
+                warm = (
+                    self.capacity_planner.claim(db, lab_id, user_id, session_uuid)
+                    if self.capacity_planner
+                    else None
+                )
+                if warm:
+                    cluster = self.clusters.get(warm.cluster).name
+                    namespace = warm.sandbox_namespace
+                    first_step = "assign"
+                else:
+                    if clusters_full:
+                        rejected[user_id] = "No cluster has capacity for this lab"
+                        continue
+                    try:
+                        cluster = self.clusters.place(db, lab, user_id, planned).name
+                    except NoCapacityError:
+                        clusters_full = True
+                        rejected[user_id] = "No cluster has capacity for this lab"
+                        continue
+                    planned[cluster] += 1
+                    namespace = sandbox_namespace_name(user_id, session_uuid)
+                    first_step = "namespace"
+                rows.append(
+                    {
+                        "session_uuid": session_uuid,
+                        "user_id": user_id,
+                        "lab_id": lab_id,
+                        "sandbox_namespace": namespace,
+                        "cluster": cluster,
+                        "expires_at": datetime.utcnow() + timedelta(hours=8),
+                        "status": SessionStatus.ACTIVE,
+                        "provisioning_step": first_step,
+                        "provisioning_owner": self.identity,
+                    }
+                )
+            # Claimed warm sandboxes are committed together with the rows that own them
+            self._insert_sessions(db, rows)
+            return rejected, rows
+        finally:
+            db.close()
+
+    async def _run_terminate(self, op: BulkOperation, targets, provisioning: List[str]):
+        semaphore = asyncio.Semaphore(self.max_parallel)
+        terminated: Dict[int, tuple] = {}
+
+        async def terminate_one(session_id, session_uuid, namespace, cluster, user_id, lab_id, start_time):
+            async with semaphore:
+                try:
+                    # Teardown storms must not starve learners' own API calls
+                    with k8s_priority(BACKGROUND):
+                        ops = self.clusters.ops(cluster)
+                        await self.snapshots.save(ops, namespace, user_id, lab_id, session_uuid)
+                        await asyncio.to_thread(ops.delete_sandbox_namespace, namespace)
+                except Exception as e:
+                    logger.error("Bulk terminate failed for %s: %s", session_uuid, e)
+                    await op.record(session_uuid, False, str(e))
+                    return
+                terminated[session_id] = (session_uuid, lab_id, start_time)
+                await op.record(session_uuid, True, "namespace deleted")
+
+        try:
+            for session_uuid in provisioning:
+                await op.record(session_uuid, False, "Session is still being provisioned")
+            await asyncio.gather(*(terminate_one(*t) for t in targets))
+            if terminated:
+                # Sessions ended meanwhile by a DELETE or expiry were counted there
+                ended = await asyncio.to_thread(self._mark_terminated, list(terminated))
+                for session_id in ended:
+                    session_uuid, lab_id, start_time = terminated[session_id]
+                    self.event_bus.publish(
+                        "terminated", {"session_uuid": session_uuid, "status": "terminated"}
+                    )
+                    await asyncio.to_thread(self.analytics.record_ended, lab_id, start_time)
+        finally:
+            await op.finish()
+
+    def _mark_terminated(self, session_ids: List[int]) -> List[int]:
+        """Terminates the sessions still active; returns the ids this call changed."""
+        db: Session = self.db_session_factory()
+        try:
+            ended = db.execute(
+                update(UserSessionDB)
+                .where(UserSessionDB.id.in_(session_ids), UserSessionDB.status == SessionStatus.ACTIVE)
+                .values(status=SessionStatus.TERMINATED)
+                .returning(UserSessionDB.id)
+            ).scalars().all()
+            db.commit()
+            return ended
+        finally:
+            db.close()
+
+    async def _run_provision(self, op, lab_id, rejected: Dict[str, str], rows: List[Dict]):
+        semaphore = asyncio.Semaphore(self.max_parallel)
+        provisioned: List[Dict] = []
+
+        async def provision_one(row):
+            async with semaphore:
+                user_id = row["user_id"]
+
+                def on_step(step: str):
+                    self._set_provisioning_step(row["id"], step)
+
+                try:
+                    await asyncio.to_thread(
+                        self.clusters.ops(row["cluster"]).provision_sandbox,
+                        row["sandbox_namespace"],
+                        user_id,
+                        on_step=on_step,
+                        # A claimed warm sandbox only needs handing over
+                        start_at="assign" if row["provisioning_step"] == "assign" else None,
+                    )
+                except Exception as e:
+                    logger.error("Bulk provisioning failed for %s: %s", user_id, e)
+                    if await asyncio.to_thread(self._finish_provisioning, row["id"], SessionStatus.ERROR):
+                        self.event_bus.publish("failed", {**self._payload(row), "status": "error"})
+                    await op.record(user_id, False, "Failed to provision sandbox")
+                    return
+                if not await asyncio.to_thread(self._finish_provisioning, row["id"], SessionStatus.ACTIVE):
+                    await op.record(user_id, False, "Session was ended while provisioning")
+                    return
+                provisioned.append(row)
+                self.event_bus.publish("created", self._payload(row))
+                await op.record(user_id, True, row["session_uuid"])
+
+        try:
+            for user_id, reason in rejected.items():
+                await op.record(user_id, False, reason)
+            for row in rows:
+                self.event_bus.publish(
+                    "provisioning", {**self._payload(row), "status": "provisioning"}
+                )
+
+            await asyncio.gather(*(provision_one(row) for row in rows))
+            if provisioned:
+                await asyncio.to_thread(
+                    self.analytics.record_started, lab_id, len(provisioned)
+                )
+        finally:
+            await op.finish()
+
+    @staticmethod
+    def _insert_sessions(db: Session, rows: List[Dict]):
+        """Inserts the session rows before their sandboxes exist; sets each row's id."""
+        now = datetime.utcnow()
+        for row in rows:
+            row.setdefault("start_time", now)
+            row.setdefault("last_activity", now)
+        if rows:
+            db.bulk_insert_mappings(UserSessionDB, rows, return_defaults=True)
+        db.commit()
+
+    def _set_provisioning_step(self, session_id: int, step: str):
+        db: Session = self.db_session_factory()
+        try:
+            db.execute(
+                update(UserSessionDB)
+                .where(UserSessionDB.id == session_id)
+                .values(provisioning_step=step, provisioning_owner=self.identity)
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def _finish_provisioning(self, session_id: int, status: SessionStatus) -> bool:
+        """Marks a build done; False if the session was ended while it was building."""
+        db: Session = self.db_session_factory()
+        try:
+            finished = db.execute(
+                update(UserSessionDB)
+                .where(UserSessionDB.id == session_id, UserSessionDB.status == SessionStatus.ACTIVE)
+                .values(status=status, provisioning_step=None, provisioning_owner=None)
+            ).rowcount
+            db.commit()
+            return finished == 1
+        finally:
+            db.close()
+
+    @staticmethod
+    def _payload(row: Dict) -> Dict:
+        hidden = ("id", "last_activity", "provisioning_step", "provisioning_owner")
+        return {k: v for k, v in row.items() if k not in hidden}
+
+    async def _stream_stored(self, job_id: str):
+        """Replays and follows a job running on another replica by polling its rows."""
+        # Concurrent items commit out of id order, so track what was sent rather than
+        # a high-water mark
+        sent = set()
+        while True:
+            job, rows = await asyncio.to_thread(self._stored_results, job_id)
+            for row in rows:
+                if row.id in sent:
+                    continue
+                sent.add(row.id)
+                result = {"item": row.item, "ok": row.ok}
+                if row.detail:
+                    result["detail"] = row.detail
+                yield json.dumps(result) + "\n"
+            if job is None or job.done:
+                if job is not None:
+                    yield json.dumps({"done": True, **job.model_dump(mode="json")}) + "\n"
+                return
+            await asyncio.sleep(STORED_RESULTS_POLL_SECONDS)
+
+    def _stored_results(self, job_id: str):
+        db: Session = self.db_session_factory()
+        try:
+            # Read the summary first: if it says done, the results read next are complete
+            row = db.query(BulkJobDB).filter(BulkJobDB.job_id == job_id).first()
+            job = BulkJob.model_validate(row, from_attributes=True) if row else None
+            results = (
+                db.query(BulkJobResultDB)
+                .filter(BulkJobResultDB.job_id == job_id)
+                .order_by(BulkJobResultDB.id)
+                .all()
+            )
+            return job, results
+        finally:
+            db.close()
+
+    def _purge_expired(self) -> int:
+        cutoff = datetime.utcnow() - JOB_RETENTION
+        db: Session = self.db_session_factory()
+        try:
+            expired = db.query(BulkJobDB.job_id).filter(
+                BulkJobDB.done.is_(True), BulkJobDB.created_at < cutoff
+            )
+            job_ids = [row.job_id for row in expired]
+            if job_ids:
+                db.query(BulkJobResultDB).filter(BulkJobResultDB.job_id.in_(job_ids)).delete(
+                    synchronize_session=False
+                )
+                db.query(BulkJobDB).filter(BulkJobDB.job_id.in_(job_ids)).delete(
+                    synchronize_session=False
+                )
+                db.commit()
+            return len(job_ids)
+        finally:
+            db.close()
+
+    async def _record_all(self, op: BulkOperation, items: List[str], detail: str):
+        try:
+            for item in items:
+                await op.record(item, True, detail)
+        finally:
+            await op.finish()
+
+    async def _register(self, action: str, total: int) -> BulkOperation:
+        self._prune()
+        op = BulkOperation(action, total, self.db_session_factory)
+        await asyncio.to_thread(op.save)
+        self.jobs[op.job.job_id] = op
+        logger.info("Started bulk %s job %s for %s item(s)", action, op.job.job_id, total)
+        return op
+
+    def _spawn(self, coro):
+        # Keep a reference so the task isn't garbage collected mid-flight
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _prune(self):
+        cutoff = datetime.utcnow() - JOB_RETENTION
+        for job_id in [
+            j for j, op in self.jobs.items() if op.job.done and op.job.created_at < cutoff
+        ]:
+            del self.jobs[job_id]
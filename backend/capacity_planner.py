@@ -0,0 +1,438 @@
+import asyncio
+import logging
+import math
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from statistics import median
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+
+from clusters import ClusterRegistry, NoCapacityError
+from k8s_client import BACKGROUND, k8s_priority
+from kubernetes_ops import UNASSIGNED, sandbox_namespace_name
+from models import (
+    ArrivalPoint,
+    DemandSuggestion,
+    LabDB,
+    PlannedEvent,
+    PlannedEventCreate,
+    PlannedEventDB,
+    SessionArchiveDB,
+    UserSessionDB,
+    WarmSandboxDB,
+)
+
+logger = logging.getLogger(__name__)
+
+# Past events a suggestion learns from
+HISTORY_EVENTS = 20
+# Sandboxes are pre-provisioned for attendees arriving up to this long after the
+# start; later arrivals are provisioned on demand
+PREWARM_COVERS_MINUTES = 10
+CURVE_STEP_MINUTES = 5
+# Weeks of history behind a lab's usual demand at the same hour of the week
+BASELINE_WEEKS = 4
+# A warm sandbox still provisioning after this was left behind by a dead leader
+STALE_PROVISIONING = timedelta(minutes=10)
+# Warm sandbox states that still have a namespace to release
+RELEASABLE = ("provisioning", "ready", "failed")
+
+
+class OverbookedError(Exception):
+    """The reservation does not fit next to the seats already reserved for that time."""
+
+
+def naive_utc(at: datetime) -> datetime:
+    # Timestamps are stored as naive UTC (datetime.utcnow) throughout
+    if at.tzinfo is not None:
+        at = at.astimezone(timezone.utc).replace(tzinfo=None)
+    return at
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+class CapacityPlanner:
+    """Turns planned workshops into reserved seats and pre-provisioned sandboxes.
+
+    An event holds `reserved_seats` of MAX_CONCURRENT_SESSIONS for its lab from
+    `lead` before its start until `hold_minutes` after it, less the sessions of
+    the lab started since. Once that window opens, the leader builds `prewarm`
+    unassigned sandboxes, `max_parallel` at a time at background priority, and
+    POST /sessions for the lab claims one instead of building from scratch.
+    Whatever is unclaimed when the hold ends (or the event is cancelled) is
+    torn down. Suggested sizes come from how many attendees showed up at past
+    events, when they arrived, and the lab's usual demand at that hour.
+    """
+
+    def __init__(
+        self,
+        db_session_factory,
+        clusters: ClusterRegistry,
+        max_sessions: int,
+        lead: timedelta = timedelta(minutes=30),
+        max_parallel: int = 5,
+    ):
+        self.db_session_factory = db_session_factory
+        self.clusters = clusters
+        self.max_sessions = max_sessions
+        self.lead = lead
+        self.max_parallel = max_parallel
+
+    # --- Events ---
+
+    @staticmethod
+    def window(event: PlannedEventDB) -> Tuple[datetime, datetime]:
+        """When the event's seats are held: [opens, closes)."""
+        return (
+            event.starts_at - timedelta(minutes=event.lead_minutes),
+            event.starts_at + timedelta(minutes=event.hold_minutes),
+        )
+
+    def state(self, event: PlannedEventDB, now: datetime) -> str:
+        if event.cancelled:
+            return "cancelled"
+        if event.closed_at:
+            return "closed"
+        opens, closes = self.window(event)
+        if now < opens:
+            return "scheduled"
+        return "open" if now < closes else "closing"
+
+    @staticmethod
+    def pending_events(db: Session) -> List[PlannedEventDB]:
+        """Events whose warm sandboxes have not all been released yet."""
+        return db.query(PlannedEventDB).filter(PlannedEventDB.closed_at.is_(None)).all()
+
+    def sessions_started(self, db: Session, event: PlannedEventDB) -> int:
+        opens, closes = self.window(event)
+        return (
+            db.query(func.count(UserSessionDB.id))
+            .filter(
+                UserSessionDB.lab_id == event.lab_id,
+                UserSessionDB.start_time >= opens,
+                UserSessionDB.start_time < closes,
+            )
+            .scalar()
+        )
+
+    def create(self, db: Session, req: PlannedEventCreate) -> PlannedEventDB:
+        starts_at = naive_utc(req.starts_at)
+        reserved, prewarm = req.reserved_seats, req.prewarm
+        if reserved is None or prewarm is None:
+            suggestion = self.suggest(db, req.lab_id, req.expected_attendees, starts_at)
+            reserved = suggestion.reserved_seats if reserved is None else reserved
+            prewarm = suggestion.prewarm if prewarm is None else prewarm
+        event = PlannedEventDB(
+            name=req.name,
+            lab_id=req.lab_id,
+            expected_attendees=req.expected_attendees,
+            reserved_seats=reserved,
+            prewarm=min(prewarm, reserved),
+            starts_at=starts_at,
+            lead_minutes=int(self.lead.total_seconds() // 60),
+            hold_minutes=req.hold_minutes,
+            cancelled=False,
+        )
+
+        opens, closes = self.window(event)
+        overlapping = 0
+        for other in self.pending_events(db):
+            other_opens, other_closes = self.window(other)
+            if not other.cancelled and other_opens < closes and opens < other_closes:
+                overlapping += other.reserved_seats
+        if overlapping + reserved > self.max_sessions:
+            raise OverbookedError(
+                f"{reserved} seat(s) requested, but only {max(0, self.max_sessions - overlapping)} "
+                f"of {self.max_sessions} are not reserved by overlapping events"
+            )
+
+        db.add(event)
+        db.commit()
+        db.refresh(event)
+        logger.info(
+            "Planned event %s '%s' for lab %s at %s: %s seat(s), %s warm sandbox(es)",
+            event.id, event.name, event.lab_id, event.starts_at, event.reserved_seats, event.prewarm,
+        )
+        return event
+
+    def cancel(self, db: Session, event: PlannedEventDB):
+        """Frees the seats now; warm sandboxes are released by the next reconcile."""
+        event.cancelled = True
+        db.commit()
+        logger.info("Cancelled planned event %s '%s'", event.id, event.name)
+
+    def describe(self, db: Session, events: List[PlannedEventDB]) -> List[PlannedEvent]:
+        now = datetime.utcnow()
+        warm: Dict[int, Dict[str, int]] = {}
+        if events:
+            rows = (
+                db.query(WarmSandboxDB.event_id, WarmSandboxDB.status, func.count(WarmSandboxDB.id))
+                .filter(WarmSandboxDB.event_id.in_([e.id for e in events]))
+                .group_by(WarmSandboxDB.event_id, WarmSandboxDB.status)
+            )
+            for event_id, status, count in rows:
+                warm.setdefault(event_id, {})[status] = count
+        result = []
+        for event in events:
+            view = PlannedEvent.model_validate(event)
+            view.state = self.state(event, now)
+            if view.state != "scheduled":
+                view.sessions_started = self.sessions_started(db, event)
+            view.warm_sandboxes = warm.get(event.id, {})
+            result.append(view)
+        return result
+
+    # --- Admission ---
+
+    def reserved(self, db: Session, now: Optional[datetime] = None) -> Dict[str, int]:
+        """Seats still held per lab by events whose window is open."""
+        now = now or datetime.utcnow()
+        held: Dict[str, int] = {}
+        for event in self.pending_events(db):
+            opens, closes = self.window(event)
+            if event.cancelled or not opens <= now < closes:
+                continue
+            outstanding = event.reserved_seats - self.sessions_started(db, event)
+            if outstanding > 0:
+                held[event.lab_id] = held.get(event.lab_id, 0) + outstanding
+        return held
+
+    def held_for_others(self, db: Session, lab_id: str, now: Optional[datetime] = None) -> int:
+        """Seats a session of `lab_id` may not take; its own lab's reservation is open to it."""
+        return sum(seats for lab, seats in self.reserved(db, now).items() if lab != lab_id)
+
+    def claim(self, db: Session, lab_id: str, user_id: str, session_uuid: str) -> Optional[WarmSandboxDB]:
+        """Takes a ready warm sandbox of the lab for the user.
+
+        Not committed here: the claim is committed together with the caller's
+        session row, so a crash in between can't leave a sandbox claimed by
+        no session. SKIP LOCKED lets concurrent claims take different rows.
+        """
+        warm = (
+            db.query(WarmSandboxDB)
+            .filter(WarmSandboxDB.lab_id == lab_id, WarmSandboxDB.status == "ready")
+            .order_by(WarmSandboxDB.id)
+            .with_for_update(skip_locked=True)
+            .first()
+        )
+        if warm is None:
+            return None
+        warm.status = "claimed"
+        warm.claimed_by = user_id
+        warm.claimed_at = datetime.utcnow()
+        warm.session_uuid = session_uuid
+        return warm
+
+    # --- Pre-provisioning ---
+
+    async def reconcile(self):
+        """Builds warm sandboxes for events about to start and releases those no longer needed."""
+        builds, releases = await asyncio.to_thread(self._plan)
+        if not builds and not releases:
+            return
+        logger.info(
+            "Capacity planner: building %s, releasing %s warm sandbox(es)", len(builds), len(releases)
+        )
+        semaphore = asyncio.Semaphore(self.max_parallel)
+        await asyncio.gather(
+            *(self._build(semaphore, *b) for b in builds),
+            *(self._release(semaphore, *r) for r in releases),
+        )
+
+    def _plan(self) -> Tuple[List[Tuple], List[Tuple]]:
+        now = datetime.utcnow()
+        builds: List[Tuple[int, str, str]] = []
+        releases: List[Tuple[int, str, Optional[str], bool]] = []
+        db: Session = self.db_session_factory()
+        try:
+            for event in self.pending_events(db):
+                opens, closes = self.window(event)
+                if now < opens:
+                    continue
+                warm = db.query(WarmSandboxDB).filter(WarmSandboxDB.event_id == event.id).all()
+
+                if event.cancelled or now >= closes:
+                    leftover = [w for w in warm if w.status in RELEASABLE]
+                    if not leftover:
+                        event.closed_at = now
+                        db.commit()
+                        logger.info("Planned event %s '%s' closed", event.id, event.name)
+                    # Failed builds already removed their namespace
+                    releases += [
+                        (w.id, w.sandbox_namespace, w.cluster, w.status != "failed") for w in leftover
+                    ]
+                    continue
+
+                stale = [
+                    w for w in warm
+                    if w.status == "provisioning" and w.created_at < now - STALE_PROVISIONING
+                ]
+                releases += [(w.id, w.sandbox_namespace, w.cluster, True) for w in stale]
+                if now >= event.starts_at + timedelta(minutes=PREWARM_COVERS_MINUTES):
+                    continue
+                built = sum(1 for w in warm if w.status in ("provisioning", "ready", "claimed")) - len(stale)
+                failed = sum(1 for w in warm if w.status == "failed")
+                if failed >= event.prewarm:
+                    continue  # Something is systematically wrong; on-demand provisioning still works
+                builds += self._add_warm(db, event, event.prewarm - built)
+        finally:
+            db.close()
+        return builds, releases
+
+    def _add_warm(self, db: Session, event: PlannedEventDB, missing: int) -> List[Tuple[int, str, str]]:
+        if missing <= 0:
+            return []
+        # Place the whole batch first (as bulk provisioning does) so it spreads across clusters
+        lab = db.query(LabDB).filter(LabDB.id == event.lab_id).first()
+        planned = Counter()
+        for _ in range(missing):
+            try:
+                cluster = self.clusters.place(db, lab, UNASSIGNED, planned)
+            except NoCapacityError:
+                logger.warning("No capacity to pre-provision more sandboxes for planned event %s", event.id)
+                break
+            planned[cluster.name] += 1
+        rows = [
+            WarmSandboxDB(
+                event_id=event.id,
+                lab_id=event.lab_id,
+                cluster=cluster_name,
+                sandbox_namespace=sandbox_namespace_name("warm", str(uuid.uuid4())[:8]),
+                status="provisioning",
+            )
+            for cluster_name in planned.elements()
+        ]
+        db.add_all(rows)
+        db.flush()
+        builds = [(w.id, w.sandbox_namespace, w.cluster) for w in rows]
+        db.commit()
+        return builds
+
+    async def _build(self, semaphore: asyncio.Semaphore, warm_id: int, namespace: str, cluster: str):
+        async with semaphore:
+            ops = self.clusters.ops(cluster)
+            try:
+                # Warming a workshop must not starve learners already at work
+                with k8s_priority(BACKGROUND):
+                    await asyncio.to_thread(ops.provision_sandbox, namespace, None)
+            except Exception as e:
+                logger.error("Pre-provisioning %s failed: %s", namespace, e)
+                await asyncio.to_thread(self._transition, warm_id, ("provisioning",), "failed")
+                return
+            if not await asyncio.to_thread(self._transition, warm_id, ("provisioning",), "ready"):
+                # Released (event cancelled or leader changed) while it was being built
+                with k8s_priority(BACKGROUND):
+                    await asyncio.to_thread(ops.delete_sandbox_namespace, namespace)
+
+    async def _release(
+        self, semaphore: asyncio.Semaphore, warm_id: int, namespace: str, cluster: Optional[str], delete: bool
+    ):
+        # Marked first, so a claim racing with the release either wins or sees nothing
+        if not await asyncio.to_thread(self._transition, warm_id, RELEASABLE, "released"):
+            return
+        if not delete:
+            return
+        async with semaphore:
+            try:
+                with k8s_priority(BACKGROUND):
+                    await asyncio.to_thread(self.clusters.ops(cluster).delete_sandbox_namespace, namespace)
+            except Exception as e:
+                logger.error("Releasing warm sandbox %s failed: %s", namespace, e)
+
+    def _transition(self, warm_id: int, from_states: Tuple[str, ...], to_state: str) -> bool:
+        db: Session = self.db_session_factory()
+        try:
+            changed = db.execute(
+                update(WarmSandboxDB)
+                .where(WarmSandboxDB.id == warm_id, WarmSandboxDB.status.in_(from_states))
+                .values(status=to_state)
+            ).rowcount
+            db.commit()
+            return bool(changed)
+        finally:
+            db.close()
+
+    # --- Demand ---
+
+    def suggest(
+        self, db: Session, lab_id: str, expected_attendees: int, starts_at: datetime
+    ) -> DemandSuggestion:
+        """Reservation and pre-provisioning sizes learned from past events.
+
+        The show-up ratio is the p90 of sessions started per expected attendee
+        over recent closed events of the lab (of any lab if it has none); the
+        arrival curve says how many of those came early enough to be served
+        by pre-provisioned sandboxes. The lab's usual demand at that hour of
+        the week is added on top, since those learners take seats too.
+        """
+        starts_at = naive_utc(starts_at)
+        past = self._past_events(db, lab_id) or self._past_events(db, None)
+        ratios: List[float] = []
+        offsets: List[float] = []
+        for event in past:
+            opens, closes = self.window(event)
+            started = self._start_times(db, event.lab_id, opens, closes)
+            ratios.append(len(started) / event.expected_attendees)
+            offsets += [(t - event.starts_at).total_seconds() / 60 for t in started]
+
+        show_up = percentile(ratios, 90) if ratios else 1.0
+        early = (
+            sum(1 for m in offsets if m <= PREWARM_COVERS_MINUTES) / len(offsets) if offsets else 1.0
+        )
+        baseline = self._baseline(db, lab_id, starts_at)
+        reserved = math.ceil(expected_attendees * show_up) + baseline
+
+        curve = []
+        if offsets:
+            lead = int(self.lead.total_seconds() // 60)
+            for minute in range(-lead, 61, CURVE_STEP_MINUTES):
+                arrived = sum(1 for m in offsets if m <= minute) / len(offsets)
+                curve.append(ArrivalPoint(minute=minute, arrived=round(arrived, 3)))
+
+        return DemandSuggestion(
+            lab_id=lab_id,
+            expected_attendees=expected_attendees,
+            reserved_seats=reserved,
+            prewarm=math.ceil(reserved * early),
+            show_up_ratio=round(show_up, 3),
+            early_ratio=round(early, 3),
+            baseline_sessions=baseline,
+            events_analysed=len(past),
+            arrival_curve=curve,
+        )
+
+    @staticmethod
+    def _past_events(db: Session, lab_id: Optional[str]) -> List[PlannedEventDB]:
+        query = db.query(PlannedEventDB).filter(
+            PlannedEventDB.cancelled.is_(False), PlannedEventDB.closed_at.isnot(None)
+        )
+        if lab_id:
+            query = query.filter(PlannedEventDB.lab_id == lab_id)
+        return query.order_by(PlannedEventDB.starts_at.desc()).limit(HISTORY_EVENTS).all()
+
+    @staticmethod
+    def _start_times(db: Session, lab_id: str, since: datetime, until: datetime) -> List[datetime]:
+        # Older sessions have been moved to the archive
+        times = []
+        for table in (UserSessionDB, SessionArchiveDB):
+            times += [
+                t
+                for (t,) in db.query(table.start_time).filter(
+                    table.lab_id == lab_id, table.start_time >= since, table.start_time < until
+                )
+            ]
+        return times
+
+    def _baseline(self, db: Session, lab_id: str, starts_at: datetime) -> int:
+        # Median rather than max, so one earlier workshop in that slot doesn't count as usual demand
+        counts = []
+        for week in range(1, BASELINE_WEEKS + 1):
+            since = starts_at - timedelta(weeks=week)
+            counts.append(len(self._start_times(db, lab_id, since, since + timedelta(hours=1))))
+        return math.ceil(median(counts))
@@ -0,0 +1,268 @@
+import asyncio
+import itertools
+import logging
+import os
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import yaml
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from k8s_client import BACKGROUND, k8s_priority
+from kubernetes_ops import KubernetesOps
+from models import LabDB, SessionStatus, UserSessionDB, WarmSandboxDB
+
+logger = logging.getLogger(__name__)
+
+# Placement prefers the cluster of the user's previous session by this much free capacity
+AFFINITY_BONUS = 0.1
+
+
+def parse_cpu(value) -> int:
+    """CPU quantity ("1", "500m") in millicores."""
+    value = str(value or "0")
+    if value.endswith("m"):
+        return int(float(value[:-1]))
+    return int(float(value) * 1000)
+
+
+MEMORY_UNITS = {
+    "Ki": 2**10, "Mi": 2**20, "Gi": 2**30, "Ti": 2**40,
+    "K": 10**3, "M": 10**6, "G": 10**9, "T": 10**12,
+}
+
+
+def parse_memory(value) -> int:
+    """Memory quantity ("2Gi", "512Mi") in bytes."""
+    value = str(value or "0")
+    for suffix in sorted(MEMORY_UNITS, key=len, reverse=True):
+        if value.endswith(suffix):
+            return int(float(value[: -len(suffix)]) * MEMORY_UNITS[suffix])
+    return int(float(value))
+
+
+class NoCapacityError(Exception):
+    """No registered cluster can fit another sandbox for the lab."""
+
+
+class Cluster:
+    def __init__(
+        self,
+        name: str,
+        ops: KubernetesOps,
+        labels: Optional[Dict[str, str]] = None,
+        max_sessions: Optional[int] = None,
+        cordoned: bool = False,
+    ):
+        self.name = name
+        self.ops = ops
+        self.labels = labels or {}
+        self.max_sessions = max_sessions
+        self.cordoned = cordoned  # Keeps its sessions but takes no new ones
+        self.capacity: Optional[Dict] = None
+        self.healthy = True
+        self.last_error: Optional[str] = None
+        self.refreshed_at: Optional[float] = None
+
+    @property
+    def schedulable(self) -> bool:
+        return self.healthy and not self.cordoned and self.ops.circuit_state != "open"
+
+
+class ClusterRegistry:
+    """The clusters sandboxes can be placed on, and where each session lives.
+
+    Clusters come from a YAML/JSON file (CLUSTERS_FILE); without one the
+    registry holds a single cluster using the in-cluster config. Each cluster
+    has its own KubernetesOps, so rate limits and circuit breakers are per
+    cluster. Allocatable capacity is refreshed in the background; what is
+    committed comes from the active sessions in the database, so placement
+    never calls the API servers.
+    """
+
+    def __init__(self, clusters: List[Cluster], headroom: float = 0.8, refresh_interval: float = 60.0):
+        if not clusters:
+            raise ValueError("At least one cluster is required")
+        self.clusters: Dict[str, Cluster] = {c.name: c for c in clusters}
+        self.default = clusters[0]
+        self.headroom = headroom
+        self.refresh_interval = refresh_interval
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls) -> "ClusterRegistry":
+        headroom = float(os.getenv("CLUSTER_CAPACITY_HEADROOM", "0.8"))
+        path = os.getenv("CLUSTERS_FILE")
+        if not path:
+            return cls([Cluster(os.getenv("CLUSTER_NAME", "default"), KubernetesOps())], headroom)
+        with open(path) as f:
+            entries = yaml.safe_load(f)["clusters"]
+        clusters = [
+            Cluster(
+                entry["name"],
+                KubernetesOps(kubeconfig=entry.get("kubeconfig"), context=entry.get("context")),
+                labels={k: str(v) for k, v in (entry.get("labels") or {}).items()},
+                max_sessions=entry.get("max_sessions"),
+                cordoned=entry.get("cordoned", False),
+            )
+            for entry in entries
+        ]
+        logger.info(
+            "Loaded %s cluster(s) from %s: %s", len(clusters), path, ", ".join(c.name for c in clusters)
+        )
+        return cls(clusters, headroom)
+
+    def __iter__(self):
+        return iter(self.clusters.values())
+
+    def get(self, name: Optional[str]) -> Cluster:
+        # Sessions from before multi-cluster support have no cluster recorded
+        if name is None:
+            return self.default
+        cluster = self.clusters.get(name)
+        if cluster is None:
+            raise KeyError(f"Unknown cluster '{name}'")
+        return cluster
+
+    def ops(self, name: Optional[str]) -> KubernetesOps:
+        return self.get(name).ops
+
+    # --- Capacity ---
+
+    def start(self):
+        self._task = asyncio.create_task(self._loop())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _loop(self):
+        while True:
+            await asyncio.gather(*(self._refresh(c) for c in self))
+            await asyncio.sleep(self.refresh_interval)
+
+    async def _refresh(self, cluster: Cluster):
+        try:
+            with k8s_priority(BACKGROUND):
+                cluster.capacity = await asyncio.to_thread(cluster.ops.allocatable_capacity)
+            if not cluster.healthy:
+                logger.info("Cluster %s is reachable again", cluster.name)
+            cluster.healthy, cluster.last_error = True, None
+        except Exception as e:
+            if cluster.healthy:
+                logger.warning("Cluster %s capacity refresh failed: %s", cluster.name, e)
+            cluster.healthy, cluster.last_error = False, str(e)
+        cluster.refreshed_at = time.monotonic()
+
+    def committed(self, db: Session) -> Dict[str, Tuple[int, int, int]]:
+        """Active sessions (and warm sandboxes not yet claimed), CPU and memory requested per cluster."""
+        requirements = {
+            lab.id: self.requirements(lab)
+            for lab in db.query(LabDB.id, LabDB.sandbox_requirements)
+        }
+        totals: Dict[str, Tuple[int, int, int]] = {}
+        rows = (
+            db.query(UserSessionDB.cluster, UserSessionDB.lab_id, func.count(UserSessionDB.id))
+            .filter(UserSessionDB.status == SessionStatus.ACTIVE)
+            .group_by(UserSessionDB.cluster, UserSessionDB.lab_id)
+        )
+        # Pre-provisioned sandboxes hold their capacity until claimed or released
+        warm = (
+            db.query(WarmSandboxDB.cluster, WarmSandboxDB.lab_id, func.count(WarmSandboxDB.id))
+            .filter(WarmSandboxDB.status.in_(("provisioning", "ready")))
+            .group_by(WarmSandboxDB.cluster, WarmSandboxDB.lab_id)
+        )
+        for cluster, lab_id, count in itertools.chain(rows, warm):
+            name = cluster or self.default.name
+            cpu, memory = requirements.get(lab_id, (0, 0))
+            sessions, total_cpu, total_memory = totals.get(name, (0, 0, 0))
+            totals[name] = (sessions + count, total_cpu + cpu * count, total_memory + memory * count)
+        return totals
+
+    @staticmethod
+    def requirements(lab) -> Tuple[int, int]:
+        req = lab.sandbox_requirements or {}
+        return parse_cpu(req.get("cpu")), parse_memory(req.get("memory"))
+
+    # --- Placement ---
+
+    def place(self, db: Session, lab: LabDB, user_id: str, planned: Optional[Counter] = None) -> Cluster:
+        """Picks the cluster for a new sandbox.
+
+        Hard constraints are the lab's cluster_selector labels, the cluster's
+        session cap and free capacity (allocatable x headroom minus what active
+        sessions request). Among the clusters that fit, the one with the most
+        free capacity wins, with a bonus for the cluster of the user's previous
+        session. `planned` counts sessions of the same lab already placed but
+        not yet committed (bulk provisioning).
+        """
+        cpu, memory = self.requirements(lab)
+        selector = (lab.sandbox_requirements or {}).get("cluster_selector") or {}
+        committed = self.committed(db)
+        previous = (
+            db.query(UserSessionDB.cluster)
+            .filter(UserSessionDB.user_id == user_id)
+            .order_by(UserSessionDB.start_time.desc())
+            .limit(1)
+            .scalar()
+        )
+
+        best, best_score = None, None
+        for cluster in self:
+            if not cluster.schedulable:
+                continue
+            if any(cluster.labels.get(k) != str(v) for k, v in selector.items()):
+                continue
+            extra = (planned or {}).get(cluster.name, 0)
+            sessions, used_cpu, used_memory = committed.get(cluster.name, (0, 0, 0))
+            sessions, used_cpu, used_memory = sessions + extra, used_cpu + cpu * extra, used_memory + memory * extra
+            if cluster.max_sessions is not None and sessions >= cluster.max_sessions:
+                continue
+
+            if cluster.capacity and cluster.capacity["cpu_millicores"] and cluster.capacity["memory_bytes"]:
+                usable_cpu = cluster.capacity["cpu_millicores"] * self.headroom
+                usable_memory = cluster.capacity["memory_bytes"] * self.headroom
+                free_cpu, free_memory = usable_cpu - used_cpu - cpu, usable_memory - used_memory - memory
+                if free_cpu < 0 or free_memory < 0:
+                    continue
+                score = min(free_cpu / usable_cpu, free_memory / usable_memory)
+            else:
+                # Capacity not known yet: usable, but only if nothing measured fits
+                score = -1.0
+            if previous is not None and cluster.name == previous:
+                score += AFFINITY_BONUS
+            if best_score is None or score > best_score:
+                best, best_score = cluster, score
+
+        if best is None:
+            raise NoCapacityError(f"No cluster has capacity for lab {lab.id}")
+        return best
+
+    # --- Status ---
+
+    def status(self, db: Session) -> List[Dict]:
+        committed = self.committed(db)
+        result = []
+        for cluster in self:
+            sessions, cpu, memory = committed.get(cluster.name, (0, 0, 0))
+            result.append(
+                {
+                    "name": cluster.name,
+                    "default": cluster is self.default,
+                    "labels": cluster.labels,
+                    "schedulable": cluster.schedulable,
+                    "cordoned": cluster.cordoned,
+                    "healthy": cluster.healthy,
+                    "last_error": cluster.last_error,
+                    "circuit": cluster.ops.circuit_state,
+                    "capacity": cluster.capacity,
+                    "committed": {"sessions": sessions, "cpu_millicores": cpu, "memory_bytes": memory},
+                    "max_sessions": cluster.max_sessions,
+                    "refreshed_seconds_ago": (
+                        round(time.monotonic() - cluster.refreshed_at) if cluster.refreshed_at else None
+                    ),
+                }
+            )
+        return result
@@ -1,5 +1,6 @@
+import logging
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.orm import sessionmaker
 
 # Use environment variable for database URL, default to sqlite for local dev fallback if needed,
@@ -27,4 +28,30 @@ elif "postgresql" in DB_URL:
     connect_args = {"connect_timeout": 5}
 
 engine = create_engine(DB_URL, connect_args=connect_args)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
\ No newline at end of file
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+logger = logging.getLogger(__name__)
+
+
+def add_missing_columns(metadata):
+    """Adds columns and indexes declared on the models to existing tables.
+
+    create_all only creates missing tables, so new nullable columns on existing
+    tables are added here with a plain ALTER TABLE.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(
+                    text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}")
+                )
+                logger.info("Added column %s.%s", table.name, column.name)
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class DrainController:
+    """Coordinates a graceful shutdown of this replica.
+
+    Once draining, the replica refuses new sessions and shells, tells connected
+    terminals to reconnect elsewhere, and waits (up to a deadline) for tracked
+    in-flight operations such as provisioning and teardown. Whatever is still
+    running at the deadline is handed to `on_abandon` so its persisted state can
+    be released for another replica to resume.
+    """
+
+    def __init__(self, timeout: float = 25.0):
+        self.timeout = timeout
+        self.draining = False
+        self._inflight: Dict[Tuple[str, str], float] = {}
+        self._changed: Optional[asyncio.Event] = None
+        self._drained: Optional[asyncio.Event] = None
+        self._shells_closed = 0
+        self._abandoned: List[Tuple[str, str]] = []
+        self._elapsed = 0.0
+
+    @asynccontextmanager
+    async def track(self, kind: str, key: str):
+        """Marks an operation as in flight for the duration of the block."""
+        entry = (kind, key)
+        self._inflight[entry] = time.monotonic()
+        try:
+            yield
+        finally:
+            self._inflight.pop(entry, None)
+            if self._changed is not None:
+                self._changed.set()
+
+    def inflight(self) -> List[Tuple[str, str]]:
+        return list(self._inflight)
+
+    async def drain(
+        self,
+        close_shells: Callable[[], Awaitable[int]],
+        wait_for: Optional[List[asyncio.Task]] = None,
+        on_abandon: Optional[Callable[[List[Tuple[str, str]]], None]] = None,
+    ) -> Dict:
+        """Drains the replica; concurrent and repeated calls wait for the first run."""
+        if self._drained is not None:
+            await self._drained.wait()
+            return self.summary()
+        self._drained = asyncio.Event()
+        self._changed = asyncio.Event()
+        self.draining = True
+        started = time.monotonic()
+        deadline = started + self.timeout
+        logger.info("Draining: %s operation(s) in flight, deadline %.0fs", len(self._inflight), self.timeout)
+
+        self._shells_closed = await close_shells()
+
+        pending = [t for t in (wait_for or []) if not t.done()]
+        while (self._inflight or any(not t.done() for t in pending)) and time.monotonic() < deadline:
+            self._changed.clear()
+            waiters = [asyncio.create_task(self._changed.wait())]
+            waiters.extend(t for t in pending if not t.done())
+            await asyncio.wait(
+                waiters,
+                timeout=deadline - time.monotonic(),
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            waiters[0].cancel()
+
+        self._abandoned = self.inflight()
+        if self._abandoned:
+            logger.warning("Drain deadline reached with %s operation(s) in flight", len(self._abandoned))
+            if on_abandon is not None:
+                on_abandon(self._abandoned)
+        self._elapsed = time.monotonic() - started
+        logger.info("Drained in %.1fs", self._elapsed)
+        self._drained.set()
+        return self.summary()
+
+    def summary(self) -> Dict:
+        return {
+            "draining": self.draining,
+            "shells_closed": self._shells_closed,
+            "abandoned": [f"{kind}:{key}" for kind, key in self._abandoned],
+            "elapsed_seconds": round(self._elapsed, 1),
+        }
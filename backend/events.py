@@ -0,0 +1,121 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+SESSION_EVENT_FIELDS = (
+    "session_uuid",
+    "user_id",
+    "lab_id",
+    "sandbox_namespace",
+    "status",
+    "start_time",
+    "expires_at",
+    "provisioning_step",
+    "cluster",
+)
+
+
+def session_payload(session, *extra_fields) -> Dict:
+    """Flattens a UserSessionDB row into the fields carried by session events."""
+    return {f: getattr(session, f) for f in (*SESSION_EVENT_FIELDS, *extra_fields)}
+
+
+def to_json(data) -> str:
+    # orjson handles datetimes and enums natively; anything else is stringified
+    return orjson.dumps(data, default=str).decode()
+
+
+class Subscription:
+    """One subscriber's view of the bus.
+
+    Pending events are keyed (one entry per session), so a burst of updates to
+    the same session coalesces into its latest merged state instead of queueing.
+    """
+
+    def __init__(self, coalesce_window: float, max_pending: int):
+        self.coalesce_window = coalesce_window
+        self.max_pending = max_pending
+        self.needs_resync = False
+        self._pending: Dict[str, Dict] = {}
+        self._ready = asyncio.Event()
+
+    def push(self, key: str, event: Dict):
+        current = self._pending.get(key)
+        if current is not None:
+            # Merge partial updates (e.g. usage) into what is already queued
+            event = {**current, **event, "session": {**current["session"], **event["session"]}}
+        elif len(self._pending) >= self.max_pending:
+            # Too far behind to catch up with deltas; ask the client to start over
+            self._pending.clear()
+            self.needs_resync = True
+        self._pending[key] = event
+        self._ready.set()
+
+    async def batches(self, heartbeat: float = 15.0):
+        """Yields lists of coalesced events, or an empty list as a keepalive."""
+        while True:
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield []
+                continue
+            # Give rapid follow-up updates a moment to merge into this batch
+            await asyncio.sleep(self.coalesce_window)
+            self._ready.clear()
+            batch = list(self._pending.values())
+            self._pending.clear()
+            yield batch
+
+
+class EventBus:
+    """In-process pub/sub for session lifecycle events.
+
+    Publishers may call from the event loop or from worker threads (sync
+    endpoints, to_thread calls); dispatch always happens on the loop the bus was
+    started on, fanning each event out to every subscriber.
+    """
+
+    def __init__(self, coalesce_window: float = 0.5, max_pending: int = 1000):
+        self.coalesce_window = coalesce_window
+        self.max_pending = max_pending
+        self._subscribers: List[Subscription] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+
+    def subscribe(self) -> Subscription:
+        subscription = Subscription(self.coalesce_window, self.max_pending)
+        self._subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        if subscription in self._subscribers:
+            self._subscribers.remove(subscription)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, event: str, session: Dict):
+        """Publishes a lifecycle event carrying (partial) session state."""
+        if self._loop is None or not self._subscribers:
+            return
+        payload = {"event": event, "session": session}
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._dispatch(payload)
+        else:
+            self._loop.call_soon_threadsafe(self._dispatch, payload)
+
+    def _dispatch(self, payload: Dict):
+        key = payload["session"]["session_uuid"]
+        for subscription in list(self._subscribers):
+            subscription.push(key, payload)
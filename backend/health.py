@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import text
+
+from drain import DrainController
+from k8s_client import BACKGROUND, k8s_priority
+from kubernetes_ops import KubernetesOps
+from leader_election import LeaderElector
+from startup import StartupTracker
+
+logger = logging.getLogger(__name__)
+
+
+class HealthMonitor:
+    """Probes the backend's dependencies on an interval and caches the verdicts.
+
+    /readyz and /livez only read the cached results, so probe traffic from the
+    kubelet (or anyone else) never reaches the database or the API server.
+    """
+
+    def __init__(
+        self,
+        engine,
+        k8s_ops: KubernetesOps,
+        leader: LeaderElector,
+        scheduler,
+        startup: StartupTracker,
+        shell_count: Callable[[], int],
+        max_shells: int,
+        drain: Optional[DrainController] = None,
+        interval: float = 10.0,
+        probe_timeout: float = 5.0,
+    ):
+        self.engine = engine
+        self.k8s_ops = k8s_ops
+        self.leader = leader
+        self.scheduler = scheduler
+        self.startup = startup
+        self.shell_count = shell_count
+        self.max_shells = max_shells
+        self.drain = drain
+        self.interval = interval
+        self.probe_timeout = probe_timeout
+        self.checks: Dict[str, Dict] = {}
+        self.last_run: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._loop())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    # --- Verdicts (cached, no I/O) ---
+
+    def readiness(self) -> Dict:
+        checks = dict(self.checks)
+        checks["startup"] = {
+            "ok": self.startup.ready,
+            "detail": None if self.startup.ready else self.startup.last_error or "bootstrapping",
+        }
+        if self.drain is not None and self.drain.draining:
+            checks["drain"] = {"ok": False, "detail": "replica is shutting down"}
+        stale = self.last_run is None or time.monotonic() - self.last_run > 3 * self.interval
+        if stale:
+            checks["probes"] = {"ok": False, "detail": "dependency probes have not run recently"}
+        return {"ready": all(c["ok"] for c in checks.values()), "checks": checks}
+
+    def liveness(self) -> Dict:
+        # The probe loop runs on the event loop; if it stops ticking the loop is wedged
+        if self._task is not None and self._task.done():
+            return {"alive": False, "detail": "health monitor stopped"}
+        if self.last_run is not None and time.monotonic() - self.last_run > 6 * self.interval + self.probe_timeout:
+            return {"alive": False, "detail": "event loop unresponsive"}
+        return {"alive": True}
+
+    # --- Probes ---
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_probes()
+            except Exception as e:
+                logger.error("Health probes failed: %s", e)
+            await asyncio.sleep(self.interval)
+
+    async def run_probes(self):
+        database, kubernetes = await asyncio.gather(
+            self._timed(self._probe_database), self._timed(self._probe_kubernetes)
+        )
+        checks = {"database": database, "kubernetes": kubernetes}
+        checks["scheduler"] = self._probe_scheduler()
+        shells = self.shell_count()
+        checks["shells"] = {
+            "ok": shells < self.max_shells,
+            "detail": f"{shells}/{self.max_shells} in use",
+        }
+
+        for name, check in checks.items():
+            previous = self.checks.get(name)
+            if previous is not None and previous["ok"] != check["ok"]:
+                log = logger.info if check["ok"] else logger.warning
+                log(
+                    "Readiness check '%s' is now %s: %s",
+                    name,
+                    "ok" if check["ok"] else "failing",
+                    check["detail"],
+                )
+        self.checks = checks
+        self.last_run = time.monotonic()
+
+    async def _timed(self, probe) -> Dict:
+        started = time.perf_counter()
+        try:
+            detail = await asyncio.wait_for(asyncio.to_thread(probe), timeout=self.probe_timeout)
+            ok = True
+        except asyncio.TimeoutError:
+            ok, detail = False, f"timed out after {self.probe_timeout:.0f}s"
+        except Exception as e:
+            ok, detail = False, str(e)
+        return {"ok": ok, "detail": detail, "latency_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+    def _probe_database(self) -> str:
+        with self.engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        pool = self.engine.pool
+        if hasattr(pool, "checkedout"):
+            return f"pool {pool.checkedout()} checked out / {pool.size()} + {pool.overflow()} overflow"
+        return "ok"
+
+    def _probe_kubernetes(self) -> str:
+        circuit = self.k8s_ops.api_client.breaker.state
+        if circuit == "open":
+            # The breaker already knows; don't add load to a struggling API server
+            raise RuntimeError("API client circuit is open")
+        with k8s_priority(BACKGROUND):
+            return self.k8s_ops.server_version()
+
+    def _probe_scheduler(self) -> Dict:
+        if not self.startup.ready:
+            return {"ok": False, "detail": "not started"}
+        if not self.scheduler.running:
+            return {"ok": False, "detail": "scheduler stopped"}
+        last = self.leader.last_campaign
+        if last is None or time.monotonic() - last > 60:
+            return {"ok": False, "detail": "leader election has not reached the database for 60s"}
+        return {"ok": True, "detail": "leader" if self.leader.is_leader else "follower"}
@@ -0,0 +1,129 @@
+import contextvars
+import importlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+K8S_CLIENT_QPS = float(os.getenv("K8S_CLIENT_QPS", "20"))
+K8S_CLIENT_BURST = int(os.getenv("K8S_CLIENT_BURST", "40"))
+K8S_REQUEST_TIMEOUT = float(os.getenv("K8S_REQUEST_TIMEOUT", "30"))
+# Connections kept per API server. At most anyio's threadpool (sync endpoints,
+# 40 threads) plus asyncio's to_thread executor call it at once; below that,
+# urllib3 discards connections with "Connection pool is full"
+_API_THREADS = 40 + min(32, (os.cpu_count() or 1) + 4)
+K8S_CLIENT_POOL_SIZE = int(os.getenv("K8S_CLIENT_POOL_SIZE", str(max(K8S_CLIENT_BURST, _API_THREADS))))
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+# Lane of the current request; to_thread and the threadpool copy it along
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar("k8s_priority", default=INTERACTIVE)
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+class LazyModule:
+    """Stands in for a module and imports it on first attribute access.
+
+    The kubernetes package loads every generated model class on import
+    (~150 ms), so modules on the app's import path refer to it through this
+    and only pay for it once they talk to a cluster.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+@contextmanager
+def k8s_priority(lane: str):
+    """Runs the enclosed API calls in the given priority lane."""
+    token = _priority.set(lane)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """Client-side QPS limit shared by every API call of the process.
+
+    Background calls may only spend tokens above `reserve`, so user-facing
+    requests keep headroom even while pollers are busy.
+    """
+
+    def __init__(self, rate: float, burst: int, reserve_fraction: float = 0.25):
+        self.rate = rate
+        self.burst = burst
+        self.reserve = burst * reserve_fraction
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, lane: str) -> float:
+        """Blocks until a token is available; returns the time spent waiting."""
+        floor = self.reserve if lane == BACKGROUND else 0.0
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens - 1 >= floor:
+                    self._tokens -= 1
+                    return waited
+                delay = (floor + 1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class CircuitBreaker:
+    """Opens after consecutive server-side failures and lets one probe through after the cooldown."""
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    def before_call(self) -> Optional[float]:
+        """Returns the seconds to wait if the call must be rejected, else None."""
+        with self._lock:
+            if self.opened_at is None:
+                return None
+            remaining = self.cooldown - (time.monotonic() - self.opened_at)
+            if remaining > 0 or self._probing:
+                return max(remaining, 1.0)
+            self._probing = True
+            return None
+
+    def record(self, success: bool) -> bool:
+        """Records a call outcome; returns True if this failure opened the circuit."""
+        with self._lock:
+            self._probing = False
+            if success:
+                self.failures = 0
+                self.opened_at = None
+                return False
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                was_open = self.opened_at is not None
+                self.opened_at = time.monotonic()
+                return not was_open
+            return False
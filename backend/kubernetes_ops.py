@@ -1,25 +1,154 @@
+import json
 import logging
 import os
 import subprocess
-from kubernetes import client, config
-from kubernetes.client.rest import ApiException
+import threading
+import time
+from typing import List, Optional
+
+from k8s_client import LazyModule
+
+# Loaded on first use, normally when the first client is created
+client = LazyModule("kubernetes.client")
+config = LazyModule("kubernetes.config")
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+KUBECTL_TIMEOUT = f"--request-timeout={os.getenv('KUBECTL_REQUEST_TIMEOUT', '60s')}"
+
+# user-id label of sandboxes pre-provisioned before their user is known
+UNASSIGNED = "unassigned"
+
+# Kinds that can be listed per namespace: typed client method or custom resource
+# (group, version, plural) served through CustomObjectsApi
+TYPED_KINDS = {
+    "Pod": ("v1", "list_namespaced_pod"),
+    "Service": ("v1", "list_namespaced_service"),
+    "ConfigMap": ("v1", "list_namespaced_config_map"),
+    "Secret": ("v1", "list_namespaced_secret"),
+    "PersistentVolumeClaim": ("v1", "list_namespaced_persistent_volume_claim"),
+    "ServiceAccount": ("v1", "list_namespaced_service_account"),
+    "Deployment": ("apps_v1", "list_namespaced_deployment"),
+    "StatefulSet": ("apps_v1", "list_namespaced_stateful_set"),
+    "NetworkPolicy": ("networking_v1", "list_namespaced_network_policy"),
+    "Role": ("rbac", "list_namespaced_role"),
+    "RoleBinding": ("rbac", "list_namespaced_role_binding"),
+}
+CUSTOM_KINDS = {
+    "VirtualService": ("networking.istio.io", "v1beta1", "virtualservices"),
+    "InferenceService": ("serving.kserve.io", "v1beta1", "inferenceservices"),
+    "SparkApplication": ("sparkoperator.k8s.io", "v1beta2", "sparkapplications"),
+}
+
+
+def create_if_absent(create, *args, **kwargs):
+    """Runs a create call, treating AlreadyExists as success so steps can be re-run."""
+    try:
+        return create(*args, **kwargs)
+    except client.ApiException as e:
+        if e.status != 409:
+            raise
+        logger.debug("%s: already exists", create.__name__)
+
+
+def sandbox_namespace_name(user_id: str, session_uuid: str) -> str:
+    """Builds the sandbox namespace name for a user's session."""
+    # Sanitize user_id for Kubernetes Namespace (RFC 1123 DNS Label)
+    # Replace dots and @ with hyphens, convert to lowercase
+    sanitized_user_id = user_id.lower().replace(".", "-").replace("@", "-")
+    return f"playground-{sanitized_user_id}-{session_uuid}"
+
 
 class KubernetesOps:
-    def __init__(self):
-        try:
-            config.load_incluster_config()
-        except config.ConfigException:
-            config.load_kube_config()
+    """Sandbox lifecycle operations against the cluster.
+
+    Kubeconfig loading and API client construction are deferred to the first
+    call, so importing the app and serving probes never waits on them. Without
+    a kubeconfig the in-cluster (or default) config is used; with one, the
+    client and every kubectl call target that cluster/context only.
+    """
+
+    def __init__(self, kubeconfig: Optional[str] = None, context: Optional[str] = None):
+        self.kubeconfig = kubeconfig
+        self.context = context
+        self.kubectl_args: List[str] = []
+        if kubeconfig:
+            self.kubectl_args += ["--kubeconfig", kubeconfig]
+        if context:
+            self.kubectl_args += ["--context", context]
+        self._api_client = None
+        self._apis = {}
+        self._dynamic = None
+        self._lock = threading.Lock()
+
+    @property
+    def api_client(self) -> "ResilientApiClient":
+        if self._api_client is None:
+            with self._lock:
+                if self._api_client is None:
+                    started = time.perf_counter()
+                    from k8s_api_client import ResilientApiClient
+
+                    configuration = None
+                    if self.kubeconfig or self.context:
+                        configuration = client.Configuration()
+                        config.load_kube_config(
+                            config_file=self.kubeconfig,
+                            context=self.context,
+                            client_configuration=configuration,
+                        )
+                    else:
+                        try:
+                            config.load_incluster_config()
+                        except config.ConfigException:
+                            config.load_kube_config()
+                    # One shared client so every API group draws from the same rate limit
+                    self._api_client = ResilientApiClient(configuration)
+                    logger.info(
+                        "Kubernetes client initialized in %.0f ms", (time.perf_counter() - started) * 1000
+                    )
+        return self._api_client
+
+    @property
+    def circuit_state(self) -> str:
+        """Circuit breaker state, without creating the client if nothing has used it yet."""
+        return self._api_client.breaker.state if self._api_client is not None else "closed"
+
+    def _api(self, api_class):
+        api = self._apis.get(api_class)
+        if api is None:
+            api = self._apis[api_class] = api_class(self.api_client)
+        return api
+
+    @property
+    def v1(self) -> "client.CoreV1Api":
+        return self._api(client.CoreV1Api)
+
+    @property
+    def apps_v1(self) -> "client.AppsV1Api":
+        return self._api(client.AppsV1Api)
+
+    @property
+    def networking_v1(self) -> "client.NetworkingV1Api":
+        return self._api(client.NetworkingV1Api)
+
+    @property
+    def rbac(self) -> "client.RbacAuthorizationV1Api":
+        return self._api(client.RbacAuthorizationV1Api)
 
-        self.v1 = client.CoreV1Api()
-        self.apps_v1 = client.AppsV1Api()
-        self.networking_v1 = client.NetworkingV1Api()
-        self.rbac = client.RbacAuthorizationV1Api()
-        self.custom_objects = client.CustomObjectsApi()
+    @property
+    def custom_objects(self) -> "client.CustomObjectsApi":
+        return self._api(client.CustomObjectsApi)
+
+    @property
+    def dynamic(self):
+        """Discovery-backed client for arbitrary kinds, created on first use."""
+        if self._dynamic is None:
+            # Only the manifest validator needs it; keep it off the import path
+            from kubernetes import dynamic
+
+            self._dynamic = dynamic.DynamicClient(self.api_client)
+        return self._dynamic
 
     def create_network_policy(self, namespace_name: str):
         """Creates a NetworkPolicy to isolate the sandbox."""
@@ -70,32 +199,32 @@ class KubernetesOps:
             )
         )
         try:
-            self.networking_v1.create_namespaced_network_policy(namespace_name, policy)
-            logger.info(f"Created NetworkPolicy in {namespace_name}")
-        except ApiException as e:
-            logger.error(f"Error creating NetworkPolicy for {namespace_name}: {e}")
+            create_if_absent(self.networking_v1.create_namespaced_network_policy, namespace_name, policy)
+            logger.info("Created NetworkPolicy in %s", namespace_name)
+        except client.ApiException as e:
+            logger.error("Error creating NetworkPolicy for %s: %s", namespace_name, e)
             # Non-critical for now, but should be logged
             pass
 
-    def create_sandbox_namespace(self, namespace_name: str, user_id: str):
-        """Creates a new sandbox namespace with labels."""
+    def create_sandbox_namespace(self, namespace_name: str, user_id: Optional[str]):
+        """Creates a new sandbox namespace with labels (user-id "unassigned" for warm sandboxes)."""
         body = client.V1Namespace(
             metadata=client.V1ObjectMeta(
                 name=namespace_name,
                 labels={
                     "app": "pcai-playground",
                     "created-by": "playground-api",
-                    "user-id": user_id,
+                    "user-id": user_id or UNASSIGNED,
                     "type": "sandbox",
                 },
             )
         )
         try:
             self.v1.create_namespace(body=body)
-            logger.info(f"Created namespace: {namespace_name}")
-        except ApiException as e:
+            logger.info("Created namespace: %s", namespace_name)
+        except client.ApiException as e:
             if e.status != 409:  # Ignore if already exists
-                logger.error(f"Error creating namespace {namespace_name}: {e}")
+                logger.error("Error creating namespace %s: %s", namespace_name, e)
                 raise
 
     def apply_quotas(self, namespace_name: str):
@@ -128,10 +257,10 @@ class KubernetesOps:
         )
 
         try:
-            self.v1.create_namespaced_resource_quota(namespace_name, quota)
-            self.v1.create_namespaced_limit_range(namespace_name, limit_range)
-        except ApiException as e:
-            logger.error(f"Error applying quotas to {namespace_name}: {e}")
+            create_if_absent(self.v1.create_namespaced_resource_quota, namespace_name, quota)
+            create_if_absent(self.v1.create_namespaced_limit_range, namespace_name, limit_range)
+        except client.ApiException as e:
+            logger.error("Error applying quotas to %s: %s", namespace_name, e)
             raise
 
     def copy_user_secret(self, user_id: str, target_namespace: str):
@@ -151,10 +280,10 @@ class KubernetesOps:
                     break
 
             if not source_secret:
-                logger.warning(f"No access-token secret found for user {user_id}")
+                logger.warning("No access-token secret found for user %s", user_id)
                 return
 
-            logger.info(f"Found access-token secret for {user_id} in {source_secret.metadata.namespace}")
+            logger.info("Found access-token secret for %s in %s", user_id, source_secret.metadata.namespace)
 
             # Create the new secret in the target namespace
             new_secret = client.V1Secret(
@@ -170,13 +299,24 @@ class KubernetesOps:
                 type=source_secret.type
             )
 
-            self.v1.create_namespaced_secret(target_namespace, new_secret)
-            logger.info(f"Copied access-token secret to {target_namespace}")
+            create_if_absent(self.v1.create_namespaced_secret, target_namespace, new_secret)
+            logger.info("Copied access-token secret to %s", target_namespace)
 
-        except ApiException as e:
-            logger.error(f"Error copying secret for user {user_id}: {e}")
+        except client.ApiException as e:
+            logger.error("Error copying secret for user %s: %s", user_id, e)
 
-    def setup_rbac(self, namespace_name: str, user_id: str):
+    @staticmethod
+    def sandbox_subjects(namespace_name: str, user_id: Optional[str]) -> List["client.RbacV1Subject"]:
+        subjects = [
+            client.RbacV1Subject(kind="ServiceAccount", name="sandbox-sa", namespace=namespace_name)
+        ]
+        if user_id:
+            subjects.insert(
+                0, client.RbacV1Subject(kind="User", name=user_id, api_group="rbac.authorization.k8s.io")
+            )
+        return subjects
+
+    def setup_rbac(self, namespace_name: str, user_id: Optional[str]):
         """Sets up sandbox-specific RBAC (Role + RoleBinding)."""
         # Create ServiceAccount for toolbox
         sa = client.V1ServiceAccount(
@@ -212,14 +352,7 @@ class KubernetesOps:
             metadata=client.V1ObjectMeta(
                 name="sandbox-user-binding", namespace=namespace_name
             ),
-            subjects=[
-                client.RbacV1Subject(
-                    kind="User", name=user_id, api_group="rbac.authorization.k8s.io"
-                ),
-                client.RbacV1Subject(
-                    kind="ServiceAccount", name="sandbox-sa", namespace=namespace_name
-                ),
-            ],
+            subjects=self.sandbox_subjects(namespace_name, user_id),
             role_ref=client.V1RoleRef(
                 kind="Role",
                 name="sandbox-user-role",
@@ -228,9 +361,9 @@ class KubernetesOps:
         )
 
         try:
-            self.v1.create_namespaced_service_account(namespace_name, sa)
-            self.rbac.create_namespaced_role(namespace_name, role)
-            self.rbac.create_namespaced_role_binding(namespace_name, binding)
+            create_if_absent(self.v1.create_namespaced_service_account, namespace_name, sa)
+            create_if_absent(self.rbac.create_namespaced_role, namespace_name, role)
+            create_if_absent(self.rbac.create_namespaced_role_binding, namespace_name, binding)
 
             # Create ClusterRoleBinding for cluster-wide read access (Kyverno, Cert-Manager)
             crb_name = f"sandbox-viewer-{namespace_name}"
@@ -249,11 +382,11 @@ class KubernetesOps:
                     api_group="rbac.authorization.k8s.io"
                 )
             )
-            self.rbac.create_cluster_role_binding(crb)
-            logger.info(f"Created ClusterRoleBinding: {crb_name}")
+            create_if_absent(self.rbac.create_cluster_role_binding, crb)
+            logger.info("Created ClusterRoleBinding: %s", crb_name)
 
-        except ApiException as e:
-            logger.error(f"Error setting up RBAC for {namespace_name}: {e}")
+        except client.ApiException as e:
+            logger.error("Error setting up RBAC for %s: %s", namespace_name, e)
             raise
 
     def deploy_toolbox(self, sandbox_namespace: str, user_id: str = None):
@@ -314,10 +447,60 @@ class KubernetesOps:
         )
 
         try:
-            self.v1.create_namespaced_pod(sandbox_namespace, toolbox_manifest)
-            logger.info(f"Deployed toolbox pod to {sandbox_namespace}")
-        except ApiException as e:
-            logger.error(f"Error deploying toolbox to {sandbox_namespace}: {e}")
+            create_if_absent(self.v1.create_namespaced_pod, sandbox_namespace, toolbox_manifest)
+            logger.info("Deployed toolbox pod to %s", sandbox_namespace)
+        except client.ApiException as e:
+            logger.error("Error deploying toolbox to %s: %s", sandbox_namespace, e)
+            raise
+
+    def assign_sandbox(self, namespace_name: str, user_id: str):
+        """Hands a pre-provisioned (unassigned) sandbox to a user; safe to repeat."""
+        try:
+            self.v1.patch_namespace(namespace_name, {"metadata": {"labels": {"user-id": user_id}}})
+            # subjects has no merge key, so the patch replaces the whole list
+            self.rbac.patch_namespaced_role_binding(
+                "sandbox-user-binding",
+                namespace_name,
+                {"subjects": self.sandbox_subjects(namespace_name, user_id)},
+            )
+        except client.ApiException as e:
+            logger.error("Error assigning %s to %s: %s", namespace_name, user_id, e)
+            raise
+        self.copy_user_secret(user_id, namespace_name)
+        logger.info("Assigned sandbox %s to %s", namespace_name, user_id)
+
+    def provision_sandbox(self, namespace_name: str, user_id: Optional[str], on_step=None, start_at: str = None):
+        """Creates a fully configured sandbox, removing it again on failure.
+
+        on_step, if given, is called with the name of each step before it runs.
+        start_at resumes an interrupted run from that step; every step tolerates
+        objects left behind by a previous attempt. Without a user_id the sandbox
+        is built unassigned (pre-provisioning); start_at="assign" then hands it
+        to its user.
+        """
+        steps = [
+            ("namespace", lambda: self.create_sandbox_namespace(namespace_name, user_id)),
+            ("quotas", lambda: self.apply_quotas(namespace_name)),
+            ("rbac", lambda: self.setup_rbac(namespace_name, user_id)),
+            # Pass original user_id for secret lookup
+            ("toolbox", lambda: self.deploy_toolbox(namespace_name, user_id)),
+        ]
+        if start_at == "assign":
+            steps = [("assign", lambda: self.assign_sandbox(namespace_name, user_id))]
+        elif start_at:
+            names = [name for name, _ in steps]
+            steps = steps[names.index(start_at):]
+        try:
+            for name, run in steps:
+                if on_step:
+                    on_step(name)
+                run()
+        except Exception:
+            # Only try delete if creation failed midway
+            try:
+                self.delete_sandbox_namespace(namespace_name)
+            except Exception:
+                pass
             raise
 
     def delete_sandbox_namespace(self, namespace_name: str):
@@ -326,17 +509,17 @@ class KubernetesOps:
         crb_name = f"sandbox-viewer-{namespace_name}"
         try:
             self.rbac.delete_cluster_role_binding(name=crb_name)
-            logger.info(f"Deleted ClusterRoleBinding: {crb_name}")
-        except ApiException as e:
+            logger.info("Deleted ClusterRoleBinding: %s", crb_name)
+        except client.ApiException as e:
             if e.status != 404:
-                logger.error(f"Error deleting ClusterRoleBinding {crb_name}: {e}")
+                logger.error("Error deleting ClusterRoleBinding %s: %s", crb_name, e)
 
         try:
             self.v1.delete_namespace(name=namespace_name)
-            logger.info(f"Deleted namespace: {namespace_name}")
-        except ApiException as e:
+            logger.info("Deleted namespace: %s", namespace_name)
+        except client.ApiException as e:
             if e.status != 404:
-                logger.error(f"Error deleting namespace {namespace_name}: {e}")
+                logger.error("Error deleting namespace %s: %s", namespace_name, e)
                 raise
 
     def get_namespace_usage(self, namespace_name: str):
@@ -346,41 +529,114 @@ class KubernetesOps:
                 "sandbox-quota", namespace_name
             )
             return quota.status.used if quota.status else {}  # type: ignore
-        except ApiException:
+        except client.ApiException:
             return {}
 
     def apply_manifest(self, namespace_name: str, manifest_content: str):
         """Applies a YAML manifest to the namespace using kubectl."""
         try:
-            cmd = ["kubectl", "apply", "-f", "-", "-n", namespace_name]
+            cmd = ["kubectl", *self.kubectl_args, "apply", "-f", "-", "-n", namespace_name, KUBECTL_TIMEOUT]
             process = subprocess.run(
                 cmd,
                 input=manifest_content.encode("utf-8"),
                 check=True,
                 capture_output=True,
             )
-            logger.info(f"Applied manifest to {namespace_name}")
+            logger.info("Applied manifest to %s", namespace_name)
         except subprocess.CalledProcessError as e:
             error_msg = e.stderr.decode("utf-8")
-            logger.error(f"Error applying manifest: {error_msg}")
+            logger.error("Error applying manifest: %s", error_msg)
             raise Exception(f"Failed to apply manifest: {error_msg}")
 
     def delete_manifest(self, namespace_name: str, manifest_content: str):
         """Deletes resources defined in a YAML manifest from the namespace using kubectl."""
         try:
-            cmd = ["kubectl", "delete", "-f", "-", "-n", namespace_name]
+            cmd = ["kubectl", *self.kubectl_args, "delete", "-f", "-", "-n", namespace_name, KUBECTL_TIMEOUT]
             process = subprocess.run(
                 cmd,
                 input=manifest_content.encode("utf-8"),
                 check=True,
                 capture_output=True,
             )
-            logger.info(f"Deleted manifest resources from {namespace_name}")
+            logger.info("Deleted manifest resources from %s", namespace_name)
         except subprocess.CalledProcessError as e:
             error_msg = e.stderr.decode("utf-8")
-            logger.error(f"Error deleting manifest: {error_msg}")
+            logger.error("Error deleting manifest: %s", error_msg)
             raise Exception(f"Failed to delete manifest: {error_msg}")
 
+    def dry_run_manifest(self, namespace_name: str, manifest_content: str):
+        """Server-side dry-run of a manifest; returns the objects as they would be stored."""
+        try:
+            cmd = ["kubectl", *self.kubectl_args, "apply", "--dry-run=server", "-o", "json", "-f", "-", "-n", namespace_name, KUBECTL_TIMEOUT]
+            process = subprocess.run(
+                cmd,
+                input=manifest_content.encode("utf-8"),
+                check=True,
+                capture_output=True,
+            )
+        except subprocess.CalledProcessError as e:
+            error_msg = e.stderr.decode("utf-8")
+            raise Exception(f"Dry-run failed: {error_msg}")
+        result = json.loads(process.stdout or b"{}")
+        return result.get("items", []) if result.get("kind") == "List" else [result]
+
+    def get_live_object(self, namespace_name: str, api_version: str, kind: str, name: str):
+        """Returns the live object as a dict, or None if it (or its kind) doesn't exist."""
+        from kubernetes.dynamic.exceptions import NotFoundError, ResourceNotFoundError
+
+        try:
+            resource = self.dynamic.resources.get(api_version=api_version, kind=kind)
+            if resource.namespaced:
+                obj = resource.get(name=name, namespace=namespace_name)
+            else:
+                obj = resource.get(name=name)
+            return obj.to_dict()
+        except (NotFoundError, ResourceNotFoundError):
+            return None
+
+    def create_object(self, namespace_name: str, obj: dict) -> bool:
+        """Creates an object from a manifest dict; returns False if it already exists."""
+        resource = self.dynamic.resources.get(api_version=obj["apiVersion"], kind=obj["kind"])
+        try:
+            resource.create(body=obj, namespace=namespace_name)
+            return True
+        except client.ApiException as e:
+            if e.status == 409:
+                return False
+            raise
+
+    def server_version(self, timeout: float = 3.0) -> str:
+        """Cheap API server round trip used by readiness probes."""
+        info = client.VersionApi(self.api_client).get_code(_request_timeout=timeout)
+        return info.git_version
+
+    def allocatable_capacity(self):
+        """Sums allocatable CPU (millicores) and memory (bytes) of schedulable, ready nodes."""
+        from kubernetes.utils.quantity import parse_quantity
+
+        cpu = memory = nodes = 0
+        for node in self.v1.list_node().items:
+            if node.spec.unschedulable:
+                continue
+            conditions = {c.type: c.status for c in (node.status.conditions or [])}
+            if conditions.get("Ready") != "True":
+                continue
+            allocatable = node.status.allocatable or {}
+            cpu += int(parse_quantity(allocatable.get("cpu", "0")) * 1000)
+            memory += int(parse_quantity(allocatable.get("memory", "0")))
+            nodes += 1
+        return {"nodes": nodes, "cpu_millicores": cpu, "memory_bytes": memory}
+
+    def fetch_openapi_v2(self):
+        """Downloads the API server's aggregated OpenAPI v2 document."""
+        return self.api_client.call_api(
+            "/openapi/v2",
+            "GET",
+            auth_settings=["BearerToken"],
+            response_type="object",
+            _return_http_data_only=True,
+        )
+
     def list_resources(self, namespace_name: str):
         """Lists key resources in the namespace."""
         resources = {}
@@ -410,10 +666,79 @@ class KubernetesOps:
             resources["pvcs"] = [p.metadata.name for p in pvcs.items]
 
             return resources
-        except ApiException as e:
-            logger.error(f"Error listing resources in {namespace_name}: {e}")
+        except client.ApiException as e:
+            logger.error("Error listing resources in %s: %s", namespace_name, e)
             return {}
 
+    def list_objects(self, namespace_name: str, kind: str, resource_version: str = None):
+        """Lists all objects of a kind in the namespace as plain dicts.
+
+        Returns (list resourceVersion, items). Passing the last seen
+        resource_version lets the API server answer from its watch cache.
+        """
+        kwargs = {}
+        if resource_version:
+            kwargs = {
+                "resource_version": resource_version,
+                "resource_version_match": "NotOlderThan",
+            }
+        if kind in TYPED_KINDS:
+            api_name, method = TYPED_KINDS[kind]
+            result = getattr(getattr(self, api_name), method)(namespace_name, **kwargs)
+            result = self.api_client.sanitize_for_serialization(result)
+        elif kind in CUSTOM_KINDS:
+            group, version, plural = CUSTOM_KINDS[kind]
+            result = self.custom_objects.list_namespaced_custom_object(
+                group, version, namespace_name, plural, **kwargs
+            )
+        else:
+            raise ValueError(f"Unsupported resource kind: {kind}")
+        return result.get("metadata", {}).get("resourceVersion"), result.get("items", [])
+
+    def namespace_phase(self, namespace_name: str) -> Optional[str]:
+        """Returns "Active" or "Terminating", or None if the namespace doesn't exist."""
+        try:
+            return self.v1.read_namespace(namespace_name).status.phase
+        except client.ApiException as e:
+            if e.status == 404:
+                return None
+            raise
+
+    def read_pod_log(self, namespace_name: str, pod: str, container: str = None, tail_lines: int = 200):
+        """Returns the tail of a pod's log, or an empty string if unavailable."""
+        try:
+            return self.v1.read_namespaced_pod_log(
+                pod, namespace_name, container=container, tail_lines=tail_lines
+            )
+        except client.ApiException as e:
+            if e.status not in (400, 404):
+                logger.error("Error reading logs for %s in %s: %s", pod, namespace_name, e)
+            return ""
+
+    def list_pod_containers(self, namespace_name: str, label_selector: str = None):
+        """Returns {pod name: [container names]} for pods in the namespace."""
+        pods = self.v1.list_namespaced_pod(namespace_name, label_selector=label_selector)
+        return {p.metadata.name: [c.name for c in p.spec.containers] for p in pods.items}
+
+    def follow_pod_log(
+        self,
+        namespace_name: str,
+        pod: str,
+        container: str = None,
+        tail_lines: int = None,
+        since_seconds: int = None,
+    ):
+        """Opens a followed log stream; returns the raw urllib3 response.
+
+        The caller reads it incrementally and must close it when done.
+        """
+        kwargs = {"follow": True, "_preload_content": False}
+        if tail_lines is not None:
+            kwargs["tail_lines"] = tail_lines
+        if since_seconds is not None:
+            kwargs["since_seconds"] = since_seconds
+        return self.v1.read_namespaced_pod_log(pod, namespace_name, container=container, **kwargs)
+
     def delete_resource(self, namespace_name: str, kind: str, name: str):
         """Deletes a specific resource."""
         try:
@@ -429,6 +754,6 @@ class KubernetesOps:
                 self.v1.delete_namespaced_persistent_volume_claim(name, namespace_name)
             else:
                 raise ValueError(f"Unsupported resource kind: {kind}")
-        except ApiException as e:
-            logger.error(f"Error deleting {kind} {name} in {namespace_name}: {e}")
+        except client.ApiException as e:
+            logger.error("Error deleting %s %s in %s: %s", kind, name, namespace_name, e)
             raise
\ No newline at end of file
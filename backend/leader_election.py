@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import os
+import socket
+import threading
+import time
+from sqlalchemy import text
+
+from structured_logging import bind, unbind
+
+logger = logging.getLogger(__name__)
+
+# Advisory locks are keyed by a bigint shared by every replica of the backend.
+LEADER_LOCK_KEY = int(os.getenv("LEADER_LOCK_KEY", "7366697501"))
+
+
+class LeaderElector:
+    """Elects a single replica to run singleton background jobs.
+
+    Uses a session-level Postgres advisory lock held on a dedicated connection:
+    the lock is released automatically if the holder's connection (or pod) dies,
+    so another replica takes over on its next campaign. SQLite is single-process
+    by nature, so that backend is always the leader.
+    """
+
+    def __init__(self, engine, lock_key: int = LEADER_LOCK_KEY):
+        self.engine = engine
+        self.lock_key = lock_key
+        self.identity = os.getenv("POD_NAME", socket.gethostname())
+        self.is_leader = False
+        # Monotonic time of the last campaign that reached the database
+        self.last_campaign = None
+        self._conn = None
+        # _conn is only used from worker threads, one at a time
+        self._lock = threading.Lock()
+
+    async def campaign(self):
+        """Acquires leadership if free, or verifies that we still hold it."""
+        if self.engine.dialect.name != "postgresql":
+            self.is_leader = True
+            self.last_campaign = time.monotonic()
+            return self.is_leader
+        # Connecting and querying block; keep them off the event loop
+        return await asyncio.to_thread(self._campaign)
+
+    def _campaign(self) -> bool:
+        with self._lock:
+            return self._campaign_locked()
+
+    def _campaign_locked(self) -> bool:
+        try:
+            if self._conn is None:
+                # Autocommit so the lock connection never sits idle in a transaction
+                self._conn = self.engine.connect().execution_options(
+                    isolation_level="AUTOCOMMIT"
+                )
+
+            if self.is_leader:
+                # Lock lives as long as the connection does; make sure it is still up
+                self._conn.execute(text("SELECT 1"))
+            else:
+                acquired = self._conn.execute(
+                    text("SELECT pg_try_advisory_lock(:key)"), {"key": self.lock_key}
+                ).scalar()
+                if acquired:
+                    self.is_leader = True
+                    logger.info("%s acquired background job leadership", self.identity)
+            self.last_campaign = time.monotonic()
+        except Exception as e:
+            if self.is_leader:
+                logger.error("%s lost background job leadership: %s", self.identity, e)
+            else:
+                logger.error("Leader election failed: %s", e)
+            self._close()
+
+        return self.is_leader
+
+    def resign(self):
+        """Releases leadership so another replica can take over immediately."""
+        with self._lock:
+            if self._conn is not None and self.is_leader:
+                try:
+                    self._conn.execute(
+                        text("SELECT pg_advisory_unlock(:key)"), {"key": self.lock_key}
+                    )
+                    logger.info("%s resigned background job leadership", self.identity)
+                except Exception as e:
+                    logger.warning("Failed to release leader lock: %s", e)
+            self._close()
+
+    def leader_only(self, job):
+        """Wraps a scheduler job so it only runs on the elected replica."""
+
+        async def run():
+            if not self.is_leader:
+                logger.debug("Skipping %s: not the leader", job.__name__)
+                return
+            token = bind(job=job.__name__)
+            try:
+                await job()
+            finally:
+                unbind(token)
+
+        run.__name__ = job.__name__
+        return run
+
+    def _close(self):
+        self.is_leader = False
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
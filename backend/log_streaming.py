@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import threading
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from kubernetes_ops import KubernetesOps
+
+logger = logging.getLogger(__name__)
+
+# Longer lines (e.g. a minified JSON blob) are cut so one line can't blow the buffer
+MAX_LINE_BYTES = 16 * 1024
+READ_CHUNK_BYTES = 8 * 1024
+
+# Queue items: (source, line) for a log line, (source, None) when a source ends
+Item = Tuple[str, Optional[str]]
+
+
+class LogMultiplexer:
+    """Follows several pod/container logs and merges them into one line stream.
+
+    Each source is read by its own daemon thread straight from the Kubernetes
+    API (follow=true), not by kubectl or the default executor: a followed log
+    can stay open for hours and would otherwise pin a shared worker. Lines
+    are handed to the event loop through a bounded queue; when the client
+    reads slower than the pods log, lines are dropped and counted instead of
+    buffering without limit, and a marker tells the reader how many were lost.
+    """
+
+    def __init__(
+        self,
+        ops: KubernetesOps,
+        namespace: str,
+        sources: List[Tuple[str, Optional[str]]],
+        tail_lines: Optional[int] = None,
+        since_seconds: Optional[int] = None,
+        max_buffered_lines: int = 1000,
+    ):
+        self.ops = ops
+        self.namespace = namespace
+        # Prefix with the container only when a pod's containers are followed separately
+        multi = {pod for pod, container in sources if container is not None}
+        self.sources = {
+            (f"{pod}/{container}" if pod in multi else pod): (pod, container)
+            for pod, container in sources
+        }
+        self.tail_lines = tail_lines
+        self.since_seconds = since_seconds
+        self.max_buffered_lines = max_buffered_lines
+        self.dropped: Dict[str, int] = {}
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._responses: Dict[str, object] = {}
+        self._closed = False
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def lines(self, batch_size: int = 200) -> AsyncIterator[List[Item]]:
+        """Yields batches of queued lines until every source has ended.
+
+        An empty batch means nothing arrived for a while (time for a keepalive).
+        """
+        self._loop = asyncio.get_running_loop()
+        for source, (pod, container) in self.sources.items():
+            threading.Thread(
+                target=self._follow, args=(source, pod, container), daemon=True
+            ).start()
+
+        remaining = len(self.sources)
+        while remaining:
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout=15)
+            except asyncio.TimeoutError:
+                yield []
+                continue
+            batch = [item]
+            while len(batch) < batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            remaining -= sum(1 for _, line in batch if line is None)
+            yield batch
+
+    def close(self):
+        """Stops all followers; closing a response unblocks its reader thread."""
+        with self._lock:
+            self._closed = True
+            responses = list(self._responses.values())
+            self._responses.clear()
+        for response in responses:
+            try:
+                response.close()
+            except Exception:
+                pass
+
+    # --- Reader threads ---
+
+    def _follow(self, source: str, pod: str, container: Optional[str]):
+        response = None
+        try:
+            response = self.ops.follow_pod_log(
+                self.namespace, pod, container, self.tail_lines, self.since_seconds
+            )
+            with self._lock:
+                if self._closed:
+                    return
+                self._responses[source] = response
+            pending = b""
+            for chunk in response.stream(READ_CHUNK_BYTES, decode_content=True):
+                pending += chunk
+                *complete, pending = pending.split(b"\n")
+                for raw in complete:
+                    self._emit(source, raw)
+                if len(pending) > MAX_LINE_BYTES:
+                    self._emit(source, pending)
+                    pending = b""
+            if pending:
+                self._emit(source, pending)
+        except Exception as e:
+            if not self._closed:
+                logger.info("Log stream for %s in %s ended: %s", source, self.namespace, e)
+                self._emit(source, f"[log stream ended: {e}]".encode())
+        finally:
+            with self._lock:
+                self._responses.pop(source, None)
+            if response is not None:
+                response.close()
+            if not self._closed:
+                self._loop.call_soon_threadsafe(self._end, source)
+
+    def _emit(self, source: str, raw: bytes):
+        if self._closed:
+            return
+        line = raw[:MAX_LINE_BYTES].decode("utf-8", errors="replace").rstrip("\r")
+        self._loop.call_soon_threadsafe(self._offer, source, line)
+
+    # --- Event loop side (queue size check and put are atomic here) ---
+
+    def _offer(self, source: str, line: str):
+        if self._queue.qsize() >= self.max_buffered_lines:
+            self.dropped[source] = self.dropped.get(source, 0) + 1
+            return
+        self._report_dropped(source)
+        self._queue.put_nowait((source, line))
+
+    def _end(self, source: str):
+        self._report_dropped(source)
+        self._queue.put_nowait((source, None))
+
+    def _report_dropped(self, source: str):
+        dropped = self.dropped.pop(source, 0)
+        if dropped:
+            self._queue.put_nowait((source, f"[{dropped} line(s) dropped, client reading too slowly]"))
@@ -1,74 +1,223 @@
+import time
+
+PROCESS_START = time.perf_counter()  # Before the heavy imports, so they are measured too
+
+import asyncio
 import json
 import logging
 import os
 import uuid
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 import httpx
-from fastapi import FastAPI, Depends, HTTPException, status, Security, Header, Request
+from fastapi import FastAPI, Depends, HTTPException, status, Security, Header, Request, Query, Path, WebSocket
+from fastapi.responses import FileResponse, ORJSONResponse, RedirectResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import inspect, text
 from sqlalchemy.orm import Session
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from starlette.background import BackgroundTask
 
 import models
-from database import engine, SessionLocal
-from kubernetes_ops import KubernetesOps
+from database import engine, SessionLocal, add_missing_columns
+from kubernetes_ops import sandbox_namespace_name
+from analytics import AnalyticsRecorder, COMPLETION_STEP
+from archival import SessionArchiver
 from background_tasks import ExpiryController
+from bulk_ops import BulkOperationManager
+from capacity_planner import CapacityPlanner, OverbookedError
+from clusters import ClusterRegistry, NoCapacityError
+from events import EventBus, SESSION_EVENT_FIELDS, session_payload, to_json
+from leader_election import LeaderElector
+from pagination import after_cursor, encode_cursor
+from progress import ProgressBuffer
+from verification import VerificationEngine
+from manifest_validation import ManifestValidator
+from responses import CatalogCache, CompressionMiddleware
+from startup import StartupTracker
+from health import HealthMonitor
+from log_streaming import LogMultiplexer
+from snapshots import SnapshotStore
+from rate_limit import MemoryBackend, PostgresBackend, RateLimiter, RedisBackend, SingleFlight, parse_limits
+from sandbox_proxy import SERVICE_NAME, ProxyLimitError, SandboxProxy, forward_headers, response_headers
+from drain import DrainController
+from structured_logging import SAMPLING_EXEMPT, RequestContextMiddleware, bind, configure_logging
 import websocket_shell
 
 # --- Configuration & Setup ---
 
-import time
-
-logging.basicConfig(level=logging.INFO)
+log_handler = configure_logging(
+    level=os.getenv("LOG_LEVEL", "INFO"),
+    fmt=os.getenv("LOG_FORMAT", "json"),  # json | text
+    queue_size=int(os.getenv("LOG_QUEUE_SIZE", "10000")),
+    # Each message template logs at most LOG_SAMPLE_BURST records below WARNING per interval
+    sample_burst=int(os.getenv("LOG_SAMPLE_BURST", "20")),
+    sample_interval=float(os.getenv("LOG_SAMPLE_INTERVAL_SECONDS", "10")),
+    # Loggers never sampled; the default covers the access log and session lifecycle
+    sample_exempt=tuple(
+        name.strip()
+        for name in os.getenv("LOG_SAMPLE_EXEMPT", ",".join(SAMPLING_EXEMPT)).split(",")
+        if name.strip()
+    ),
+)
 logger = logging.getLogger(__name__)
+startup = StartupTracker(PROCESS_START)
+startup.mark("imports")
+
+MAX_CONCURRENT_SESSIONS = int(os.getenv("MAX_CONCURRENT_SESSIONS", "5"))
+BULK_MAX_PARALLEL = int(os.getenv("BULK_MAX_PARALLEL", "10"))
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "7"))
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+# Keep below the pod's terminationGracePeriodSeconds
+DRAIN_TIMEOUT_SECONDS = float(os.getenv("DRAIN_TIMEOUT_SECONDS", "25"))
+# Each followed container holds a reader thread and an API server connection
+LOG_STREAM_MAX = int(os.getenv("LOG_STREAM_MAX", "100"))
+LOG_STREAM_MAX_SOURCES = int(os.getenv("LOG_STREAM_MAX_SOURCES", "10"))
+LOG_STREAM_BUFFER_LINES = int(os.getenv("LOG_STREAM_BUFFER_LINES", "1000"))
+PROXY_MAX_CONNECTIONS_PER_SESSION = int(os.getenv("PROXY_MAX_CONNECTIONS_PER_SESSION", "32"))
+PROXY_MAX_CONNECTIONS = int(os.getenv("PROXY_MAX_CONNECTIONS", "500"))
+SANDBOX_SNAPSHOTS = os.getenv("SANDBOX_SNAPSHOTS", "true").lower() == "true"
+SNAPSHOT_RETENTION_DAYS = int(os.getenv("SNAPSHOT_RETENTION_DAYS", "30"))
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # memory | postgres | redis
+# Planned events hold seats and start pre-provisioning this long before they start
+PLANNER_LEAD_MINUTES = int(os.getenv("PLANNER_LEAD_MINUTES", "30"))
+PLANNER_MAX_PARALLEL = int(os.getenv("PLANNER_MAX_PARALLEL", "5"))
 
 
 # --- Logging Filters ---
 
 class HealthCheckFilter(logging.Filter):
     def filter(self, record: logging.LogRecord) -> bool:
-        # Suppress /healthz logs from uvicorn access logs
-        return record.getMessage().find("/healthz") == -1
+        # Suppress probe logs from uvicorn access logs
+        message = record.getMessage()
+        return not any(path in message for path in ("/healthz", "/livez", "/readyz"))
 
 # Apply filter to uvicorn access logger
 logging.getLogger("uvicorn.access").addFilter(HealthCheckFilter())
 
 
 def init_db():
-    max_retries = 5
-    retry_interval = 5  # seconds
-    for attempt in range(1, max_retries + 1):
-        try:
-            logger.info(f"Connecting to database (attempt {attempt}/{max_retries})...")
-            # For Postgres, we use the connect_timeout in connect_args to fail fast
-            models.Base.metadata.create_all(bind=engine)
-            logger.info("Database connected and tables created successfully.")
-            return
-        except Exception as e:
-            logger.error(f"Database connection failed: {e}")
-            if attempt < max_retries:
-                logger.info(f"Retrying in {retry_interval} seconds...")
-                time.sleep(retry_interval)
-            else:
-                logger.error("Max retries reached. Could not connect to database.")
-                # We don't raise here to allow the app to start and respond to health checks
-                # even if the DB is down, which prevents infinite K8s restart loops.
-                return
+    """Creates tables and applies lightweight migrations; raises if the DB is unreachable."""
+    # For Postgres, connect_timeout in connect_args makes this fail fast
+    models.Base.metadata.create_all(bind=engine)
+    progress_indexes = {i["name"] for i in inspect(engine).get_indexes("lab_progress")}
+    if "uq_lab_progress_session_step" not in progress_indexes:
+        # Repeated /complete calls used to insert duplicate rows; keep one
+        # per step so the unique progress index can be created
+        with engine.begin() as conn:
+            conn.execute(
+                text(
+                    "DELETE FROM lab_progress WHERE id NOT IN "
+                    "(SELECT MIN(id) FROM lab_progress GROUP BY session_id, step_completed)"
+                )
+            )
+    if engine.dialect.name == "postgresql":
+        # A reissued session_uuid made archiving its batch fail forever
+        for constraint in inspect(engine).get_unique_constraints("sessions_archive"):
+            if constraint["column_names"] == ["session_uuid"]:
+                with engine.begin() as conn:
+                    conn.execute(text(f'ALTER TABLE sessions_archive DROP CONSTRAINT "{constraint["name"]}"'))
+    add_missing_columns(models.Base.metadata)
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "UPDATE sessions SET updated_at = COALESCE(last_activity, start_time) "
+                "WHERE updated_at IS NULL"
+            )
+        )
+    logger.info("Database connected and tables created successfully.")
+
 
+def load_catalog():
+    db = SessionLocal()
+    try:
+        with open("lab_catalog.json") as f:
+            catalog = json.load(f)
+            for lab_data in catalog["labs"]:
+                lab = models.LabDB(**lab_data)
+                db.merge(lab)
+            db.commit()
+            logger.info("Lab catalog loaded successfully.")
+        catalog_cache.load(db.query(models.LabDB).all())
+    finally:
+        db.close()
 
-app = FastAPI(title="PCAI Playground API", version="1.0.0")
+app = FastAPI(
+    title="PCAI Playground API",
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+)
+app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MIN_BYTES)
+app.add_middleware(RequestContextMiddleware)
 app.include_router(websocket_shell.router)
-k8s_ops = KubernetesOps()
-expiry_controller = ExpiryController(SessionLocal, k8s_ops)
+catalog_cache = CatalogCache()
+clusters = ClusterRegistry.from_env()
+app.state.clusters = clusters
+event_bus = EventBus()
+analytics = AnalyticsRecorder(SessionLocal)
+progress_buffer = ProgressBuffer(SessionLocal)
+archiver = SessionArchiver(SessionLocal, retention=timedelta(days=ARCHIVE_AFTER_DAYS))
+verification_engines = {c.name: VerificationEngine(c.ops) for c in clusters}
+manifest_validators = {c.name: ManifestValidator(c.ops) for c in clusters}
+snapshot_store = SnapshotStore(
+    SessionLocal, enabled=SANDBOX_SNAPSHOTS, retention=timedelta(days=SNAPSHOT_RETENTION_DAYS)
+)
+leader = LeaderElector(engine)
+expiry_controller = ExpiryController(
+    SessionLocal, clusters, event_bus, analytics, snapshot_store, identity=leader.identity
+)
+drain_controller = DrainController(timeout=DRAIN_TIMEOUT_SECONDS)
+capacity_planner = CapacityPlanner(
+    SessionLocal,
+    clusters,
+    max_sessions=MAX_CONCURRENT_SESSIONS,
+    lead=timedelta(minutes=PLANNER_LEAD_MINUTES),
+    max_parallel=PLANNER_MAX_PARALLEL,
+)
+bulk_ops = BulkOperationManager(
+    SessionLocal,
+    clusters,
+    event_bus,
+    analytics,
+    snapshot_store,
+    max_parallel=BULK_MAX_PARALLEL,
+    max_sessions=MAX_CONCURRENT_SESSIONS,
+    identity=leader.identity,
+    capacity_planner=capacity_planner,
+)
+if RATE_LIMIT_BACKEND == "postgres":
+    rate_limit_backend = PostgresBackend(engine)
+elif RATE_LIMIT_BACKEND == "redis":
+    rate_limit_backend = RedisBackend(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+else:
+    rate_limit_backend = MemoryBackend()
+rate_limiter = RateLimiter(
+    rate_limit_backend, parse_limits(os.getenv("RATE_LIMITS")), enabled=RATE_LIMIT_ENABLED
+)
+app.state.rate_limiter = rate_limiter
+single_flight = SingleFlight()
+sandbox_proxy = SandboxProxy(
+    max_per_session=PROXY_MAX_CONNECTIONS_PER_SESSION, max_connections=PROXY_MAX_CONNECTIONS
+)
 scheduler = AsyncIOScheduler()
 security = HTTPBearer(auto_error=False)
 
 # --- Dependency ---
 
 
+def require_ready():
+    if not startup.ready:
+        raise HTTPException(
+            status_code=503,
+            detail=startup.last_error or "Service is starting",
+            headers={"Retry-After": "2"},
+        )
+
+
 def get_db():
+    require_ready()
     db = SessionLocal()
     try:
         yield db
@@ -82,6 +231,7 @@ async def get_current_user(
 ):
     # In development, assume user is authorized if explicitly set
     if os.getenv("ENVIRONMENT") == "development":
+        bind(user="dev-user")
         return "dev-user"
 
     # Prioritize standard EzUA/OIDC headers from the platform
@@ -98,6 +248,7 @@ async def get_current_user(
     for header in auth_headers:
         val = request.headers.get(header)
         if val:
+            bind(user=val)
             return val
 
     # Fallback 1: Check for _oauth2_proxy cookie and query userinfo endpoint
@@ -119,10 +270,11 @@ async def get_current_user(
                         user_data.get("user")
                     )
                     if user:
-                        logger.info(f"Authenticated via oauth2-proxy userinfo: {user}")
+                        bind(user=user)
+                        logger.info("Authenticated via oauth2-proxy userinfo: %s", user)
                         return user
         except Exception as e:
-            logger.debug(f"oauth2-proxy userinfo check failed: {e}")
+            logger.debug("oauth2-proxy userinfo check failed: %s", e)
 
     # Fallback 2: check for OIDC token in Authorization header
     if auth:
@@ -130,7 +282,12 @@ async def get_current_user(
         # For now, we assume if the platform passed it through, it's valid.
         pass
 
-    logger.warning(f"Authentication failed. Headers: {request.headers}")
+    # Which credentials were sent, never their values
+    present = sorted(
+        name for name in request.headers.keys()
+        if name in ("authorization", "cookie") or name.startswith(("x-auth-", "x-forwarded-", "x-oidc-"))
+    )
+    logger.warning("Authentication failed; credential headers present: %s", ", ".join(present) or "none")
     raise HTTPException(status_code=401, detail="Authentication required")
 
 
@@ -138,9 +295,6 @@ async def get_current_user_info(
     request: Request,
     auth: Optional[HTTPAuthorizationCredentials] = Security(security),
 ):
-    # Log headers for debugging
-    logger.info(f"Received headers: {request.headers}")
-
     user_info = {
         "user_id": "unknown",
         "email": None,
@@ -178,45 +332,218 @@ async def get_current_user_info(
     return user_info
 
 
+def rate_limited(route_class: str):
+    """Dependency spending one of the caller's `route_class` tokens; 429 when empty."""
+
+    async def check(user_id: str = Depends(get_current_user)):
+        retry_after = await rate_limiter.check(route_class, user_id)
+        if retry_after is not None:
+            raise HTTPException(
+                status_code=429,
+                detail=f"Too many {route_class} requests, retry in {retry_after}s",
+                headers={"Retry-After": str(retry_after)},
+            )
+
+    return Depends(check)
+
+
 # --- Startup Tasks ---
 
 
+health_monitor = HealthMonitor(
+    engine,
+    clusters.default.ops,
+    leader,
+    scheduler,
+    startup,
+    shell_count=lambda: len(websocket_shell.active_shells),
+    max_shells=websocket_shell.MAX_SHELLS,
+    drain=drain_controller,
+)
+bootstrap_task: Optional[asyncio.Task] = None
+
+
 @app.on_event("startup")
 async def startup_event():
-    # Initialize DB tables
-    init_db()
+    event_bus.start()
+    # Everything that talks to the DB happens in the background so the app is
+    # live immediately; get_db answers 503 until bootstrap completes.
+    global bootstrap_task
+    bootstrap_task = asyncio.create_task(bootstrap())
+    health_monitor.start()
+    clusters.start()
+    startup.mark("serving")
+
+
+async def bootstrap():
+    delay = 1.0
+    while True:
+        try:
+            with startup.phase("database"):
+                await asyncio.to_thread(init_db)
+            break
+        except Exception as e:
+            # Keep retrying instead of exiting: the pod stays live but unready
+            startup.last_error = f"Database unavailable: {e}"
+            logger.error("Database connection failed, retrying in %.0fs: %s", delay, e)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
 
-    # Load lab catalog into DB
-    db = SessionLocal()
     try:
-        with open("lab_catalog.json") as f:
-            catalog = json.load(f)
-            for lab_data in catalog["labs"]:
-                lab = models.LabDB(**lab_data)
-                db.merge(lab)
-            db.commit()
-            logger.info("Lab catalog loaded successfully.")
+        with startup.phase("catalog"):
+            await asyncio.to_thread(load_catalog)
     except Exception as e:
-        logger.error(f"Failed to load lab catalog: {e}")
-    finally:
-        db.close()
-
-    # Start background jobs
-    scheduler.add_job(expiry_controller.check_expired_sessions, "interval", minutes=5)
-    scheduler.add_job(expiry_controller.update_resource_usage, "interval", minutes=2)
+        logger.error("Failed to load lab catalog: %s", e)
+
+    # Start background jobs. Every replica campaigns for leadership, but only
+    # the leader sweeps expired sessions and polls usage.
+    with startup.phase("leader_election"):
+        await leader.campaign()
+    if leader.is_leader:
+        with startup.phase("analytics_backfill"):
+            await asyncio.to_thread(analytics.backfill_if_empty)
+    scheduler.add_job(leader.campaign, "interval", seconds=15)
+    scheduler.add_job(
+        leader.leader_only(expiry_controller.check_expired_sessions),
+        "interval",
+        minutes=5,
+        max_instances=1,
+        coalesce=True,
+    )
+    scheduler.add_job(
+        leader.leader_only(expiry_controller.update_resource_usage),
+        "interval",
+        minutes=2,
+        max_instances=1,
+        coalesce=True,
+    )
+    scheduler.add_job(
+        leader.leader_only(expiry_controller.resume_interrupted_provisioning),
+        "interval",
+        minutes=1,
+        max_instances=1,
+        coalesce=True,
+    )
+    scheduler.add_job(
+        leader.leader_only(capacity_planner.reconcile),
+        "interval",
+        minutes=1,
+        max_instances=1,
+        coalesce=True,
+    )
+    scheduler.add_job(
+        leader.leader_only(archiver.archive_finished),
+        "interval",
+        hours=1,
+        max_instances=1,
+        coalesce=True,
+    )
+    scheduler.add_job(
+        leader.leader_only(websocket_shell.recording_store.purge_expired),
+        "interval",
+        hours=1,
+        max_instances=1,
+        coalesce=True,
+    )
+    if isinstance(rate_limit_backend, PostgresBackend):
+        scheduler.add_job(
+            leader.leader_only(rate_limit_backend.purge),
+            "interval",
+            hours=1,
+            max_instances=1,
+            coalesce=True,
+        )
+    scheduler.add_job(
+        leader.leader_only(snapshot_store.purge_expired),
+        "interval",
+        hours=1,
+        max_instances=1,
+        coalesce=True,
+    )
+    scheduler.add_job(
+        leader.leader_only(bulk_ops.purge_expired),
+        "interval",
+        hours=1,
+        max_instances=1,
+        coalesce=True,
+    )
+    # Progress is written behind on every replica, not just the leader
+    scheduler.add_job(
+        progress_buffer.flush, "interval", seconds=5, max_instances=1, coalesce=True
+    )
     scheduler.start()
+    startup.mark_ready()
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    scheduler.shutdown()
+    # Normally already done by the preStop hook; a plain SIGTERM drains here
+    await drain_replica()
+    health_monitor.stop()
+    clusters.stop()
+    await sandbox_proxy.close()
+    if bootstrap_task is not None:
+        bootstrap_task.cancel()
+    if scheduler.running:
+        scheduler.shutdown()
+    if startup.ready:
+        progress_buffer.flush()
+    await asyncio.to_thread(leader.resign)
 
 
 # --- Endpoints ---
 
 @app.get("/healthz")
 def healthz():
-    return {"status": "ok"}
+    return {
+        "status": "ok",
+        "ready": startup.ready,
+        "replica": leader.identity,
+        "leader": leader.is_leader,
+        "startup_ms": startup.phases,
+    }
+
+
+async def drain_replica():
+    return await drain_controller.drain(
+        close_shells=websocket_shell.close_all_shells,
+        # Recording writers finish once their shells are closed
+        wait_for=bulk_ops.running_tasks() + websocket_shell.recording_store.writer_tasks(),
+        on_abandon=lambda ops: expiry_controller.release_provisioning(
+            [key for kind, key in ops if kind == "provision"]
+        ),
+    )
+
+
+@app.post("/internal/drain", include_in_schema=False)
+async def internal_drain(request: Request):
+    """Called by the pod's preStop hook: drains before SIGTERM closes the listener."""
+    if request.client is None or request.client.host not in ("127.0.0.1", "::1"):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return await drain_replica()
+
+
+def reject_if_draining():
+    if drain_controller.draining:
+        raise HTTPException(
+            status_code=503,
+            detail="This server is restarting, please retry",
+            headers={"Retry-After": "2"},
+        )
+
+
+@app.get("/livez")
+def livez():
+    """Liveness: only fails if this process is wedged and needs a restart."""
+    result = health_monitor.liveness()
+    return ORJSONResponse(result, status_code=200 if result["alive"] else 503)
+
+
+@app.get("/readyz")
+def readyz():
+    """Readiness from cached dependency probes; never touches the DB or API server itself."""
+    result = health_monitor.readiness()
+    return ORJSONResponse(result, status_code=200 if result["ready"] else 503)
 
 
 @app.get("/users/me")
@@ -230,6 +557,8 @@ def list_labs(
     persona: Optional[str] = None,
     db: Session = Depends(get_db),
 ):
+    if catalog_cache.loaded:
+        return catalog_cache.labs(category, persona)
     query = db.query(models.LabDB)
     if category:
         query = query.filter(models.LabDB.category == category)
@@ -241,25 +570,32 @@ def list_labs(
 
 @app.get("/labs/{lab_id}", response_model=models.Lab)
 def get_lab(lab_id: str, db: Session = Depends(get_db)):
+    cached = catalog_cache.lab(lab_id)
+    if cached is not None:
+        return cached
     lab = db.query(models.LabDB).filter(models.LabDB.id == lab_id).first()
     if not lab:
         raise HTTPException(status_code=404, detail="Lab not found")
     return lab
 
 
-@app.post("/sessions", response_model=models.UserSession)
+@app.post(
+    "/sessions", response_model=models.UserSession, dependencies=[rate_limited("provision")]
+)
 async def create_session(
     session_req: models.SessionCreate,
     user_id: str = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    # Check concurrent sessions (Max 5 for cluster)
+    reject_if_draining()
+
+    # Check concurrent sessions (cluster-wide cap)
     active_count = (
         db.query(models.UserSessionDB)
         .filter(models.UserSessionDB.status == "active")
         .count()
     )
-    if active_count >= 5:
+    if active_count >= MAX_CONCURRENT_SESSIONS:
         raise HTTPException(
             status_code=429, detail="Maximum concurrent playground sessions reached"
         )
@@ -283,54 +619,112 @@ async def create_session(
     if not lab:
         raise HTTPException(status_code=404, detail="Lab not found")
 
-    # K8s Orchestration
-    session_uuid = str(uuid.uuid4())[:8]
-    
-    # Sanitize user_id for Kubernetes Namespace (RFC 1123 DNS Label)
-    # Replace dots and @ with hyphens, convert to lowercase
-    sanitized_user_id = user_id.lower().replace(".", "-").replace("@", "-")
-    # Ensure it starts/ends with alphanumeric (should be handled if user_id is reasonable)
-    
-    namespace = f"playground-{sanitized_user_id}-{session_uuid}"
+    # Seats reserved for a planned event are only open to sessions of its lab
+    held_for_others = await asyncio.to_thread(capacity_planner.held_for_others, db, lab.id)
+    if active_count + held_for_others >= MAX_CONCURRENT_SESSIONS:
+        raise HTTPException(
+            status_code=429, detail="The remaining sessions are reserved for a scheduled workshop"
+        )
 
-    try:
-        k8s_ops.create_sandbox_namespace(namespace, user_id)
-        k8s_ops.apply_quotas(namespace)
-        k8s_ops.setup_rbac(namespace, user_id)
-        # Pass original user_id for secret lookup
-        k8s_ops.deploy_toolbox(namespace, user_id)
-    except Exception as e:
-        logger.error(f"K8s provisioning failed: {e}")
-        # Only try delete if creation failed midway
+    session_uuid = str(uuid.uuid4())[:8]
+    # A sandbox pre-provisioned for a workshop only needs handing over
+    warm = await asyncio.to_thread(capacity_planner.claim, db, lab.id, user_id, session_uuid)
+    if warm:
+        cluster = clusters.get(warm.cluster)
+        namespace = warm.sandbox_namespace
+        first_step = "assign"
+    else:
         try:
-            k8s_ops.delete_sandbox_namespace(namespace)
-        except:
-            pass
-        raise HTTPException(status_code=500, detail="Failed to provision sandbox")
-
-    # DB Record
+            cluster = await asyncio.to_thread(clusters.place, db, lab, user_id)
+        except NoCapacityError:
+            raise HTTPException(
+                status_code=429, detail="No cluster has capacity for this lab right now"
+            )
+        namespace = sandbox_namespace_name(user_id, session_uuid)
+        first_step = "namespace"
+
+    # The row exists before the sandbox does, so an interrupted build can be resumed
     new_session = models.UserSessionDB(
         session_uuid=session_uuid,
         user_id=user_id,
         lab_id=lab.id,
         sandbox_namespace=namespace,
+        cluster=cluster.name,
         expires_at=datetime.utcnow() + timedelta(hours=8),
         status=models.SessionStatus.ACTIVE,
+        provisioning_step=first_step,
+        provisioning_owner=leader.identity,
     )
     db.add(new_session)
     db.commit()
     db.refresh(new_session)
+
+    session_id = new_session.id
+    pending = {**session_payload(new_session), "status": "provisioning"}
+
+    def on_step(step: str):
+        expiry_controller.record_provisioning_step(session_id, step, leader.identity)
+        event_bus.publish("provisioning", {**pending, "step": step})
+
+    restored_id = None
+    async with drain_controller.track("provision", session_uuid):
+        try:
+            await asyncio.to_thread(
+                cluster.ops.provision_sandbox,
+                namespace,
+                user_id,
+                on_step=on_step,
+                start_at=first_step if warm else None,
+            )
+        except Exception as e:
+            logger.error("K8s provisioning failed: %s", e)
+            # Conditional: a session ended meanwhile keeps its final status
+            if await asyncio.to_thread(
+                expiry_controller.finish_provisioning, session_id, models.SessionStatus.ERROR
+            ):
+                event_bus.publish("failed", {**pending, "status": "error"})
+            raise HTTPException(status_code=500, detail="Failed to provision sandbox")
+
+        # Pick up where the learner left off in their last sandbox for this lab
+        if session_req.restore and snapshot_store.enabled:
+            event_bus.publish("provisioning", {**pending, "step": "restore"})
+            try:
+                restored = await snapshot_store.restore_latest(cluster.ops, namespace, user_id, lab.id)
+            except Exception as e:
+                logger.warning("Restoring snapshot into %s failed: %s", namespace, e)
+                restored = None
+            if restored:
+                restored_id = restored[0]
+
+    finished = await asyncio.to_thread(
+        expiry_controller.finish_provisioning, session_id, restored_snapshot_id=restored_id
+    )
+    db.refresh(new_session)
+    if not finished:
+        raise HTTPException(status_code=409, detail="Session was ended while it was being provisioned")
+    event_bus.publish("created", session_payload(new_session))
+    await asyncio.to_thread(analytics.record_started, lab.id)
     return new_session
 
 
-@app.get("/sessions/me", response_model=List[models.UserSession])
-def get_my_sessions(
-    user_id: str = Depends(get_current_user), db: Session = Depends(get_db)
-):
-    return (
-        db.query(models.UserSessionDB)
-        .filter(models.UserSessionDB.user_id == user_id)
-        .all()
+def load_user_sessions(user_id: str) -> List[models.UserSession]:
+    db = SessionLocal()
+    try:
+        sessions = db.query(models.UserSessionDB).filter(models.UserSessionDB.user_id == user_id).all()
+        return [models.UserSession.model_validate(s) for s in sessions]
+    finally:
+        db.close()
+
+
+@app.get(
+    "/sessions/me",
+    response_model=List[models.UserSession],
+    dependencies=[Depends(require_ready), rate_limited("read")],
+)
+async def get_my_sessions(user_id: str = Depends(get_current_user)):
+    # Several tabs polling at once share one query
+    return await single_flight.do(
+        ("sessions/me", user_id), lambda: asyncio.to_thread(load_user_sessions, user_id)
     )
 
 
@@ -351,17 +745,93 @@ async def end_session(
 
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
+    # Already ended: nothing to snapshot or tear down here
+    if session.status != models.SessionStatus.ACTIVE:
+        raise HTTPException(status_code=409, detail="Session is not active")
+    # Deleting the namespace now would race the build still creating it
+    if session.provisioning_step is not None:
+        raise HTTPException(status_code=409, detail="Session is still being provisioned")
 
     try:
-        k8s_ops.delete_sandbox_namespace(session.sandbox_namespace)
+        async with drain_controller.track("teardown", session_uuid):
+            ops = clusters.ops(session.cluster)
+            await snapshot_store.save(
+                ops, session.sandbox_namespace, user_id, session.lab_id, session_uuid
+            )
+            await asyncio.to_thread(ops.delete_sandbox_namespace, session.sandbox_namespace)
     except Exception:
         pass  # Best effort cleanup
 
-    session.status = models.SessionStatus.TERMINATED
-    db.commit()
+    if mark_ended(db, session, models.SessionStatus.TERMINATED):
+        event_bus.publish("terminated", session_payload(session))
+        await asyncio.to_thread(analytics.record_ended, session.lab_id, session.start_time)
     return {"message": "Session terminated"}
 
 
+def mark_ended(db: Session, session: models.UserSessionDB, status: models.SessionStatus) -> bool:
+    """Moves an active session to `status`; False if someone else ended it first.
+
+    Teardown takes a while, and a second DELETE, a bulk terminate or the
+    expiry sweep may finish it meanwhile; only the winner publishes the event
+    and counts the session as ended.
+    """
+    ended = (
+        db.query(models.UserSessionDB)
+        .filter(
+            models.UserSessionDB.id == session.id,
+            models.UserSessionDB.status == models.SessionStatus.ACTIVE,
+        )
+        .update({"status": status}, synchronize_session=False)
+    )
+    db.commit()  # Expires `session`, so the payload reloads the current status
+    return ended == 1
+
+
+@app.post("/sessions/{session_uuid}/snapshot", dependencies=[rate_limited("snapshot")])
+async def snapshot_session(
+    session_uuid: str,
+    user_id: str = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Saves the sandbox now, e.g. before pausing a lab; ending a session also saves it."""
+    session = get_user_session(db, session_uuid, user_id)
+    if session.status != models.SessionStatus.ACTIVE:
+        raise HTTPException(status_code=409, detail="Session is not active")
+    if not snapshot_store.enabled:
+        raise HTTPException(status_code=404, detail="Snapshots are disabled")
+    try:
+        return await asyncio.to_thread(
+            snapshot_store.capture,
+            clusters.ops(session.cluster),
+            session.sandbox_namespace,
+            user_id,
+            session.lab_id,
+            session_uuid,
+        )
+    except Exception as e:
+        logger.error("Snapshot of %s failed: %s", session.sandbox_namespace, e)
+        raise HTTPException(status_code=500, detail="Failed to snapshot sandbox")
+
+
+@app.get(
+    "/snapshots/me",
+    response_model=List[models.SandboxSnapshot],
+    dependencies=[rate_limited("read")],
+)
+def list_my_snapshots(user_id: str = Depends(get_current_user), db: Session = Depends(get_db)):
+    return snapshot_store.list_for_user(db, user_id)
+
+
+@app.delete("/snapshots/me/{lab_id}")
+def discard_my_snapshot(
+    lab_id: str, user_id: str = Depends(get_current_user), db: Session = Depends(get_db)
+):
+    """Forgets the saved sandbox so the next session of the lab starts fresh."""
+    if not snapshot_store.discard(db, user_id, lab_id):
+        raise HTTPException(status_code=404, detail="No snapshot for this lab")
+    return {"message": "Snapshot discarded"}
+
+
 @app.post("/sessions/{session_uuid}/extend")
 def extend_session(
     session_uuid: str,
@@ -382,10 +852,11 @@ def extend_session(
 
     session.expires_at += timedelta(hours=1)
     db.commit()
+    event_bus.publish("extended", session_payload(session))
     return {"message": "Session extended", "new_expiry": session.expires_at}
 
 
-@app.post("/sessions/{session_uuid}/apply-manifest")
+@app.post("/sessions/{session_uuid}/apply-manifest", dependencies=[rate_limited("manifest")])
 async def apply_manifest(
     session_uuid: str,
     manifest_req: models.ManifestRequest,
@@ -404,15 +875,35 @@ async def apply_manifest(
         raise HTTPException(status_code=404, detail="Session not found")
 
     try:
-        k8s_ops.apply_manifest(session.sandbox_namespace, manifest_req.manifest)
+        await asyncio.to_thread(
+            clusters.ops(session.cluster).apply_manifest, session.sandbox_namespace, manifest_req.manifest
+        )
     except Exception as e:
-        logger.error(f"Failed to apply manifest: {e}")
+        logger.error("Failed to apply manifest: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
     return {"message": "Manifest applied successfully"}
 
 
-@app.post("/sessions/{session_uuid}/delete-manifest")
+@app.post(
+    "/sessions/{session_uuid}/validate-manifest",
+    response_model=models.ManifestValidation,
+    dependencies=[rate_limited("manifest")],
+)
+async def validate_manifest(
+    session_uuid: str,
+    manifest_req: models.ManifestRequest,
+    user_id: str = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Checks a manifest and previews its effect on live objects without applying it."""
+    session = get_user_session(db, session_uuid, user_id)
+    return await asyncio.to_thread(
+        manifest_validators[clusters.get(session.cluster).name].validate, session.sandbox_namespace, manifest_req.manifest
+    )
+
+
+@app.post("/sessions/{session_uuid}/delete-manifest", dependencies=[rate_limited("manifest")])
 async def delete_manifest(
     session_uuid: str,
     manifest_req: models.ManifestRequest,
@@ -431,23 +922,445 @@ async def delete_manifest(
         raise HTTPException(status_code=404, detail="Session not found")
 
     try:
-        k8s_ops.delete_manifest(session.sandbox_namespace, manifest_req.manifest)
+        await asyncio.to_thread(
+            clusters.ops(session.cluster).delete_manifest, session.sandbox_namespace, manifest_req.manifest
+        )
     except Exception as e:
-        logger.error(f"Failed to delete manifest: {e}")
+        logger.error("Failed to delete manifest: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
     return {"message": "Manifest deleted successfully"}
 
 
+active_log_streams = 0
+
+
+def reserve_log_stream():
+    """Takes a log stream slot, or answers 503 when all are in use.
+
+    Checks and takes the slot without awaiting in between, so concurrent
+    requests can't all pass the check.
+    """
+    global active_log_streams
+    if active_log_streams >= LOG_STREAM_MAX:
+        raise HTTPException(
+            status_code=503, detail="Too many log streams, try again shortly", headers={"Retry-After": "5"}
+        )
+    active_log_streams += 1
+    released = False
+
+    def release():
+        global active_log_streams
+        nonlocal released
+        if not released:
+            released = True
+            active_log_streams -= 1
+
+    return release
+
+
+@app.get("/sessions/{session_uuid}/logs", dependencies=[rate_limited("logs")])
+async def stream_logs(
+    session_uuid: str,
+    request: Request,
+    pod: Optional[List[str]] = Query(None),
+    container: Optional[str] = None,
+    selector: Optional[str] = None,
+    tail: int = Query(100, ge=0, le=5000),
+    since_seconds: Optional[int] = Query(None, ge=1),
+    user_id: str = Depends(get_current_user),
+):
+    """Follows pod logs in the sandbox as server-sent events.
+
+    Without `pod` every pod (optionally matching the label `selector`) is
+    followed; with several containers, each is a separate source prefixed
+    `pod/container`. Unlike `kubectl logs -f` in the web shell, this reads
+    the Kubernetes API directly and takes no shell slot.
+    """
+    reject_if_draining()
+    # Not Depends(get_db): that connection would be held until the stream ends
+    db = SessionLocal()
+    try:
+        session = get_user_session(db, session_uuid, user_id)
+    finally:
+        db.close()
+    if session.status != models.SessionStatus.ACTIVE:
+        raise HTTPException(status_code=409, detail="Session is not active")
+    release_slot = reserve_log_stream()
+    try:
+        ops = clusters.ops(session.cluster)
+        namespace = session.sandbox_namespace
+        pods = await asyncio.to_thread(ops.list_pod_containers, namespace, selector)
+        if pod:
+            missing = [p for p in pod if p not in pods]
+            if missing:
+                raise HTTPException(status_code=404, detail=f"Pod(s) not found: {', '.join(missing)}")
+            pods = {p: pods[p] for p in pod}
+
+        sources = []
+        for name, containers in sorted(pods.items()):
+            if container is not None:
+                if container in containers:
+                    sources.append((name, container))
+            elif len(containers) == 1:
+                sources.append((name, None))
+            else:
+                sources.extend((name, c) for c in containers)
+        if not sources:
+            raise HTTPException(status_code=404, detail="No matching pods or containers")
+        if len(sources) > LOG_STREAM_MAX_SOURCES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"{len(sources)} containers match; narrow with pod, container or selector "
+                f"(at most {LOG_STREAM_MAX_SOURCES})",
+            )
+
+        mux = LogMultiplexer(
+            ops,
+            namespace,
+            sources,
+            tail_lines=tail,
+            since_seconds=since_seconds,
+            max_buffered_lines=LOG_STREAM_BUFFER_LINES,
+        )
+    except BaseException:
+        release_slot()
+        raise
+
+    async def stream():
+        try:
+            yield f"event: sources\ndata: {to_json({'sources': list(mux.sources)})}\n\n"
+            async for batch in mux.lines():
+                if await request.is_disconnected() or drain_controller.draining:
+                    break
+                if not batch:
+                    yield ": keepalive\n\n"
+                    continue
+                lines = [{"source": s, "line": l} for s, l in batch if l is not None]
+                ended = [s for s, l in batch if l is None]
+                if lines:
+                    yield f"event: logs\ndata: {to_json({'lines': lines})}\n\n"
+                for source in ended:
+                    yield f"event: end\ndata: {to_json({'source': source})}\n\n"
+        finally:
+            mux.close()
+            release_slot()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Also frees the slot if the client left before the stream started
+        background=BackgroundTask(release_slot),
+    )
+
+
+def lookup_proxy_session(session_uuid: str, user_id: str):
+    db = SessionLocal()
+    try:
+        return (
+            db.query(models.UserSessionDB.sandbox_namespace, models.UserSessionDB.cluster)
+            .filter(
+                models.UserSessionDB.session_uuid == session_uuid,
+                models.UserSessionDB.user_id == user_id,
+                models.UserSessionDB.status == models.SessionStatus.ACTIVE,
+            )
+            .first()
+        )
+    finally:
+        db.close()
+
+
+async def resolve_proxy_target(session_uuid: str, user_id: str, service: str):
+    """(namespace, cluster) of the user's active session, or None."""
+    if not SERVICE_NAME.match(service):
+        return None
+    cached = sandbox_proxy.cached_session(session_uuid, user_id)
+    if cached is not None:
+        return cached
+    row = await asyncio.to_thread(lookup_proxy_session, session_uuid, user_id)
+    if row is None:
+        return None
+    sandbox_proxy.remember_session(session_uuid, user_id, row.sandbox_namespace, row.cluster)
+    return row.sandbox_namespace, row.cluster
+
+
+PROXY_PATH = "/sessions/{session_uuid}/proxy/{service}/{port}"
+PROXY_METHODS = ["GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"]
+
+
+@app.get(PROXY_PATH, include_in_schema=False)
+def proxy_root(session_uuid: str, service: str, port: int = Path(ge=1, le=65535)):
+    # Apps resolve relative links against the trailing slash
+    return RedirectResponse(f"/sessions/{session_uuid}/proxy/{service}/{port}/")
+
+
+@app.api_route(PROXY_PATH + "/{path:path}", methods=PROXY_METHODS)
+async def proxy_http(
+    session_uuid: str,
+    service: str,
+    path: str,
+    request: Request,
+    port: int = Path(ge=1, le=65535),
+    user_id: str = Depends(get_current_user),
+):
+    """Reverse proxies HTTP to a Service in the session's sandbox.
+
+    Request and response bodies are streamed, not buffered; the upstream
+    connection comes from a pooled client and is held until the response
+    body is sent.
+    """
+    if not startup.ready:
+        raise HTTPException(status_code=503, detail="Service is starting", headers={"Retry-After": "2"})
+    target = await resolve_proxy_target(session_uuid, user_id, service)
+    if target is None:
+        raise HTTPException(status_code=404, detail="Session not found or inactive")
+    namespace, cluster_name = target
+    cluster = clusters.get(cluster_name)
+    prefix = f"/sessions/{session_uuid}/proxy/{service}/{port}"
+
+    try:
+        sandbox_proxy.acquire(session_uuid)
+    except ProxyLimitError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+
+    client = sandbox_proxy.client(cluster)
+    has_body = "content-length" in request.headers or "transfer-encoding" in request.headers
+    upstream_request = client.build_request(
+        request.method,
+        sandbox_proxy.upstream_url(cluster, namespace, service, port, path),
+        params=request.url.query,
+        headers=forward_headers(request.headers, prefix) + sandbox_proxy.upstream_headers(cluster),
+        content=request.stream() if has_body else None,
+    )
+    try:
+        upstream = await client.send(upstream_request, stream=True)
+    except httpx.HTTPError as e:
+        sandbox_proxy.release(session_uuid)
+        logger.info("Proxy to %s:%s in %s failed: %s", service, port, namespace, e)
+        raise HTTPException(status_code=502, detail=f"Service {service}:{port} is not reachable")
+
+    async def finish():
+        await upstream.aclose()
+        sandbox_proxy.release(session_uuid)
+
+    response = StreamingResponse(
+        upstream.aiter_raw(), status_code=upstream.status_code, background=BackgroundTask(finish)
+    )
+    # Raw headers keep repeated ones (Set-Cookie) and the upstream encoding as is
+    response.raw_headers = [
+        (name.encode("latin-1"), value.encode("latin-1"))
+        for name, value in response_headers(upstream.headers, prefix)
+    ]
+    return response
+
+
+@app.websocket(PROXY_PATH + "/{path:path}")
+async def proxy_websocket(websocket: WebSocket, session_uuid: str, service: str, port: int, path: str):
+    try:
+        user_id = await get_current_user(websocket, None)
+    except HTTPException:
+        await websocket.close(code=4001, reason="Authentication required")
+        return
+    target = await resolve_proxy_target(session_uuid, user_id, service)
+    if target is None or not 1 <= port <= 65535:
+        await websocket.close(code=4004, reason="Session not found or inactive")
+        return
+    namespace, cluster_name = target
+    cluster = clusters.get(cluster_name)
+    prefix = f"/sessions/{session_uuid}/proxy/{service}/{port}"
+
+    try:
+        sandbox_proxy.acquire(session_uuid)
+    except ProxyLimitError:
+        await websocket.close(code=1013, reason="Too many proxied connections")
+        return
+    try:
+        url = sandbox_proxy.upstream_url(cluster, namespace, service, port, path)
+        if websocket.url.query:
+            url += f"?{websocket.url.query}"
+        await sandbox_proxy.relay_websocket(websocket, cluster, url, forward_headers(websocket.headers, prefix))
+    finally:
+        sandbox_proxy.release(session_uuid)
+
+
 # --- Admin APIs ---
 
 
-@app.get("/admin/sessions", response_model=List[models.UserSession])
-def admin_list_sessions(status: Optional[str] = None, db: Session = Depends(get_db)):
-    query = db.query(models.UserSessionDB)
+SESSION_FIELDS = [f for f in models.UserSession.model_fields if f != "created_at"]
+
+
+def query_sessions(
+    db: Session,
+    status: Optional[str] = None,
+    lab_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    started_after: Optional[datetime] = None,
+    started_before: Optional[datetime] = None,
+    sort: str = "start_time",
+    order: str = "desc",
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    changed_since: Optional[str] = None,
+    fields: Optional[List[str]] = None,
+):
+    """Keyset-paginated, filtered and projected session listing.
+
+    With `changed_since` the status filter is ignored, so a delta sync also
+    reports sessions that have left the statuses it was listing.
+
+    Raises ValueError for unknown fields, statuses, malformed cursors or a
+    cursor replayed under a different sort.
+    """
+    Row = models.UserSessionDB
+
+    selected = fields or SESSION_FIELDS
+    unknown = set(selected) - set(SESSION_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+
+    # Delta sync walks the updated_at index in ascending order
+    if changed_since:
+        sort, order, cursor = "updated_at", "asc", changed_since
+
+    sort_column = getattr(Row, sort)
+    descending = order == "desc"
+    # Keyset columns are always fetched so cursors can be built from the last row
+    columns = list(dict.fromkeys(["id", sort, *selected]))
+    query = db.query(*(getattr(Row, c) for c in columns))
+
     if status:
-        query = query.filter(models.UserSessionDB.status == status)
-    return query.all()
+        statuses = [models.SessionStatus(s.strip()) for s in status.split(",")]
+        if not changed_since:
+            query = query.filter(Row.status.in_(statuses))
+    if lab_id:
+        query = query.filter(Row.lab_id == lab_id)
+    if user_id:
+        query = query.filter(Row.user_id == user_id)
+    if started_after:
+        query = query.filter(Row.start_time >= started_after)
+    if started_before:
+        query = query.filter(Row.start_time <= started_before)
+    if cursor:
+        query = query.filter(after_cursor(sort_column, Row.id, cursor, descending))
+
+    if descending:
+        query = query.order_by(sort_column.desc(), Row.id.desc())
+    else:
+        query = query.order_by(sort_column.asc(), Row.id.asc())
+
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    items = [{c: getattr(r, c) for c in selected} for r in rows]
+
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(sort, getattr(rows[-1], sort), rows[-1].id)
+
+    if changed_since:
+        sync_cursor = (
+            encode_cursor("updated_at", rows[-1].updated_at, rows[-1].id) if rows else changed_since
+        )
+    elif not cursor:
+        # First page of a listing: hand out the current high-water mark for deltas
+        latest = db.query(Row.updated_at, Row.id).order_by(
+            Row.updated_at.desc(), Row.id.desc()
+        ).first()
+        sync_cursor = encode_cursor("updated_at", latest.updated_at, latest.id) if latest else None
+    else:
+        sync_cursor = None
+
+    return {"items": items, "next_cursor": next_cursor, "sync_cursor": sync_cursor}
+
+
+@app.get("/admin/sessions", response_model=models.SessionPage)
+def admin_list_sessions(
+    status: Optional[str] = Query(None, description="Comma separated statuses"),
+    lab_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    started_after: Optional[datetime] = None,
+    started_before: Optional[datetime] = None,
+    sort: Literal["start_time", "expires_at", "updated_at", "id"] = "start_time",
+    order: Literal["asc", "desc"] = "desc",
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    changed_since: Optional[str] = Query(
+        None,
+        description="sync_cursor from a previous page; returns only changed sessions, whatever their status",
+    ),
+    fields: Optional[str] = Query(None, description="Comma separated fields to return"),
+    db: Session = Depends(get_db),
+):
+    try:
+        # Items are already plain column values; serialize them as-is
+        page = query_sessions(
+            db,
+            status=status,
+            lab_id=lab_id,
+            user_id=user_id,
+            started_after=started_after,
+            started_before=started_before,
+            sort=sort,
+            order=order,
+            limit=limit,
+            cursor=cursor,
+            changed_since=changed_since,
+            fields=[f.strip() for f in fields.split(",") if f.strip()] if fields else None,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return ORJSONResponse(page)
+
+
+def build_admin_snapshot():
+    """Initial state for /admin/events: all active sessions plus recent history."""
+    db = SessionLocal()
+    try:
+        fields = list(SESSION_EVENT_FIELDS)
+        active = query_sessions(db, status="active", fields=fields, limit=500)
+        recent = query_sessions(db, fields=fields, limit=100)
+        sessions = {s["session_uuid"]: s for s in recent["items"]}
+        sessions.update({s["session_uuid"]: s for s in active["items"]})
+        return {
+            "sessions": list(sessions.values()),
+            "next_cursor": recent["next_cursor"],
+            "sync_cursor": recent["sync_cursor"],
+            "stats": compute_admin_stats(db),
+        }
+    finally:
+        db.close()
+
+
+@app.get("/admin/events")
+async def admin_events(request: Request):
+    """Server-sent snapshot followed by coalesced session lifecycle deltas."""
+    # Subscribe before taking the snapshot so nothing published in between is lost
+    subscription = event_bus.subscribe()
+
+    async def stream():
+        try:
+            snapshot = await asyncio.to_thread(build_admin_snapshot)
+            yield f"event: snapshot\ndata: {to_json(snapshot)}\n\n"
+            async for batch in subscription.batches():
+                if await request.is_disconnected():
+                    break
+                if subscription.needs_resync:
+                    subscription.needs_resync = False
+                    snapshot = await asyncio.to_thread(build_admin_snapshot)
+                    yield f"event: snapshot\ndata: {to_json(snapshot)}\n\n"
+                elif batch:
+                    yield f"event: delta\ndata: {to_json({'events': batch})}\n\n"
+                else:
+                    yield ": keepalive\n\n"
+        finally:
+            event_bus.unsubscribe(subscription)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.delete("/admin/sessions/{session_uuid}")
@@ -459,28 +1372,193 @@ async def admin_terminate_session(session_uuid: str, db: Session = Depends(get_d
     )
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
-
-    k8s_ops.delete_sandbox_namespace(session.sandbox_namespace)
-    session.status = models.SessionStatus.TERMINATED
-    db.commit()
+    if session.status != models.SessionStatus.ACTIVE:
+        raise HTTPException(status_code=409, detail="Session is not active")
+    if session.provisioning_step is not None:
+        raise HTTPException(status_code=409, detail="Session is still being provisioned")
+
+    async with drain_controller.track("teardown", session_uuid):
+        ops = clusters.ops(session.cluster)
+        await snapshot_store.save(
+            ops, session.sandbox_namespace, session.user_id, session.lab_id, session_uuid
+        )
+        await asyncio.to_thread(ops.delete_sandbox_namespace, session.sandbox_namespace)
+    if mark_ended(db, session, models.SessionStatus.TERMINATED):
+        event_bus.publish("terminated", session_payload(session))
+        await asyncio.to_thread(analytics.record_ended, session.lab_id, session.start_time)
     return {"message": "Admin terminated session"}
 
 
-@app.get("/admin/stats")
-def admin_stats(db: Session = Depends(get_db)):
+def require_criteria(session_filter: models.BulkSessionFilter):
+    # An admin UI with nothing selected sends an empty filter
+    if not session_filter.has_criteria():
+        raise HTTPException(
+            status_code=400, detail="The filter must set at least one non-empty criterion"
+        )
+
+
+@app.post("/admin/sessions/bulk/terminate", response_model=models.BulkJob)
+async def admin_bulk_terminate(req: models.BulkTerminateRequest):
+    require_criteria(req.filter)
+    reject_if_draining()
+    return (await bulk_ops.terminate(req.filter)).job
+
+
+@app.post("/admin/sessions/bulk/extend", response_model=models.BulkJob)
+async def admin_bulk_extend(req: models.BulkExtendRequest):
+    require_criteria(req.filter)
+    return (await bulk_ops.extend(req.filter, req.hours)).job
+
+
+@app.post("/admin/sessions/bulk/provision", response_model=models.BulkJob)
+async def admin_bulk_provision(req: models.BulkProvisionRequest, db: Session = Depends(get_db)):
+    reject_if_draining()
+    lab = db.query(models.LabDB).filter(models.LabDB.id == req.lab_id).first()
+    if not lab:
+        raise HTTPException(status_code=404, detail="Lab not found")
+    return (await bulk_ops.provision(lab.id, req.user_ids)).job
+
+
+@app.get("/admin/jobs/{job_id}", response_model=models.BulkJob)
+def admin_get_job(job_id: str):
+    # Jobs are stored in the DB, so any replica can answer
+    job = bulk_ops.load_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.get("/admin/jobs/{job_id}/results")
+def admin_stream_job_results(job_id: str):
+    results = bulk_ops.stream_results(job_id)
+    if results is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return StreamingResponse(results, media_type="application/x-ndjson")
+
+
+def compute_admin_stats(db: Session):
+    # Active sessions are a small indexed set; everything historical comes
+    # from the pre-aggregated rollups
     active = (
         db.query(models.UserSessionDB)
         .filter(models.UserSessionDB.status == "active")
         .count()
     )
-    total = db.query(models.UserSessionDB).count()
     return {
         "active_sessions": active,
-        "total_sessions_all_time": total,
-        "cluster_utilization_pct": (active / 5.0) * 100,
+        "cluster_utilization_pct": (active / MAX_CONCURRENT_SESSIONS) * 100,
+        "max_concurrent_sessions": MAX_CONCURRENT_SESSIONS,
+        **analytics.stats(db),
+    }
+
+
+@app.get("/admin/stats", response_model=models.AdminSessionStats)
+def admin_stats(db: Session = Depends(get_db)):
+    return compute_admin_stats(db)
+
+
+@app.get("/admin/k8s-client")
+def admin_k8s_client_metrics():
+    """Rate limiting, retry and circuit breaker counters for Kubernetes API calls, per cluster."""
+    return {c.name: c.ops.api_client.metrics() for c in clusters}
+
+
+@app.get("/admin/rate-limits")
+def admin_rate_limits():
+    """Configured limits, rejections per route class and coalesced reads on this replica."""
+    return {**rate_limiter.stats(), "coalesced_reads": single_flight.coalesced}
+
+
+@app.get("/admin/logging")
+def admin_logging():
+    """Log pipeline backlog, records dropped on a full queue and records sampled out."""
+    sampler = log_handler.filters[0]
+    return {
+        "queued": log_handler.queue.qsize(),
+        "dropped": log_handler.dropped,
+        "sampled_out": sampler.suppressed,
+        "sample_burst": sampler.burst,
+        "sample_interval_seconds": sampler.interval,
     }
 
 
+@app.get("/admin/clusters")
+def admin_clusters(db: Session = Depends(get_db)):
+    """Registered clusters with their capacity, committed sessions and health."""
+    return clusters.status(db)
+
+
+@app.get("/admin/planned-events/suggestion", response_model=models.DemandSuggestion)
+def admin_suggest_reservation(
+    lab_id: str,
+    expected_attendees: int = Query(ge=1, le=1000),
+    starts_at: Optional[datetime] = None,
+    db: Session = Depends(get_db),
+):
+    """Seats to reserve and sandboxes to pre-provision, learned from past events of the lab."""
+    return capacity_planner.suggest(db, lab_id, expected_attendees, starts_at or datetime.utcnow())
+
+
+@app.post("/admin/planned-events", response_model=models.PlannedEvent, status_code=201)
+def admin_create_planned_event(req: models.PlannedEventCreate, db: Session = Depends(get_db)):
+    if not db.query(models.LabDB).filter(models.LabDB.id == req.lab_id).first():
+        raise HTTPException(status_code=404, detail="Lab not found")
+    try:
+        event = capacity_planner.create(db, req)
+    except OverbookedError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return capacity_planner.describe(db, [event])[0]
+
+
+@app.get("/admin/planned-events", response_model=List[models.PlannedEvent])
+def admin_list_planned_events(include_closed: bool = False, db: Session = Depends(get_db)):
+    query = db.query(models.PlannedEventDB)
+    if not include_closed:
+        query = query.filter(models.PlannedEventDB.closed_at.is_(None))
+    return capacity_planner.describe(db, query.order_by(models.PlannedEventDB.starts_at).all())
+
+
+def get_planned_event(db: Session, event_id: int) -> models.PlannedEventDB:
+    event = db.query(models.PlannedEventDB).filter(models.PlannedEventDB.id == event_id).first()
+    if not event:
+        raise HTTPException(status_code=404, detail="Planned event not found")
+    return event
+
+
+@app.get("/admin/planned-events/{event_id}", response_model=models.PlannedEvent)
+def admin_get_planned_event(event_id: int, db: Session = Depends(get_db)):
+    return capacity_planner.describe(db, [get_planned_event(db, event_id)])[0]
+
+
+@app.delete("/admin/planned-events/{event_id}", response_model=models.PlannedEvent)
+def admin_cancel_planned_event(event_id: int, db: Session = Depends(get_db)):
+    """Frees the event's seats; unclaimed warm sandboxes are torn down within a minute."""
+    event = get_planned_event(db, event_id)
+    if not event.cancelled and not event.closed_at:
+        capacity_planner.cancel(db, event)
+    return capacity_planner.describe(db, [event])[0]
+
+
+@app.get("/admin/archive/export")
+async def admin_export_archive(
+    start: Optional[datetime] = None, end: Optional[datetime] = None
+):
+    """Downloads archived sessions started in [start, end) as a Parquet file."""
+    path = await asyncio.to_thread(archiver.export_parquet, start, end)
+
+    filename = "sessions-archive"
+    if start:
+        filename += f"-from-{start:%Y%m%d}"
+    if end:
+        filename += f"-to-{end:%Y%m%d}"
+    return FileResponse(
+        path,
+        media_type="application/vnd.apache.parquet",
+        filename=f"{filename}.parquet",
+        background=BackgroundTask(os.remove, path),
+    )
+
+
 @app.get("/admin/sessions/{session_uuid}/resources")
 def admin_get_session_resources(session_uuid: str, db: Session = Depends(get_db)):
     session = (
@@ -491,7 +1569,69 @@ def admin_get_session_resources(session_uuid: str, db: Session = Depends(get_db)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    return k8s_ops.list_resources(session.sandbox_namespace)
+    return clusters.ops(session.cluster).list_resources(session.sandbox_namespace)
+
+
+@app.put("/admin/sessions/{session_uuid}/recording")
+def admin_set_recording(
+    session_uuid: str, settings: models.RecordingSettings, db: Session = Depends(get_db)
+):
+    """Turns shell recording on or off for a session; applies to the next shell connection."""
+    session = (
+        db.query(models.UserSessionDB)
+        .filter(models.UserSessionDB.session_uuid == session_uuid)
+        .first()
+    )
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    session.record_shell = settings.enabled
+    db.commit()
+    return {"session_uuid": session_uuid, "recording": websocket_shell.recording_store.enabled_for(session)}
+
+
+@app.get("/admin/sessions/{session_uuid}/recordings", response_model=List[models.ShellRecording])
+def admin_list_recordings(session_uuid: str, db: Session = Depends(get_db)):
+    return (
+        db.query(models.ShellRecordingDB)
+        .filter(models.ShellRecordingDB.session_uuid == session_uuid)
+        .order_by(models.ShellRecordingDB.started_at)
+        .all()
+    )
+
+
+def get_recording(db: Session, recording_id: int) -> models.ShellRecordingDB:
+    recording = db.query(models.ShellRecordingDB).filter(models.ShellRecordingDB.id == recording_id).first()
+    if not recording:
+        raise HTTPException(status_code=404, detail="Recording not found")
+    return recording
+
+
+@app.get("/admin/recordings/{recording_id}/index", response_model=List[models.RecordingChunk])
+def admin_recording_index(recording_id: int, db: Session = Depends(get_db)):
+    """Chunk time ranges, for drawing a seek bar without downloading the recording."""
+    get_recording(db, recording_id)
+    return websocket_shell.recording_store.chunk_index(db, recording_id)
+
+
+@app.get("/admin/recordings/{recording_id}/play")
+def admin_play_recording(
+    recording_id: int,
+    start: float = Query(0.0, ge=0, description="Seconds into the recording to start from"),
+):
+    """Streams the recording as an asciicast v2 file, optionally from an offset."""
+    store = websocket_shell.recording_store
+    # The stream reads chunks with its own sessions; don't hold one for its whole length
+    db = SessionLocal()
+    try:
+        recording = get_recording(db, recording_id)
+        header = store.header(recording)
+    finally:
+        db.close()
+    return StreamingResponse(
+        store.stream(recording.id, recording.codec, header, start),
+        media_type="application/x-asciicast",
+        headers={"Content-Disposition": f'inline; filename="recording-{recording.id}.cast"'},
+    )
 
 
 @app.delete("/admin/sessions/{session_uuid}/resources/{kind}/{name}")
@@ -507,11 +1647,11 @@ def admin_delete_resource(
         raise HTTPException(status_code=404, detail="Session not found")
         
     try:
-        k8s_ops.delete_resource(session.sandbox_namespace, kind, name)
+        clusters.ops(session.cluster).delete_resource(session.sandbox_namespace, kind, name)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        logger.error(f"Failed to delete resource: {e}")
+        logger.error("Failed to delete resource: %s", e)
         raise HTTPException(status_code=500, detail="Failed to delete resource")
         
     return {"message": f"Deleted {kind} {name}"}
@@ -534,18 +1674,145 @@ def complete_session(
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
         
-    # Mark as completed in progress table
-    progress = models.LabProgressDB(
-        session_id=session.id,
-        step_completed=999, # Sentinel for completion
-        completed_at=datetime.utcnow()
-    )
-    db.add(progress)
-    db.commit()
-    
+    # Mark as completed in progress table (sentinel step); only the request that
+    # inserts the row counts the completion, whichever replica serves it
+    if progress_buffer.record_once(session.id, COMPLETION_STEP):
+        analytics.record_completed(session.lab_id)
+
     return {"message": "Lab marked as completed"}
 
 
+def get_user_session(db: Session, session_uuid: str, user_id: str):
+    session = (
+        db.query(models.UserSessionDB)
+        .filter(
+            models.UserSessionDB.session_uuid == session_uuid,
+            models.UserSessionDB.user_id == user_id,
+        )
+        .first()
+    )
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session
+
+
+def progress_view(session) -> models.LabProgress:
+    steps = progress_buffer.completed_steps(session.id)
+    return models.LabProgress(
+        session_uuid=session.session_uuid,
+        completed_steps=[s for s in steps if s != COMPLETION_STEP],
+        completed=COMPLETION_STEP in steps,
+    )
+
+
+def load_progress(session_uuid: str, user_id: str) -> models.LabProgress:
+    db = SessionLocal()
+    try:
+        return progress_view(get_user_session(db, session_uuid, user_id))
+    finally:
+        db.close()
+
+
+@app.get(
+    "/sessions/{session_uuid}/progress",
+    response_model=models.LabProgress,
+    dependencies=[Depends(require_ready), rate_limited("read")],
+)
+async def get_progress(session_uuid: str, user_id: str = Depends(get_current_user)):
+    return await single_flight.do(
+        ("progress", session_uuid, user_id),
+        lambda: asyncio.to_thread(load_progress, session_uuid, user_id),
+    )
+
+
+@app.post("/sessions/{session_uuid}/progress", response_model=models.LabProgress)
+def record_progress(
+    session_uuid: str,
+    update: models.LabProgressUpdate,
+    user_id: str = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    session = get_user_session(db, session_uuid, user_id)
+    if session.status != models.SessionStatus.ACTIVE:
+        raise HTTPException(status_code=409, detail="Session is not active")
+    steps = catalog_cache.step_numbers(session.lab_id)
+    if steps is None:
+        steps = {step["step"] for step in (session.lab.steps or [])}
+    if update.step_number not in steps:
+        raise HTTPException(status_code=400, detail="Invalid step number")
+
+    progress_buffer.record(session.id, update.step_number)
+    return progress_view(session)
+
+
+@app.post(
+    "/sessions/{session_uuid}/verify",
+    response_model=models.VerificationResult,
+    dependencies=[rate_limited("verify")],
+)
+async def verify_session(
+    session_uuid: str,
+    verify_req: Optional[models.VerifyRequest] = None,
+    user_id: str = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    session = get_user_session(db, session_uuid, user_id)
+    if session.status != models.SessionStatus.ACTIVE:
+        raise HTTPException(status_code=409, detail="Session is not active")
+
+    steps = session.lab.steps or []
+    if verify_req and verify_req.steps:
+        steps = [s for s in steps if s["step"] in verify_req.steps]
+
+    engine = verification_engines[clusters.get(session.cluster).name]
+    results = await engine.verify(session.sandbox_namespace, steps)
+    # Verified steps count as progress without the learner having to click through
+    for result in results:
+        if result["passed"]:
+            progress_buffer.record(session.id, result["step"])
+
+    return {"session_uuid": session_uuid, "steps": results}
+
+
+@app.get("/admin/labs/{lab_id}/verify", response_model=List[models.VerificationResult])
+async def admin_verify_lab(
+    lab_id: str, step: Optional[int] = None, db: Session = Depends(get_db)
+):
+    """Verifies every active session of a lab concurrently (e.g. during a workshop)."""
+    lab = db.query(models.LabDB).filter(models.LabDB.id == lab_id).first()
+    if not lab:
+        raise HTTPException(status_code=404, detail="Lab not found")
+
+    steps = [s for s in (lab.steps or []) if step is None or s["step"] == step]
+    sessions = (
+        db.query(
+            models.UserSessionDB.session_uuid,
+            models.UserSessionDB.sandbox_namespace,
+            models.UserSessionDB.cluster,
+        )
+        .filter(
+            models.UserSessionDB.lab_id == lab_id,
+            models.UserSessionDB.status == models.SessionStatus.ACTIVE,
+        )
+        .all()
+    )
+    by_cluster = {}
+    for s in sessions:
+        by_cluster.setdefault(clusters.get(s.cluster).name, {})[s.session_uuid] = (
+            s.sandbox_namespace,
+            steps,
+        )
+    results = {}
+    for partial in await asyncio.gather(
+        *(verification_engines[name].verify_many(targets) for name, targets in by_cluster.items())
+    ):
+        results.update(partial)
+    return [
+        {"session_uuid": session_uuid, "steps": step_results}
+        for session_uuid, step_results in results.items()
+    ]
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -0,0 +1,282 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import yaml
+
+from kubernetes_ops import KubernetesOps
+
+logger = logging.getLogger(__name__)
+
+# Fields the API server owns; they always differ and say nothing about the manifest
+IGNORED_PATHS = {
+    ("metadata", "managedFields"),
+    ("metadata", "resourceVersion"),
+    ("metadata", "generation"),
+    ("metadata", "uid"),
+    ("metadata", "creationTimestamp"),
+    ("metadata", "selfLink"),
+    ("metadata", "annotations", "kubectl.kubernetes.io/last-applied-configuration"),
+    ("status",),
+}
+
+MAX_SCHEMA_DEPTH = 32
+
+
+def format_path(path: Tuple) -> str:
+    out = ""
+    for part in path:
+        out += f"[{part}]" if isinstance(part, int) else (f".{part}" if out else str(part))
+    return out
+
+
+def diff_objects(old, new, path: Tuple = ()) -> List[Dict]:
+    """Field-level changes turning `old` into `new` (None means absent)."""
+    if path in IGNORED_PATHS:
+        return []
+    if isinstance(old, dict) and isinstance(new, dict):
+        changes = []
+        for key in sorted(set(old) | set(new), key=str):
+            changes.extend(diff_objects(old.get(key), new.get(key), path + (key,)))
+        return changes
+    if isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+        changes = []
+        for i, (a, b) in enumerate(zip(old, new)):
+            changes.extend(diff_objects(a, b, path + (i,)))
+        return changes
+    if old == new:
+        return []
+    op = "added" if old is None else "removed" if new is None else "changed"
+    return [{"path": format_path(path), "op": op, "old": old, "new": new}]
+
+
+class SchemaCache:
+    """The API server's OpenAPI v2 definitions, indexed by group/version/kind.
+
+    The document is several MB, so it is fetched once and reused until the TTL
+    expires (CRDs installed later show up on the next refresh).
+    """
+
+    def __init__(self, k8s_ops: KubernetesOps, ttl: float = 3600.0):
+        self.k8s_ops = k8s_ops
+        self.ttl = ttl
+        self._definitions: Dict[str, Dict] = {}
+        self._by_gvk: Dict[Tuple[str, str, str], str] = {}
+        self._fetched_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def get(self, api_version: str, kind: str) -> Tuple[Optional[Dict], bool]:
+        """Returns (schema, available); schema is None for unknown kinds."""
+        self._refresh()
+        if not self._definitions:
+            return None, False
+        group, _, version = api_version.rpartition("/")
+        name = self._by_gvk.get((group, version, kind))
+        return (self._definitions[name] if name else None), True
+
+    def resolve(self, schema: Dict) -> Dict:
+        while "$ref" in schema:
+            schema = self._definitions.get(schema["$ref"].rsplit("/", 1)[-1], {})
+        return schema
+
+    def _refresh(self):
+        with self._lock:
+            if self._fetched_at and time.monotonic() - self._fetched_at < self.ttl:
+                return
+            try:
+                document = self.k8s_ops.fetch_openapi_v2()
+            except Exception as e:
+                # Retry on the next call rather than hammering the API server
+                logger.warning("Could not fetch OpenAPI schema, skipping schema validation: %s", e)
+                self._fetched_at = time.monotonic() - self.ttl + 60
+                return
+            definitions = document.get("definitions", {})
+            by_gvk = {}
+            for name, definition in definitions.items():
+                for gvk in definition.get("x-kubernetes-group-version-kind", []):
+                    by_gvk[(gvk.get("group", ""), gvk["version"], gvk["kind"])] = name
+            self._definitions, self._by_gvk = definitions, by_gvk
+            self._fetched_at = time.monotonic()
+            logger.info("Loaded %s OpenAPI kinds from the API server", len(by_gvk))
+
+
+class ManifestValidator:
+    """Validates editor manifests without applying them.
+
+    Validation runs cheapest-first: local YAML parsing, then the cached OpenAPI
+    schemas, then a server-side dry-run whose result is diffed against the live
+    objects. Dry-run results are memoized by (namespace, manifest hash, live
+    resourceVersions), so re-validating unchanged content against an unchanged
+    namespace costs one GET per object.
+    """
+
+    def __init__(self, k8s_ops: KubernetesOps, max_entries: int = 500):
+        self.k8s_ops = k8s_ops
+        self.schemas = SchemaCache(k8s_ops)
+        self.max_entries = max_entries
+        self._results: "OrderedDict[Tuple, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def validate(self, namespace: str, manifest: str) -> Dict:
+        documents, errors = self._parse(manifest)
+        if errors:
+            return self._result(errors)
+
+        warnings = []
+        for index, doc in enumerate(documents):
+            self._check_document(index, doc, namespace, errors, warnings)
+        if errors:
+            return self._result(errors, warnings)
+
+        from kubernetes.client.rest import ApiException  # Off the import path, like the dynamic client
+
+        live = []
+        for doc in documents:
+            try:
+                live.append(
+                    self.k8s_ops.get_live_object(
+                        namespace, doc["apiVersion"], doc["kind"], doc["metadata"]["name"]
+                    )
+                )
+            except ApiException as e:
+                return self._result([self._error(None, "", f"Cannot read live object: {e.reason}")])
+
+        key = (
+            namespace,
+            hashlib.sha256(manifest.encode("utf-8")).hexdigest(),
+            tuple(((obj or {}).get("metadata") or {}).get("resourceVersion") for obj in live),
+        )
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None:
+                self._results.move_to_end(key)
+                return {**cached, "warnings": warnings, "cached": True}
+
+        try:
+            dry_run = self.k8s_ops.dry_run_manifest(namespace, manifest)
+        except Exception as e:
+            # Admission rejections aren't memoized: they depend on more than the objects
+            return self._result([self._error(None, "", str(e))], warnings)
+
+        objects = []
+        for doc, before, after in zip(documents, live, dry_run):
+            changes = diff_objects(before, after) if before else []
+            objects.append(
+                {
+                    "api_version": doc["apiVersion"],
+                    "kind": doc["kind"],
+                    "name": doc["metadata"]["name"],
+                    "action": "create" if before is None else "update" if changes else "unchanged",
+                    "changes": changes,
+                }
+            )
+
+        result = {"valid": True, "errors": [], "objects": objects}
+        with self._lock:
+            self._results[key] = result
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+        return {**result, "warnings": warnings, "cached": False}
+
+    # --- Local checks ---
+
+    def _parse(self, manifest: str):
+        try:
+            documents = [d for d in yaml.safe_load_all(manifest) if d is not None]
+        except yaml.YAMLError as e:
+            mark = getattr(e, "problem_mark", None)
+            problem = getattr(e, "problem", None) or str(e)
+            return [], [
+                self._error(None, "", f"YAML syntax error: {problem}", mark.line + 1 if mark else None)
+            ]
+        if not documents:
+            return [], [self._error(None, "", "Manifest is empty")]
+        return documents, []
+
+    def _check_document(self, index: int, doc, namespace: str, errors: List, warnings: List):
+        if not isinstance(doc, dict):
+            errors.append(self._error(index, "", "Document is not a mapping"))
+            return
+        found = len(errors)
+        for field in ("apiVersion", "kind"):
+            if not isinstance(doc.get(field), str):
+                errors.append(self._error(index, field, f"Missing required field {field}"))
+        metadata = doc.get("metadata")
+        if not isinstance(metadata, dict) or not metadata.get("name"):
+            errors.append(self._error(index, "metadata.name", "Missing required field metadata.name"))
+        elif metadata.get("namespace") not in (None, namespace):
+            errors.append(
+                self._error(
+                    index,
+                    "metadata.namespace",
+                    f"Namespace '{metadata['namespace']}' is outside your sandbox; remove it or use '{namespace}'",
+                )
+            )
+        if len(errors) > found:
+            return
+
+        schema, available = self.schemas.get(doc["apiVersion"], doc["kind"])
+        if not available:
+            warnings.append(self._error(index, "", "Schema validation unavailable"))
+        elif schema is None:
+            errors.append(
+                self._error(index, "kind", f"Unknown kind {doc['kind']} in {doc['apiVersion']}")
+            )
+        else:
+            self._check_schema(index, doc, schema, (), errors)
+
+    def _check_schema(self, index: int, value, schema: Dict, path: Tuple, errors: List):
+        if len(path) > MAX_SCHEMA_DEPTH:
+            return
+        schema = self.schemas.resolve(schema)
+        if schema.get("x-kubernetes-preserve-unknown-fields") or value is None:
+            return
+        expected = schema.get("type") or ("object" if "properties" in schema else None)
+
+        if expected == "object":
+            if not isinstance(value, dict):
+                errors.append(self._error(index, format_path(path), f"Expected an object, got {type(value).__name__}"))
+                return
+            properties = schema.get("properties") or {}
+            for name in schema.get("required") or []:
+                if name not in value:
+                    errors.append(self._error(index, format_path(path + (name,)), "Missing required field"))
+            for name, child in value.items():
+                if name in properties:
+                    self._check_schema(index, child, properties[name], path + (name,), errors)
+                elif isinstance(schema.get("additionalProperties"), dict):
+                    self._check_schema(index, child, schema["additionalProperties"], path + (name,), errors)
+                elif properties:
+                    errors.append(self._error(index, format_path(path + (name,)), "Unknown field"))
+        elif expected == "array":
+            if not isinstance(value, list):
+                errors.append(self._error(index, format_path(path), "Expected a list"))
+                return
+            for i, item in enumerate(value):
+                self._check_schema(index, item, schema.get("items") or {}, path + (i,), errors)
+        elif expected == "string":
+            # Quantities and int-or-string fields are declared as strings but take numbers
+            if isinstance(value, (dict, list)):
+                errors.append(self._error(index, format_path(path), "Expected a string"))
+        elif expected == "integer":
+            if isinstance(value, bool) or not isinstance(value, int):
+                errors.append(self._error(index, format_path(path), "Expected an integer"))
+        elif expected == "number":
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                errors.append(self._error(index, format_path(path), "Expected a number"))
+        elif expected == "boolean":
+            if not isinstance(value, bool):
+                errors.append(self._error(index, format_path(path), "Expected true or false"))
+
+    # --- Helpers ---
+
+    @staticmethod
+    def _error(document: Optional[int], path: str, message: str, line: Optional[int] = None) -> Dict:
+        return {"document": document, "path": path, "message": message, "line": line}
+
+    @staticmethod
+    def _result(errors: List, warnings: Optional[List] = None) -> Dict:
+        return {"valid": False, "errors": errors, "warnings": warnings or [], "objects": [], "cached": False}
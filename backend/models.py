@@ -1,13 +1,18 @@
 from datetime import datetime
-from typing import List, Optional, Dict
+from typing import Any, List, Literal, Optional, Dict
 from pydantic import BaseModel, Field
 from sqlalchemy import (
+    Boolean,
     Column,
     Integer,
+    Float,
+    LargeBinary,
     String,
     DateTime,
     JSON,
     ForeignKey,
+    Index,
+    UniqueConstraint,
     Enum as SQLEnum,
 )
 from sqlalchemy.orm import relationship, declarative_base
@@ -56,17 +61,35 @@ class UserSessionDB(Base):
     user_id = Column(String, nullable=False, index=True)
     lab_id = Column(String, ForeignKey("labs.id"))
     sandbox_namespace = Column(String, unique=True)
-    start_time = Column(DateTime, default=datetime.utcnow)
+    start_time = Column(DateTime, default=datetime.utcnow, index=True)
     last_activity = Column(DateTime, default=datetime.utcnow)
     expires_at = Column(DateTime, nullable=False)
-    status = Column(SQLEnum(SessionStatus), default=SessionStatus.ACTIVE)
+    status = Column(SQLEnum(SessionStatus), default=SessionStatus.ACTIVE, index=True)
     resource_quota_used = Column(JSON)  # Current usage snapshot
+    # Bumped on every write; drives the admin "changes since" cursor
+    updated_at = Column(
+        DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True
+    )
+    # Set while the sandbox is being built: the step in progress and the replica
+    # doing it (cleared on drain so another replica can resume)
+    provisioning_step = Column(String, nullable=True, index=True)
+    provisioning_owner = Column(String, nullable=True)
+    # Record terminal I/O for instructor review; NULL follows SHELL_RECORDING_DEFAULT
+    record_shell = Column(Boolean, nullable=True)
+    # Cluster the sandbox was placed on; NULL means the default cluster
+    cluster = Column(String, nullable=True, index=True)
+    # Snapshot whose objects were re-created when the sandbox was built
+    restored_snapshot_id = Column(Integer, nullable=True)
 
     lab = relationship("LabDB")
 
 
 class LabProgressDB(Base):
     __tablename__ = "lab_progress"
+    # One row per completed step makes progress writes idempotent
+    __table_args__ = (
+        Index("uq_lab_progress_session_step", "session_id", "step_completed", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     session_id = Column(Integer, ForeignKey("sessions.id"))
@@ -74,9 +97,213 @@ class LabProgressDB(Base):
     completed_at = Column(DateTime, default=datetime.utcnow)
 
 
+class SessionRollupDB(Base):
+    """Pre-aggregated session counters per time bucket and lab."""
+
+    __tablename__ = "session_rollups"
+    __table_args__ = (UniqueConstraint("period", "bucket_start", "lab_id"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    period = Column(String, nullable=False)  # hour | day | total
+    bucket_start = Column(DateTime, nullable=False)
+    lab_id = Column(String, nullable=False)  # "*" aggregates all labs
+    sessions_started = Column(Integer, default=0)
+    sessions_completed = Column(Integer, default=0)
+    sessions_ended = Column(Integer, default=0)
+    total_duration_seconds = Column(Float, default=0.0)
+    peak_concurrency = Column(Integer, default=0)
+    cpu_usage_histogram = Column(JSON)  # Counts per CPU_BUCKETS_MILLICORES bucket
+    memory_usage_histogram = Column(JSON)  # Counts per MEMORY_BUCKETS_MIB bucket
+
+
+class SessionArchiveDB(Base):
+    """Finished sessions moved out of the hot sessions table by the archiver."""
+
+    __tablename__ = "sessions_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)  # Original sessions.id
+    # Not unique: uuids are short and get reissued once the original is archived
+    session_uuid = Column(String, nullable=False, index=True)
+    user_id = Column(String, nullable=False, index=True)
+    lab_id = Column(String, index=True)
+    sandbox_namespace = Column(String)
+    start_time = Column(DateTime, index=True)
+    last_activity = Column(DateTime)
+    expires_at = Column(DateTime, nullable=False)
+    status = Column(SQLEnum(SessionStatus))
+    resource_quota_used = Column(JSON)
+    updated_at = Column(DateTime)
+    cluster = Column(String)
+    archived_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+class LabProgressArchiveDB(Base):
+    __tablename__ = "lab_progress_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)  # Original lab_progress.id
+    session_id = Column(Integer, index=True)
+    step_completed = Column(Integer)
+    completed_at = Column(DateTime)
+
+
+class ShellRecordingDB(Base):
+    """One recorded shell connection (asciicast v2); the events live in chunks."""
+
+    __tablename__ = "shell_recordings"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    session_uuid = Column(String, nullable=False, index=True)
+    user_id = Column(String, nullable=False)
+    lab_id = Column(String)
+    started_at = Column(DateTime, default=datetime.utcnow, index=True)
+    ended_at = Column(DateTime, nullable=True)
+    codec = Column(String, nullable=False)  # zstd | gzip
+    width = Column(Integer, default=80)
+    height = Column(Integer, default=24)
+    duration_seconds = Column(Float, default=0.0)
+    event_count = Column(Integer, default=0)
+    raw_bytes = Column(Integer, default=0)
+    stored_bytes = Column(Integer, default=0)
+    truncated = Column(Boolean, default=False)  # Hit SHELL_RECORDING_MAX_BYTES
+    dropped_chunks = Column(Integer, default=0)  # Shed because the writer fell behind
+
+
+class ShellRecordingChunkDB(Base):
+    """Independently compressed run of asciicast event lines; doubles as the seek index."""
+
+    __tablename__ = "shell_recording_chunks"
+    __table_args__ = (UniqueConstraint("recording_id", "seq"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    recording_id = Column(Integer, ForeignKey("shell_recordings.id", ondelete="CASCADE"), nullable=False)
+    seq = Column(Integer, nullable=False)
+    start_offset = Column(Float, nullable=False)  # Seconds since the recording started
+    end_offset = Column(Float, nullable=False)
+    event_count = Column(Integer, nullable=False)
+    raw_bytes = Column(Integer, nullable=False)
+    data = Column(LargeBinary, nullable=False)
+
+
+class SandboxSnapshotDB(Base):
+    """The user-created objects of a user's last sandbox for a lab, by content digest."""
+
+    __tablename__ = "sandbox_snapshots"
+    __table_args__ = (UniqueConstraint("user_id", "lab_id"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(String, nullable=False, index=True)
+    lab_id = Column(String, nullable=False)
+    session_uuid = Column(String, nullable=False)
+    taken_at = Column(DateTime, default=datetime.utcnow, index=True)
+    objects = Column(JSON, nullable=False)  # [{"kind", "name", "digest"}]
+    object_count = Column(Integer, default=0)
+    raw_bytes = Column(Integer, default=0)
+
+
+class SnapshotBlobDB(Base):
+    """One compressed object manifest, shared by every snapshot containing it."""
+
+    __tablename__ = "snapshot_blobs"
+
+    digest = Column(String, primary_key=True)  # sha256 of the canonical JSON
+    codec = Column(String, nullable=False)  # zstd | gzip
+    raw_bytes = Column(Integer, nullable=False)
+    data = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_used_at = Column(DateTime, default=datetime.utcnow)  # Refreshed when a capture reuses it
+
+
+class RateLimitBucketDB(Base):
+    """Token bucket shared by all replicas when RATE_LIMIT_BACKEND=postgres."""
+
+    __tablename__ = "rate_limit_buckets"
+
+    key = Column(String, primary_key=True)  # "<route class>:<user id>"
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(Float, nullable=False, index=True)  # Unix time of the last check
+    allowed = Column(Boolean, nullable=False)  # Outcome of the last check
+
+
+class PlannedEventDB(Base):
+    """A workshop announced ahead of time: seats are reserved and sandboxes pre-provisioned."""
+
+    __tablename__ = "planned_events"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String, nullable=False)
+    lab_id = Column(String, ForeignKey("labs.id"), nullable=False, index=True)
+    expected_attendees = Column(Integer, nullable=False)
+    reserved_seats = Column(Integer, nullable=False)
+    prewarm = Column(Integer, nullable=False)  # Sandboxes built before the start
+    starts_at = Column(DateTime, nullable=False, index=True)
+    # Seats are held from lead_minutes before the start until hold_minutes after it
+    lead_minutes = Column(Integer, nullable=False)
+    hold_minutes = Column(Integer, nullable=False)
+    cancelled = Column(Boolean, default=False)
+    closed_at = Column(DateTime, nullable=True)  # Set once unclaimed sandboxes are released
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class WarmSandboxDB(Base):
+    """A sandbox pre-provisioned for a planned event, waiting for its user."""
+
+    __tablename__ = "warm_sandboxes"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    event_id = Column(Integer, ForeignKey("planned_events.id"), nullable=False, index=True)
+    lab_id = Column(String, nullable=False)
+    cluster = Column(String, nullable=True)
+    sandbox_namespace = Column(String, unique=True, nullable=False)
+    # provisioning | ready | claimed | failed | released
+    status = Column(String, nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    claimed_by = Column(String, nullable=True)
+    claimed_at = Column(DateTime, nullable=True)
+    session_uuid = Column(String, nullable=True)
+
+
+class BulkJobDB(Base):
+    """Summary of an admin bulk job, so any replica can report on it."""
+
+    __tablename__ = "bulk_jobs"
+
+    job_id = Column(String, primary_key=True)
+    action = Column(String, nullable=False)
+    total = Column(Integer, nullable=False)
+    completed = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    done = Column(Boolean, nullable=False, default=False)
+    created_at = Column(DateTime, nullable=False, index=True)
+
+
+class BulkJobResultDB(Base):
+    """Outcome of one item of a bulk job, in the order the items finished."""
+
+    __tablename__ = "bulk_job_results"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job_id = Column(String, ForeignKey("bulk_jobs.job_id", ondelete="CASCADE"), nullable=False, index=True)
+    item = Column(String, nullable=False)
+    ok = Column(Boolean, nullable=False)
+    detail = Column(String, nullable=True)
+
+
 # --- Pydantic Schemas ---
 
 
+class StepCheck(BaseModel):
+    type: str  # exists | absent | ready | field | logs
+    kind: Optional[str] = None
+    name: Optional[str] = None
+    path: Optional[str] = None  # Dotted field path, e.g. spec.ports[0].port
+    equals: Optional[Any] = None
+    exists: Optional[bool] = None
+    contains: Optional[str] = None
+    matches: Optional[str] = None  # Regular expression
+    pod: Optional[str] = None
+    container: Optional[str] = None
+
+
 class LabStep(BaseModel):
     step: int
     title: Optional[str] = None
@@ -86,6 +313,7 @@ class LabStep(BaseModel):
     commands: Optional[List[str]] = None
     template: Optional[str] = None
     verification: str
+    checks: Optional[List[StepCheck]] = None
 
 
 class CompletionResource(BaseModel):
@@ -108,6 +336,8 @@ class PCAResources(BaseModel):
 class SandboxRequirements(BaseModel):
     cpu: str
     memory: str
+    # Only place sandboxes on clusters carrying these labels
+    cluster_selector: Optional[Dict[str, str]] = None
 
 
 class UIHints(BaseModel):
@@ -141,6 +371,7 @@ class Lab(LabBase):
 
 class SessionCreate(BaseModel):
     lab_id: str
+    restore: bool = True  # Re-create objects from the last sandbox for this lab
 
 
 class ManifestRequest(BaseModel):
@@ -158,12 +389,24 @@ class UserSession(BaseModel):
     expires_at: datetime
     status: SessionStatus
     resource_quota_used: Optional[Dict] = None
+    updated_at: Optional[datetime] = None
+    provisioning_step: Optional[str] = None  # Set while the sandbox is being built
+    cluster: Optional[str] = None
+    restored_snapshot_id: Optional[int] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
     class Config:
         from_attributes = True
 
 
+class SessionPage(BaseModel):
+    items: List[Dict[str, Any]]
+    # Pass back as `cursor` to fetch the next page
+    next_cursor: Optional[str] = None
+    # Pass back as `changed_since` to fetch only sessions modified after this page
+    sync_cursor: Optional[str] = None
+
+
 class LabProgressUpdate(BaseModel):
     step_number: int
 
@@ -171,9 +414,205 @@ class LabProgressUpdate(BaseModel):
 class LabProgress(BaseModel):
     session_uuid: str
     completed_steps: List[int] = []
+    completed: bool = False
+
+
+class UsagePercentiles(BaseModel):
+    p50: Optional[float] = None
+    p95: Optional[float] = None
+    p99: Optional[float] = None
 
 
 class AdminSessionStats(BaseModel):
     active_sessions: int
     total_sessions_today: int
-    popular_labs: Dict[str, int]
\ No newline at end of file
+    popular_labs: Dict[str, int]
+    total_sessions_all_time: int = 0
+    completions_today: int = 0
+    avg_duration_minutes_today: Optional[float] = None
+    peak_concurrency_today: int = 0
+    cpu_millicores_today: UsagePercentiles = UsagePercentiles()
+    memory_mib_today: UsagePercentiles = UsagePercentiles()
+    cluster_utilization_pct: float = 0.0
+    max_concurrent_sessions: int = 0
+
+class BulkSessionFilter(BaseModel):
+    session_uuids: Optional[List[str]] = None
+    lab_id: Optional[str] = None
+    user_ids: Optional[List[str]] = None
+    started_after: Optional[datetime] = None
+    started_before: Optional[datetime] = None
+
+    def has_criteria(self) -> bool:
+        """False when nothing was selected; such a filter must not mean "every session"."""
+        return any(value not in (None, "", []) for value in self.model_dump().values())
+
+
+class BulkTerminateRequest(BaseModel):
+    filter: BulkSessionFilter
+
+
+class BulkExtendRequest(BaseModel):
+    filter: BulkSessionFilter
+    hours: int = Field(default=1, ge=1, le=24)
+
+
+class BulkProvisionRequest(BaseModel):
+    lab_id: str
+    user_ids: List[str]
+
+
+class BulkJob(BaseModel):
+    job_id: str
+    action: str
+    total: int
+    completed: int = 0
+    failed: int = 0
+    done: bool = False
+    created_at: datetime
+
+
+class ManifestIssue(BaseModel):
+    document: Optional[int] = None  # Index of the YAML document, if known
+    path: str = ""
+    message: str
+    line: Optional[int] = None
+
+
+class FieldChange(BaseModel):
+    path: str
+    op: Literal["added", "removed", "changed"]
+    old: Optional[Any] = None
+    new: Optional[Any] = None
+
+
+class ObjectDiff(BaseModel):
+    api_version: str
+    kind: str
+    name: str
+    action: Literal["create", "update", "unchanged"]
+    changes: List[FieldChange] = []
+
+
+class ManifestValidation(BaseModel):
+    valid: bool
+    errors: List[ManifestIssue] = []
+    warnings: List[ManifestIssue] = []
+    objects: List[ObjectDiff] = []
+    cached: bool = False
+
+
+class ShellRecording(BaseModel):
+    id: int
+    session_uuid: str
+    user_id: str
+    lab_id: Optional[str] = None
+    started_at: datetime
+    ended_at: Optional[datetime] = None
+    codec: str
+    duration_seconds: float = 0.0
+    event_count: int = 0
+    raw_bytes: int = 0
+    stored_bytes: int = 0
+    truncated: bool = False
+    dropped_chunks: int = 0
+
+    class Config:
+        from_attributes = True
+
+
+class RecordingChunk(BaseModel):
+    seq: int
+    start_offset: float
+    end_offset: float
+    event_count: int
+    raw_bytes: int
+    stored_bytes: int
+
+
+class SandboxSnapshot(BaseModel):
+    id: int
+    lab_id: str
+    session_uuid: str
+    taken_at: datetime
+    object_count: int = 0
+    raw_bytes: int = 0
+    objects: List[Dict[str, str]] = []
+
+    class Config:
+        from_attributes = True
+
+
+class PlannedEventCreate(BaseModel):
+    name: str
+    lab_id: str
+    expected_attendees: int = Field(ge=1, le=1000)
+    starts_at: datetime
+    # Unclaimed seats and sandboxes are released this long after the start
+    hold_minutes: int = Field(default=30, ge=0, le=480)
+    # Both default to the suggestion learned from past events
+    reserved_seats: Optional[int] = Field(default=None, ge=0)
+    prewarm: Optional[int] = Field(default=None, ge=0)
+
+
+class ArrivalPoint(BaseModel):
+    minute: int  # Relative to the event start
+    arrived: float  # Share of the arrivals that had started a session by then
+
+
+class DemandSuggestion(BaseModel):
+    lab_id: str
+    expected_attendees: int
+    reserved_seats: int
+    prewarm: int
+    show_up_ratio: float  # p90 of sessions started / expected attendees
+    early_ratio: float  # Share of arrivals within PREWARM_COVERS_MINUTES of the start
+    baseline_sessions: int  # Usual sessions of the lab in that hour of the week
+    events_analysed: int = 0
+    arrival_curve: List[ArrivalPoint] = []
+
+
+class PlannedEvent(BaseModel):
+    id: int
+    name: str
+    lab_id: str
+    expected_attendees: int
+    reserved_seats: int
+    prewarm: int
+    starts_at: datetime
+    lead_minutes: int
+    hold_minutes: int
+    cancelled: bool = False
+    closed_at: Optional[datetime] = None
+    created_at: datetime
+    state: str = "scheduled"  # scheduled | open | closing | closed | cancelled
+    sessions_started: int = 0
+    warm_sandboxes: Dict[str, int] = {}  # By status
+
+    class Config:
+        from_attributes = True
+
+
+class RecordingSettings(BaseModel):
+    enabled: Optional[bool] = None  # None falls back to the server default
+
+
+class VerifyRequest(BaseModel):
+    steps: Optional[List[int]] = None  # Defaults to every step with checks
+
+
+class CheckResult(BaseModel):
+    check: str
+    passed: bool
+    detail: Optional[str] = None
+
+
+class StepVerification(BaseModel):
+    step: int
+    passed: Optional[bool] = None  # None for steps that are verified manually
+    checks: List[CheckResult] = []
+
+
+class VerificationResult(BaseModel):
+    session_uuid: str
+    steps: List[StepVerification]
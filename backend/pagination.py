@@ -0,0 +1,47 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(sort: str, sort_value, row_id: int) -> str:
+    """Encodes a (sort value, id) keyset position under column `sort` as an opaque token."""
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+    raw = json.dumps([sort, sort_value, row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_column):
+    """Decodes a token from encode_cursor, restoring datetimes for DateTime columns.
+
+    Raises ValueError if the token is malformed or was issued for another sort column.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort, sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if sort != sort_column.key:
+        raise ValueError(f"Cursor was issued for sort={sort}, not sort={sort_column.key}")
+    try:
+        if sort_value is not None and sort_column.type.python_type is datetime:
+            sort_value = datetime.fromisoformat(sort_value)
+        return sort_value, int(row_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def after_cursor(sort_column, id_column, cursor: str, descending: bool):
+    """Builds the WHERE clause selecting rows strictly after a keyset position."""
+    sort_value, row_id = decode_cursor(cursor, sort_column)
+    if descending:
+        return or_(
+            sort_column < sort_value,
+            and_(sort_column == sort_value, id_column < row_id),
+        )
+    return or_(
+        sort_column > sort_value,
+        and_(sort_column == sort_value, id_column > row_id),
+    )
@@ -0,0 +1,152 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Set, Tuple
+
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from models import LabProgressDB
+
+logger = logging.getLogger(__name__)
+
+
+class ProgressBuffer:
+    """Write-behind buffer for per-step lab progress.
+
+    Step completions are recorded in memory (coalesced per session and step) and
+    flushed to lab_progress in one bulk insert on an interval or at shutdown.
+    Reads combine the stored steps with this replica's pending ones. Stored
+    steps are cached per session for `cache_ttl` seconds and updated by steps
+    recorded here, so other replicas' writes show up within the TTL.
+    """
+
+    def __init__(
+        self,
+        db_session_factory,
+        max_pending: int = 1000,
+        cache_ttl: float = 5.0,
+        max_cached: int = 2000,
+    ):
+        self.db_session_factory = db_session_factory
+        self.max_pending = max_pending
+        self.cache_ttl = cache_ttl
+        self.max_cached = max_cached
+        self._pending: Dict[int, Dict[int, datetime]] = {}
+        # session_id -> (loaded at, stored steps)
+        self._cache: "OrderedDict[int, Tuple[float, Set[int]]]" = OrderedDict()
+        # Sync endpoints call in from the threadpool
+        self._lock = threading.Lock()
+
+    def record(self, session_id: int, step: int) -> bool:
+        """Buffers a completed step; returns False if it is already pending here.
+
+        Whether the step was stored before (possibly by another replica) is
+        only settled by the flush, which skips existing rows.
+        """
+        with self._lock:
+            steps = self._pending.setdefault(session_id, {})
+            if step in steps:
+                return False
+            steps[step] = datetime.utcnow()
+            self._remember(session_id, step)
+            pending = sum(len(s) for s in self._pending.values())
+
+        if pending >= self.max_pending:
+            # Backpressure: don't let the buffer grow without bound between flushes
+            self.flush()
+        return True
+
+    def record_once(self, session_id: int, step: int) -> bool:
+        """Stores a step right away; returns True only for the call that inserted it.
+
+        For steps with side effects that must happen once across all replicas,
+        such as counting a lab as completed.
+        """
+        db: Session = self.db_session_factory()
+        try:
+            inserted = db.execute(
+                self._insert(db)
+                .values(session_id=session_id, step_completed=step, completed_at=datetime.utcnow())
+                .on_conflict_do_nothing(index_elements=["session_id", "step_completed"])
+                .returning(LabProgressDB.__table__.c.id)
+            ).first()
+            db.commit()
+        finally:
+            db.close()
+        with self._lock:
+            self._pending.get(session_id, {}).pop(step, None)
+            self._remember(session_id, step)
+        return inserted is not None
+
+    def completed_steps(self, session_id: int) -> List[int]:
+        with self._lock:
+            cached = self._cache.get(session_id)
+            if cached and time.monotonic() - cached[0] < self.cache_ttl:
+                return sorted(cached[1] | self._pending.get(session_id, {}).keys())
+
+        loaded_at = time.monotonic()
+        db: Session = self.db_session_factory()
+        try:
+            stored = {
+                row.step_completed
+                for row in db.query(LabProgressDB.step_completed).filter(
+                    LabProgressDB.session_id == session_id
+                )
+            }
+        finally:
+            db.close()
+
+        with self._lock:
+            self._cache[session_id] = (loaded_at, stored)
+            self._cache.move_to_end(session_id)
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+            return sorted(stored | self._pending.get(session_id, {}).keys())
+
+    def _remember(self, session_id: int, step: int):
+        """Adds a step recorded here to the cached view; caller holds the lock."""
+        cached = self._cache.get(session_id)
+        if cached:
+            cached[1].add(step)
+
+    def flush(self) -> int:
+        """Writes all pending steps in one idempotent bulk insert."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        rows = [
+            {"session_id": session_id, "step_completed": step, "completed_at": at}
+            for session_id, steps in pending.items()
+            for step, at in steps.items()
+        ]
+        if not rows:
+            return 0
+
+        db: Session = self.db_session_factory()
+        try:
+            db.execute(
+                self._insert(db)
+                .values(rows)
+                .on_conflict_do_nothing(index_elements=["session_id", "step_completed"])
+            )
+            db.commit()
+            logger.debug("Flushed %s progress update(s)", len(rows))
+            return len(rows)
+        except Exception as e:
+            logger.error("Failed to flush lab progress, will retry: %s", e)
+            db.rollback()
+            with self._lock:
+                for session_id, steps in pending.items():
+                    merged = self._pending.setdefault(session_id, {})
+                    for step, at in steps.items():
+                        merged.setdefault(step, at)
+            return 0
+        finally:
+            db.close()
+
+    @staticmethod
+    def _insert(db: Session):
+        insert = postgresql.insert if db.bind.dialect.name == "postgresql" else sqlite.insert
+        return insert(LabProgressDB.__table__)
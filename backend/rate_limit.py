@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import math
+import time
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+try:
+    import redis.asyncio as redis
+except ImportError:  # Optional: only needed for RATE_LIMIT_BACKEND=redis
+    redis = None
+
+# Route class -> (tokens per second, burst). Classes map to what a request costs
+# the platform: provisioning builds a namespace, manifests spawn kubectl, shells
+# hold a PTY and a kubectl exec, reads only touch the database.
+DEFAULT_LIMITS: Dict[str, Tuple[float, int]] = {
+    "provision": (1 / 20, 3),
+    "manifest": (0.5, 10),
+    "verify": (0.2, 10),
+    "snapshot": (1 / 20, 3),
+    "shell": (0.1, 5),
+    "logs": (0.1, 5),
+    "read": (10.0, 30),
+}
+
+
+def parse_limits(spec: Optional[str]) -> Dict[str, Tuple[float, int]]:
+    """DEFAULT_LIMITS overridden by "class=rate:burst,..." (e.g. "provision=0.1:5")."""
+    limits = dict(DEFAULT_LIMITS)
+    for item in filter(None, (spec or "").split(",")):
+        route_class, _, value = item.partition("=")
+        rate, _, burst = value.partition(":")
+        limits[route_class.strip()] = (float(rate), int(burst or max(1, math.ceil(float(rate)))))
+    return limits
+
+
+class MemoryBackend:
+    """Token buckets in this process; each replica enforces the limit on its own."""
+
+    def __init__(self, max_keys: int = 100000, idle_seconds: float = 300.0):
+        self.max_keys = max_keys
+        self.idle_seconds = idle_seconds  # Longer than any bucket takes to refill
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        # Runs on the event loop without awaiting, so read-modify-write is atomic
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (float(burst), now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        if tokens >= 1:
+            self._store(key, tokens - 1, now)
+            return 0.0
+        self._store(key, tokens, now)
+        return (1 - tokens) / rate
+
+    def _store(self, key: str, tokens: float, now: float):
+        if len(self._buckets) >= self.max_keys and key not in self._buckets:
+            # Idle buckets have refilled, so forgetting them changes nothing
+            self._buckets = {k: v for k, v in self._buckets.items() if now - v[1] < self.idle_seconds}
+        self._buckets[key] = (tokens, now)
+
+
+class PostgresBackend:
+    """Token buckets in the rate_limit_buckets table, shared by all replicas.
+
+    One upsert per check refills, spends and reports the decision atomically.
+    """
+
+    TAKE = text(
+        """
+        INSERT INTO rate_limit_buckets (key, tokens, updated_at, allowed)
+        VALUES (:key, :burst - 1, :now, true)
+        ON CONFLICT (key) DO UPDATE SET
+            tokens = CASE
+                WHEN LEAST(:burst, rate_limit_buckets.tokens + (:now - rate_limit_buckets.updated_at) * :rate) >= 1
+                THEN LEAST(:burst, rate_limit_buckets.tokens + (:now - rate_limit_buckets.updated_at) * :rate) - 1
+                ELSE LEAST(:burst, rate_limit_buckets.tokens + (:now - rate_limit_buckets.updated_at) * :rate)
+            END,
+            allowed = LEAST(:burst, rate_limit_buckets.tokens + (:now - rate_limit_buckets.updated_at) * :rate) >= 1,
+            updated_at = :now
+        RETURNING tokens, allowed
+        """
+    )
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        return await asyncio.to_thread(self._take, key, rate, burst)
+
+    def _take(self, key: str, rate: float, burst: int) -> float:
+        with self.engine.begin() as conn:
+            tokens, allowed = conn.execute(
+                self.TAKE, {"key": key, "rate": rate, "burst": burst, "now": time.time()}
+            ).one()
+        return 0.0 if allowed else (1 - tokens) / rate
+
+    async def purge(self, idle_seconds: float = 3600):
+        await asyncio.to_thread(self._purge, idle_seconds)
+
+    def _purge(self, idle_seconds: float):
+        with self.engine.begin() as conn:
+            conn.execute(
+                text("DELETE FROM rate_limit_buckets WHERE updated_at < :cutoff"),
+                {"cutoff": time.time() - idle_seconds},
+            )
+
+
+class RedisBackend:
+    """Token buckets in Redis (or anything speaking its protocol and Lua), shared by all replicas."""
+
+    TAKE = """
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    local tokens = tonumber(bucket[1]) or burst
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+    local allowed = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+    redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+    return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, url: str):
+        if redis is None:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis requires the redis package")
+        self.client = redis.from_url(url)
+        self._take = self.client.register_script(self.TAKE)
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        allowed, tokens = await self._take(keys=[f"ratelimit:{key}"], args=[rate, burst, time.time()])
+        return 0.0 if int(allowed) else (1 - float(tokens)) / rate
+
+
+class RateLimiter:
+    """Per-user token buckets, one per route class.
+
+    The backend decides where buckets live (this process, PostgreSQL or
+    Redis). If a shared backend is unreachable the request is let through:
+    rate limiting protects the platform, it must not take it down.
+    """
+
+    def __init__(self, backend, limits: Dict[str, Tuple[float, int]], enabled: bool = True):
+        self.backend = backend
+        self.limits = limits
+        self.enabled = enabled
+        self.rejected: Dict[str, int] = {}
+
+    async def check(self, route_class: str, user_id: str) -> Optional[int]:
+        """Spends a token; returns the seconds to wait (for Retry-After) when there is none."""
+        if not self.enabled or route_class not in self.limits:
+            return None
+        rate, burst = self.limits[route_class]
+        try:
+            wait = await self.backend.take(f"{route_class}:{user_id}", rate, burst)
+        except Exception as e:
+            logger.warning("Rate limit backend failed, allowing request: %s", e)
+            return None
+        if wait <= 0:
+            return None
+        self.rejected[route_class] = self.rejected.get(route_class, 0) + 1
+        return max(1, math.ceil(wait))
+
+    def stats(self) -> Dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "limits": {c: {"rate": r, "burst": b} for c, (r, b) in self.limits.items()},
+            "rejected": dict(self.rejected),
+        }
+
+
+class SingleFlight:
+    """Coalesces identical concurrent calls: the first caller runs, the rest share its result."""
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable]):
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            # shield: one waiter disconnecting must not cancel the shared call
+            return await asyncio.shield(future)
+        future = asyncio.ensure_future(fn())
+        self._inflight[key] = future
+        future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(future)
@@ -0,0 +1,94 @@
+import logging
+import re
+from typing import Dict, FrozenSet, List, Optional
+
+import orjson
+from fastapi.responses import Response
+from starlette.middleware.gzip import GZipMiddleware
+
+import models
+
+logger = logging.getLogger(__name__)
+
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:  # Optional: gzip alone is fine for every browser
+    BrotliMiddleware = None
+
+# Streams must reach the client as they are written, not when a compressor flushes
+STREAMING_ACCEPT = ("text/event-stream", "application/x-ndjson")
+STREAMING_PATHS = re.compile(r"/(events|results|logs)$|/proxy/")
+
+
+class CompressionMiddleware:
+    """Brotli (when installed) or gzip for responses over `minimum_size` bytes.
+
+    Server-sent event and NDJSON streams bypass compression entirely.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024):
+        self.app = app
+        if BrotliMiddleware is not None:
+            self.compressed = BrotliMiddleware(app, minimum_size=minimum_size, gzip_fallback=True)
+        else:
+            self.compressed = GZipMiddleware(app, minimum_size=minimum_size)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self._is_stream(scope):
+            await self.app(scope, receive, send)
+        else:
+            await self.compressed(scope, receive, send)
+
+    @staticmethod
+    def _is_stream(scope) -> bool:
+        if STREAMING_PATHS.search(scope["path"]):
+            return True
+        accept = dict(scope["headers"]).get(b"accept", b"").decode("latin-1")
+        return any(media_type in accept for media_type in STREAMING_ACCEPT)
+
+
+class CatalogCache:
+    """The lab catalog, validated once and kept as ready-to-send JSON bytes.
+
+    The catalog only changes when lab_catalog.json is reloaded at startup, so
+    /labs and /labs/{id} can skip per-request validation and serialization.
+    """
+
+    def __init__(self):
+        self._labs: Dict[str, bytes] = {}
+        self._filters: Dict[str, tuple] = {}
+        self._steps: Dict[str, FrozenSet[int]] = {}
+
+    def load(self, labs: List):
+        serialized, filters, steps = {}, {}, {}
+        for lab in labs:
+            model = models.Lab.model_validate(lab)
+            serialized[model.id] = orjson.dumps(model.model_dump(mode="json"))
+            filters[model.id] = (model.category, tuple(model.persona))
+            steps[model.id] = frozenset(step.step for step in model.steps)
+        self._labs, self._filters, self._steps = serialized, filters, steps
+        logger.info("Cached %s serialized lab(s)", len(serialized))
+
+    @property
+    def loaded(self) -> bool:
+        return bool(self._labs)
+
+    def lab(self, lab_id: str) -> Optional[Response]:
+        body = self._labs.get(lab_id)
+        return json_bytes_response(body) if body is not None else None
+
+    def step_numbers(self, lab_id: str) -> Optional[FrozenSet[int]]:
+        return self._steps.get(lab_id)
+
+    def labs(self, category: Optional[str] = None, persona: Optional[str] = None) -> Response:
+        bodies = [
+            body
+            for lab_id, body in self._labs.items()
+            if (category is None or self._filters[lab_id][0] == category)
+            and (persona is None or persona in self._filters[lab_id][1])
+        ]
+        return json_bytes_response(b"[" + b",".join(bodies) + b"]")
+
+
+def json_bytes_response(body: bytes) -> Response:
+    return Response(content=body, media_type="application/json")
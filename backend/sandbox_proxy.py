@@ -0,0 +1,230 @@
+import asyncio
+import logging
+import re
+import ssl
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from clusters import Cluster
+
+logger = logging.getLogger(__name__)
+
+try:
+    from websockets.asyncio.client import connect as websocket_connect
+except ImportError:  # websockets < 13: plain HTTP proxying still works
+    websocket_connect = None
+
+# DNS-1035 label, as Kubernetes requires for Service names
+SERVICE_NAME = re.compile(r"^[a-z]([-a-z0-9]{0,61}[a-z0-9])?$")
+
+# Hop-by-hop headers (RFC 9110 7.6.1) plus the ones the proxy sets itself
+HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailer", "transfer-encoding", "upgrade", "host",
+}
+# Platform credentials must never reach code running in a sandbox
+PLATFORM_HEADER_PREFIXES = ("x-auth-request-", "x-forwarded-", "x-oidc-")
+PLATFORM_COOKIES = ("_oauth2_proxy",)
+
+
+class ProxyLimitError(Exception):
+    """The session already has the maximum number of proxied connections open."""
+
+
+def strip_platform_cookies(cookie_header: str) -> str:
+    return "; ".join(
+        part
+        for part in (p.strip() for p in cookie_header.split(";"))
+        if part and not part.split("=", 1)[0].startswith(PLATFORM_COOKIES)
+    )
+
+
+def forward_headers(headers, prefix: str) -> List[Tuple[str, str]]:
+    """Request headers to send upstream: no hop-by-hop or platform credentials."""
+    out = []
+    for name, value in headers.items():
+        name = name.lower()
+        if name in HOP_HEADERS or name == "authorization" or name.startswith(PLATFORM_HEADER_PREFIXES):
+            continue
+        if name.startswith("sec-websocket-"):
+            continue
+        if name == "cookie":
+            value = strip_platform_cookies(value)
+            if not value:
+                continue
+        out.append((name, value))
+    out.append(("x-forwarded-prefix", prefix))
+    return out
+
+
+def response_headers(headers: httpx.Headers, prefix: str) -> List[Tuple[str, str]]:
+    """Upstream response headers for the browser; root-relative redirects stay under the proxy."""
+    out = []
+    for name, value in headers.multi_items():
+        name = name.lower()
+        if name in HOP_HEADERS:
+            continue
+        if name == "location" and value.startswith("/") and not value.startswith(prefix):
+            value = prefix + value
+        out.append((name, value))
+    return out
+
+
+class SandboxProxy:
+    """Reverse proxy from the backend to Services in sandbox namespaces.
+
+    On the cluster the backend runs in (no kubeconfig), Services are reached
+    directly through cluster DNS; on other clusters through the API server's
+    service proxy, with that cluster's credentials. Connections come from one
+    pooled httpx client per cluster and bodies are streamed both ways. Each
+    session may hold `max_per_session` requests/websockets at once, so one
+    learner's app can't take the whole pool.
+    """
+
+    def __init__(
+        self,
+        max_per_session: int = 32,
+        max_connections: int = 500,
+        session_cache_seconds: float = 10.0,
+    ):
+        self.max_per_session = max_per_session
+        self.max_connections = max_connections
+        self.session_cache_seconds = session_cache_seconds
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._open: Dict[str, int] = {}
+        # (session_uuid, user_id) -> (looked up at, namespace, cluster) for active sessions
+        self._sessions: Dict[Tuple[str, str], Tuple[float, str, Optional[str]]] = {}
+
+    # --- Session lookup ---
+
+    def cached_session(self, session_uuid: str, user_id: str) -> Optional[Tuple[str, Optional[str]]]:
+        """A browser loading an app fires many requests; skip the DB for most of them."""
+        entry = self._sessions.get((session_uuid, user_id))
+        if entry is None or time.monotonic() - entry[0] > self.session_cache_seconds:
+            return None
+        return entry[1], entry[2]
+
+    def remember_session(self, session_uuid: str, user_id: str, namespace: str, cluster: Optional[str]):
+        if len(self._sessions) > 10000:
+            self._sessions.clear()
+        self._sessions[(session_uuid, user_id)] = (time.monotonic(), namespace, cluster)
+
+    # --- Limits ---
+
+    def acquire(self, session_uuid: str):
+        """Takes a connection slot; released once the response body or websocket is done."""
+        if self._open.get(session_uuid, 0) >= self.max_per_session:
+            raise ProxyLimitError(f"Session {session_uuid} has {self.max_per_session} proxied connections open")
+        self._open[session_uuid] = self._open.get(session_uuid, 0) + 1
+
+    def release(self, session_uuid: str):
+        self._open[session_uuid] -= 1
+        if not self._open[session_uuid]:
+            del self._open[session_uuid]
+
+    # --- Upstream ---
+
+    @staticmethod
+    def is_direct(cluster: Cluster) -> bool:
+        return cluster.ops.kubeconfig is None
+
+    def upstream_url(self, cluster: Cluster, namespace: str, service: str, port: int, path: str) -> str:
+        if self.is_direct(cluster):
+            return f"http://{service}.{namespace}.svc:{port}/{path}"
+        host = cluster.ops.api_client.configuration.host.rstrip("/")
+        return f"{host}/api/v1/namespaces/{namespace}/services/{service}:{port}/proxy/{path}"
+
+    def upstream_headers(self, cluster: Cluster) -> List[Tuple[str, str]]:
+        if self.is_direct(cluster):
+            return []
+        # Called per request so in-cluster/exec tokens are refreshed by the client config
+        token = cluster.ops.api_client.configuration.get_api_key_with_prefix("authorization")
+        return [("authorization", token)] if token else []
+
+    def ssl_context(self, cluster: Cluster) -> Optional[ssl.SSLContext]:
+        if self.is_direct(cluster):
+            return None
+        configuration = cluster.ops.api_client.configuration
+        context = ssl.create_default_context(cafile=configuration.ssl_ca_cert)
+        if not configuration.verify_ssl:
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        if configuration.cert_file:
+            context.load_cert_chain(configuration.cert_file, configuration.key_file)
+        return context
+
+    def client(self, cluster: Cluster) -> httpx.AsyncClient:
+        client = self._clients.get(cluster.name)
+        if client is None:
+            client = httpx.AsyncClient(
+                verify=self.ssl_context(cluster) or True,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=min(100, self.max_connections),
+                    keepalive_expiry=30.0,
+                ),
+                # Reads can legitimately idle (long polls, event streams)
+                timeout=httpx.Timeout(connect=5.0, read=300.0, write=60.0, pool=5.0),
+                follow_redirects=False,
+            )
+            self._clients[cluster.name] = client
+        return client
+
+    async def relay_websocket(self, websocket, cluster: Cluster, url: str, headers: List[Tuple[str, str]]):
+        """Connects upstream, accepts the browser with the agreed subprotocol and pumps frames both ways."""
+        if websocket_connect is None:
+            await websocket.close(code=1011, reason="Websocket proxying is not available")
+            return
+        url = "ws" + url[len("http"):]
+        try:
+            upstream = await websocket_connect(
+                url,
+                additional_headers=headers + self.upstream_headers(cluster),
+                subprotocols=websocket.scope.get("subprotocols") or None,
+                ssl=self.ssl_context(cluster),
+                open_timeout=10,
+                max_size=16 * 1024 * 1024,
+                compression=None,
+            )
+        except Exception as e:
+            logger.info("Websocket proxy to %s failed: %s", url, e)
+            await websocket.close(code=1014, reason="Upstream unreachable")
+            return
+
+        await websocket.accept(subprotocol=upstream.subprotocol)
+
+        async def to_upstream():
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    return
+                data = message.get("text") if message.get("text") is not None else message.get("bytes")
+                if data is not None:
+                    await upstream.send(data)
+
+        async def to_browser():
+            async for data in upstream:
+                if isinstance(data, str):
+                    await websocket.send_text(data)
+                else:
+                    await websocket.send_bytes(data)
+
+        tasks = [asyncio.create_task(to_upstream()), asyncio.create_task(to_browser())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await upstream.close()
+            code = upstream.close_code
+            try:
+                # 1005/1006 are reserved for "no status" and may not be sent
+                await websocket.close(code=1000 if code in (None, 1005, 1006) else code)
+            except Exception:
+                pass
+
+    async def close(self):
+        clients, self._clients = list(self._clients.values()), {}
+        await asyncio.gather(*(c.aclose() for c in clients), return_exceptions=True)
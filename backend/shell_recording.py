@@ -0,0 +1,350 @@
+import asyncio
+import gzip
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional, Set, Tuple
+
+import orjson
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import ShellRecordingChunkDB, ShellRecordingDB
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:  # Optional: gzip is in the standard library
+    zstandard = None
+
+CODEC = "zstd" if zstandard is not None else "gzip"
+
+
+def compress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Recording is zstd-compressed but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+# (start offset, end offset, event count, asciicast event lines)
+Chunk = Tuple[float, float, int, bytes]
+
+
+class ShellRecorder:
+    """Buffers one shell's I/O as asciicast v2 events and writes it behind.
+
+    `output` and `input` are called from the shell's hot path and never wait:
+    events are appended to an in-memory chunk, full chunks are queued for a
+    writer task that compresses and stores them off the event loop, and if the
+    writer falls behind whole chunks are dropped rather than slowing the shell.
+    """
+
+    def __init__(self, store: "RecordingStore", session_uuid: str, user_id: str, lab_id: Optional[str]):
+        self.store = store
+        self.session_uuid = session_uuid
+        self.user_id = user_id
+        self.lab_id = lab_id
+        self.codec = CODEC
+        self.started_at = datetime.utcnow()
+        self.recording_id: Optional[int] = None
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+        self.event_count = 0
+        self.truncated = False
+        self.dropped_chunks = 0
+        self.closed = False
+        self._started = time.monotonic()
+        self._last_offset = 0.0
+        self._events: List[bytes] = []
+        self._buffered = 0
+        self._chunk_start = 0.0
+        self._seq = 0
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._writer())
+
+    def output(self, data: str):
+        self._record("o", data)
+
+    def input(self, data: str):
+        self._record("i", data)
+
+    def close(self):
+        """Seals the last chunk; the writer finishes the recording in the background."""
+        if self.closed:
+            return
+        self._seal()
+        self.closed = True
+        self._queue.put_nowait(None)
+
+    def _record(self, kind: str, data: str):
+        if self.closed or self.truncated:
+            return
+        offset = time.monotonic() - self._started
+        line = orjson.dumps([round(offset, 6), kind, data]) + b"\n"
+        if self.raw_bytes + len(line) > self.store.max_bytes:
+            self.truncated = True
+            self._seal()
+            logger.info("Recording for session %s reached its size cap", self.session_uuid)
+            return
+        if not self._events:
+            self._chunk_start = offset
+        self._events.append(line)
+        self._buffered += len(line)
+        self._last_offset = offset
+        self.raw_bytes += len(line)
+        self.event_count += 1
+        if self._buffered >= self.store.chunk_bytes:
+            self._seal()
+
+    def _seal(self):
+        if not self._events:
+            return
+        chunk = (self._chunk_start, self._last_offset, len(self._events), b"".join(self._events))
+        self._events = []
+        self._buffered = 0
+        if self._queue.qsize() >= self.store.max_pending_chunks:
+            self.dropped_chunks += 1
+            logger.warning("Recording writer for session %s is behind, dropped a chunk", self.session_uuid)
+            return
+        self._queue.put_nowait(chunk)
+
+    async def _writer(self):
+        while True:
+            try:
+                chunk = await asyncio.wait_for(self._queue.get(), timeout=self.store.chunk_seconds)
+            except asyncio.TimeoutError:
+                # Quiet shells still get persisted every chunk_seconds
+                self._seal()
+                continue
+            if chunk is None:
+                break
+            try:
+                await asyncio.to_thread(self.store.write_chunk, self, self._seq, chunk)
+                self._seq += 1
+            except Exception as e:
+                self.dropped_chunks += 1
+                logger.error("Failed to store recording chunk for session %s: %s", self.session_uuid, e)
+        try:
+            await asyncio.to_thread(self.store.finish, self)
+        except Exception as e:
+            logger.error("Failed to finish recording for session %s: %s", self.session_uuid, e)
+
+
+class RecordingStore:
+    """Persists shell recordings as compressed chunks in the database.
+
+    Each chunk is compressed on its own and stores its time range, so the
+    chunk rows double as the seek index: playback from an offset starts at the
+    first chunk that ends after it instead of decompressing from the start.
+    Recordings are capped at `max_bytes` of raw events and purged after
+    `retention`.
+    """
+
+    def __init__(
+        self,
+        db_session_factory,
+        enabled_by_default: bool = False,
+        max_bytes: int = 20 * 1024 * 1024,
+        retention: timedelta = timedelta(days=30),
+        chunk_bytes: int = 64 * 1024,
+        chunk_seconds: float = 10.0,
+        max_pending_chunks: int = 16,
+    ):
+        self.db_session_factory = db_session_factory
+        self.enabled_by_default = enabled_by_default
+        self.max_bytes = max_bytes
+        self.retention = retention
+        self.chunk_bytes = chunk_bytes
+        self.chunk_seconds = chunk_seconds
+        self.max_pending_chunks = max_pending_chunks
+        self._recorders: Set[ShellRecorder] = set()
+
+    def enabled_for(self, session) -> bool:
+        if session.record_shell is None:
+            return self.enabled_by_default
+        return session.record_shell
+
+    def start(self, session_uuid: str, user_id: str, lab_id: Optional[str]) -> ShellRecorder:
+        recorder = ShellRecorder(self, session_uuid, user_id, lab_id)
+        self._recorders.add(recorder)
+        recorder.task.add_done_callback(lambda _: self._recorders.discard(recorder))
+        return recorder
+
+    def writer_tasks(self) -> List[asyncio.Task]:
+        """Writers still flushing; the drain waits for them."""
+        return [r.task for r in self._recorders if not r.task.done()]
+
+    # --- Writes (run in worker threads) ---
+
+    def write_chunk(self, recorder: ShellRecorder, seq: int, chunk: Chunk):
+        start, end, events, raw = chunk
+        data = compress(raw, recorder.codec)
+        db: Session = self.db_session_factory()
+        try:
+            recording_id = recorder.recording_id
+            if recording_id is None:
+                # The row is created with the first chunk so idle shells cost nothing
+                recording = ShellRecordingDB(
+                    session_uuid=recorder.session_uuid,
+                    user_id=recorder.user_id,
+                    lab_id=recorder.lab_id,
+                    started_at=recorder.started_at,
+                    codec=recorder.codec,
+                )
+                db.add(recording)
+                db.flush()
+                recording_id = recording.id
+            db.add(
+                ShellRecordingChunkDB(
+                    recording_id=recording_id,
+                    seq=seq,
+                    start_offset=start,
+                    end_offset=end,
+                    event_count=events,
+                    raw_bytes=len(raw),
+                    data=data,
+                )
+            )
+            db.commit()
+            recorder.recording_id = recording_id
+            recorder.stored_bytes += len(data)
+        finally:
+            db.close()
+
+    def finish(self, recorder: ShellRecorder):
+        if recorder.recording_id is None:
+            return
+        db: Session = self.db_session_factory()
+        try:
+            db.query(ShellRecordingDB).filter(ShellRecordingDB.id == recorder.recording_id).update(
+                {
+                    ShellRecordingDB.ended_at: datetime.utcnow(),
+                    ShellRecordingDB.duration_seconds: recorder._last_offset,
+                    ShellRecordingDB.event_count: recorder.event_count,
+                    ShellRecordingDB.raw_bytes: recorder.raw_bytes,
+                    ShellRecordingDB.stored_bytes: recorder.stored_bytes,
+                    ShellRecordingDB.truncated: recorder.truncated,
+                    ShellRecordingDB.dropped_chunks: recorder.dropped_chunks,
+                },
+                synchronize_session=False,
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    async def purge_expired(self):
+        purged = await asyncio.to_thread(self._purge_expired)
+        if purged:
+            logger.info("Purged %s shell recording(s) past retention", purged)
+
+    def _purge_expired(self) -> int:
+        cutoff = datetime.utcnow() - self.retention
+        db: Session = self.db_session_factory()
+        try:
+            ids = [
+                row.id
+                for row in db.query(ShellRecordingDB.id)
+                .filter(ShellRecordingDB.started_at < cutoff)
+                .limit(1000)
+            ]
+            if not ids:
+                return 0
+            # Explicit child delete: SQLite does not enforce ON DELETE CASCADE
+            db.query(ShellRecordingChunkDB).filter(
+                ShellRecordingChunkDB.recording_id.in_(ids)
+            ).delete(synchronize_session=False)
+            db.query(ShellRecordingDB).filter(ShellRecordingDB.id.in_(ids)).delete(
+                synchronize_session=False
+            )
+            db.commit()
+            return len(ids)
+        finally:
+            db.close()
+
+    # --- Reads ---
+
+    def chunk_index(self, db: Session, recording_id: int) -> List[dict]:
+        rows = (
+            db.query(
+                ShellRecordingChunkDB.seq,
+                ShellRecordingChunkDB.start_offset,
+                ShellRecordingChunkDB.end_offset,
+                ShellRecordingChunkDB.event_count,
+                ShellRecordingChunkDB.raw_bytes,
+                func.length(ShellRecordingChunkDB.data).label("stored_bytes"),
+            )
+            .filter(ShellRecordingChunkDB.recording_id == recording_id)
+            .order_by(ShellRecordingChunkDB.seq)
+        )
+        return [row._asdict() for row in rows]
+
+    @staticmethod
+    def header(recording: ShellRecordingDB) -> bytes:
+        return orjson.dumps(
+            {
+                "version": 2,
+                "width": recording.width or 80,
+                "height": recording.height or 24,
+                "timestamp": int(recording.started_at.timestamp()),
+                "title": f"{recording.user_id} - {recording.lab_id} ({recording.session_uuid})",
+            }
+        ) + b"\n"
+
+    def stream(
+        self, recording_id: int, codec: str, header: bytes, start: float = 0.0, batch_size: int = 20
+    ) -> Iterator[bytes]:
+        """Yields the recording as asciicast v2, starting `start` seconds in.
+
+        Timestamps are rebased to `start` so a player begins right away. Runs
+        in Starlette's threadpool; chunks are loaded a batch at a time so a
+        long recording is never held in memory whole.
+        """
+        yield header
+
+        db: Session = self.db_session_factory()
+        try:
+            first = (
+                db.query(func.min(ShellRecordingChunkDB.seq))
+                .filter(
+                    ShellRecordingChunkDB.recording_id == recording_id,
+                    ShellRecordingChunkDB.end_offset >= start,
+                )
+                .scalar()
+            )
+            seq = first
+            while seq is not None:
+                rows = (
+                    db.query(ShellRecordingChunkDB.seq, ShellRecordingChunkDB.data)
+                    .filter(
+                        ShellRecordingChunkDB.recording_id == recording_id,
+                        ShellRecordingChunkDB.seq >= seq,
+                    )
+                    .order_by(ShellRecordingChunkDB.seq)
+                    .limit(batch_size)
+                    .all()
+                )
+                for row in rows:
+                    yield self._events_from(decompress(row.data, codec), start)
+                seq = rows[-1].seq + 1 if len(rows) == batch_size else None
+        finally:
+            db.close()
+
+    @staticmethod
+    def _events_from(raw: bytes, start: float) -> bytes:
+        if not start:
+            return raw
+        out = []
+        for line in raw.splitlines():
+            offset, kind, data = orjson.loads(line)
+            if offset >= start:
+                out.append(orjson.dumps([round(offset - start, 6), kind, data]))
+        return b"\n".join(out) + b"\n" if out else b""
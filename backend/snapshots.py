@@ -0,0 +1,435 @@
+import asyncio
+import contextvars
+import copy
+import hashlib
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import orjson
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from kubernetes_ops import CUSTOM_KINDS, TYPED_KINDS, KubernetesOps
+from models import SandboxSnapshotDB, SnapshotBlobDB
+from shell_recording import CODEC, compress, decompress
+
+logger = logging.getLogger(__name__)
+
+API_VERSIONS = {
+    "Pod": "v1",
+    "Service": "v1",
+    "ConfigMap": "v1",
+    "Secret": "v1",
+    "PersistentVolumeClaim": "v1",
+    "ServiceAccount": "v1",
+    "Deployment": "apps/v1",
+    "StatefulSet": "apps/v1",
+    "NetworkPolicy": "networking.k8s.io/v1",
+    "Role": "rbac.authorization.k8s.io/v1",
+    "RoleBinding": "rbac.authorization.k8s.io/v1",
+    **{kind: f"{group}/{version}" for kind, (group, version, _) in CUSTOM_KINDS.items()},
+}
+
+# Created by provisioning or by Kubernetes itself; a new sandbox gets its own
+PLATFORM_OBJECTS = {
+    ("Pod", "playground-toolbox"),
+    ("ServiceAccount", "sandbox-sa"),
+    ("ServiceAccount", "default"),
+    ("Role", "sandbox-user-role"),
+    ("RoleBinding", "sandbox-user-binding"),
+    ("Secret", "access-token"),
+    ("NetworkPolicy", "sandbox-isolation"),
+    ("ConfigMap", "kube-root-ca.crt"),
+    ("ConfigMap", "istio-ca-root-cert"),
+}
+
+# Annotations written by controllers and admission webhooks, not by the learner
+SERVER_ANNOTATIONS = (
+    "deployment.kubernetes.io/",
+    "pv.kubernetes.io/",
+    "volume.beta.kubernetes.io/",
+    "volume.kubernetes.io/",
+    "sidecar.istio.io/status",
+    "kubernetes.io/psp",
+    "cni.projectcalico.org/",
+    "k8s.v1.cni.cncf.io/",
+)
+
+# Objects in one tier may reference objects in earlier tiers; custom resources go last
+RESTORE_TIERS = [
+    {"ServiceAccount", "Secret", "ConfigMap", "PersistentVolumeClaim", "Role"},
+    {"RoleBinding", "Service", "NetworkPolicy"},
+    {"Deployment", "StatefulSet", "Pod"},
+]
+
+
+def clean_object(kind: str, obj: Dict, namespace: str) -> Optional[Dict]:
+    """Reduces a live object to what the learner wrote, or None if it isn't theirs.
+
+    Drops status, server-set metadata (uid, resourceVersion, managedFields,
+    ...), allocated fields (cluster IPs, node ports, bound volumes, node
+    names) and what admission webhooks injected, so the result can be
+    created in another namespace.
+    """
+    metadata = obj.get("metadata") or {}
+    name = metadata.get("name")
+    # Owned objects (ReplicaSets, Job pods, ...) are re-created by their owner
+    if not name or metadata.get("ownerReferences") or (kind, name) in PLATFORM_OBJECTS:
+        return None
+    if kind == "Secret" and obj.get("type") == "kubernetes.io/service-account-token":
+        return None
+
+    cleaned_metadata = {"name": name}
+    if metadata.get("labels"):
+        cleaned_metadata["labels"] = dict(metadata["labels"])
+    annotations = {
+        k: v for k, v in (metadata.get("annotations") or {}).items() if not k.startswith(SERVER_ANNOTATIONS)
+    }
+    if annotations:
+        cleaned_metadata["annotations"] = annotations
+    cleaned = {"apiVersion": API_VERSIONS[kind], "kind": kind, "metadata": cleaned_metadata}
+    for key, value in obj.items():
+        if key not in ("apiVersion", "kind", "metadata", "status"):
+            cleaned[key] = copy.deepcopy(value)
+
+    spec = cleaned.get("spec") or {}
+    if kind == "Service":
+        # Allocated addresses differ per cluster, but "None" is what makes a Service headless
+        if spec.get("clusterIP") != "None":
+            spec.pop("clusterIP", None)
+            spec.pop("clusterIPs", None)
+        spec.pop("healthCheckNodePort", None)
+        for port in spec.get("ports") or []:
+            port.pop("nodePort", None)
+    elif kind == "PersistentVolumeClaim":
+        spec.pop("volumeName", None)
+    elif kind == "ServiceAccount":
+        cleaned.pop("secrets", None)
+    elif kind == "RoleBinding":
+        for subject in cleaned.get("subjects") or []:
+            if subject.get("namespace") == namespace:
+                subject.pop("namespace")  # Filled in with the new namespace on restore
+    elif kind == "Pod":
+        strip_injected(metadata, spec)
+    return cleaned
+
+
+def strip_injected(metadata: Dict, spec: Dict):
+    """Removes what admission added to a bare pod, which would be added again on create."""
+    spec.pop("nodeName", None)
+    spec.pop("ephemeralContainers", None)
+    injected = {"containers": set(), "initContainers": set(), "volumes": set()}
+    status = (metadata.get("annotations") or {}).get("sidecar.istio.io/status")
+    if status:
+        try:
+            for key, names in orjson.loads(status).items():
+                if key in injected:
+                    injected[key].update(names or [])
+        except orjson.JSONDecodeError:
+            pass
+    # The service account token volume gets a random suffix per pod
+    token_volumes = {
+        v["name"] for v in spec.get("volumes") or [] if v.get("name", "").startswith("kube-api-access-")
+    }
+    injected["volumes"] |= token_volumes
+    for key in ("containers", "initContainers", "volumes"):
+        if key in spec:
+            spec[key] = [item for item in spec[key] if item.get("name") not in injected[key]]
+    for container in spec.get("containers", []) + spec.get("initContainers", []):
+        if "volumeMounts" in container:
+            container["volumeMounts"] = [
+                m for m in container["volumeMounts"] if m.get("name") not in injected["volumes"]
+            ]
+    if not spec.get("initContainers"):
+        spec.pop("initContainers", None)
+
+
+def digest_of(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class SnapshotStore:
+    """Saves a sandbox's user-created objects when it ends and re-creates them in the next one.
+
+    Objects are cleaned (see clean_object), serialized canonically and stored
+    once per content digest, compressed: the lab's starter manifests are the
+    same for every learner, so most objects are shared across users and
+    snapshots. Each user keeps one snapshot per lab (the latest). Restore
+    creates objects tier by tier in dependency order, each tier in parallel.
+    """
+
+    def __init__(
+        self,
+        db_session_factory,
+        enabled: bool = True,
+        retention: timedelta = timedelta(days=30),
+        max_parallel: int = 8,
+        timeout: float = 60.0,
+    ):
+        self.db_session_factory = db_session_factory
+        self.enabled = enabled
+        self.retention = retention
+        self.max_parallel = max_parallel
+        self.timeout = timeout
+
+    # --- Capture ---
+
+    async def save(
+        self, ops: KubernetesOps, namespace: str, user_id: str, lab_id: str, session_uuid: str
+    ) -> Optional[Dict]:
+        """Best-effort snapshot before teardown; failures are logged, never raised."""
+        if not self.enabled:
+            return None
+        # wait_for can't stop the worker thread, so capture() also gets the deadline
+        # and abandons the write once it has passed
+        deadline = time.monotonic() + self.timeout
+        try:
+            return await asyncio.wait_for(
+                asyncio.to_thread(self.capture, ops, namespace, user_id, lab_id, session_uuid, deadline),
+                timeout=self.timeout,
+            )
+        except Exception as e:
+            logger.warning("Snapshot of %s failed, continuing without it: %r", namespace, e)
+            return None
+
+    def export(self, ops: KubernetesOps, namespace: str) -> List[Dict]:
+        from kubernetes.client.rest import ApiException  # Keeps kubernetes off the import path
+
+        kinds = list(TYPED_KINDS) + list(CUSTOM_KINDS)
+
+        def list_kind(kind):
+            try:
+                return ops.list_objects(namespace, kind)[1]
+            except ApiException as e:
+                if e.status == 404:  # CRD not installed on this cluster
+                    return []
+                raise
+
+        with ThreadPoolExecutor(self.max_parallel) as pool:
+            # Each task gets its own context copy so the caller's priority lane applies
+            listed = pool.map(lambda kind: contextvars.copy_context().run(list_kind, kind), kinds)
+            objects = []
+            for kind, items in zip(kinds, listed):
+                for item in items:
+                    cleaned = clean_object(kind, item, namespace)
+                    if cleaned is not None:
+                        objects.append(cleaned)
+        return objects
+
+    def capture(
+        self,
+        ops: KubernetesOps,
+        namespace: str,
+        user_id: str,
+        lab_id: str,
+        session_uuid: str,
+        deadline: Optional[float] = None,
+    ) -> Optional[Dict]:
+        # A missing or terminating namespace lists as (partly) empty, which would
+        # replace the learner's last good snapshot; keep that one instead
+        phase = ops.namespace_phase(namespace)
+        if phase != "Active":
+            logger.info("Not snapshotting %s: namespace is %s", namespace, phase or "missing")
+            return None
+        objects = self.export(ops, namespace)
+        if ops.namespace_phase(namespace) != "Active":
+            logger.info("Not snapshotting %s: namespace started terminating during export", namespace)
+            return None
+        if deadline is not None and time.monotonic() > deadline:
+            # The caller gave up and is deleting the namespace; a late write would be stale
+            logger.warning("Snapshot of %s missed its deadline, not storing it", namespace)
+            return None
+        blobs = {}
+        entries = []
+        for obj in objects:
+            raw = orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+            digest = digest_of(raw)
+            blobs[digest] = raw
+            entries.append({"kind": obj["kind"], "name": obj["metadata"]["name"], "digest": digest})
+
+        for attempt in range(2):
+            db: Session = self.db_session_factory()
+            try:
+                existing = {
+                    row.digest
+                    for row in db.query(SnapshotBlobDB.digest).filter(SnapshotBlobDB.digest.in_(list(blobs)))
+                }
+                # Reused blobs restart the purge's grace period; one purged since
+                # it was read above no longer matches, so re-read and retry
+                touched = db.execute(
+                    update(SnapshotBlobDB)
+                    .where(SnapshotBlobDB.digest.in_(list(existing)))
+                    .values(last_used_at=datetime.utcnow())
+                ).rowcount if existing else 0
+                if touched != len(existing):
+                    db.rollback()
+                    if attempt:
+                        raise RuntimeError(f"Snapshot blobs of {namespace} were purged during capture")
+                    continue
+                new = [d for d in blobs if d not in existing]
+                for digest in new:
+                    db.add(
+                        SnapshotBlobDB(
+                            digest=digest,
+                            codec=CODEC,
+                            raw_bytes=len(blobs[digest]),
+                            data=compress(blobs[digest], CODEC),
+                        )
+                    )
+                snapshot = (
+                    db.query(SandboxSnapshotDB)
+                    .filter(SandboxSnapshotDB.user_id == user_id, SandboxSnapshotDB.lab_id == lab_id)
+                    .first()
+                )
+                if snapshot is None:
+                    snapshot = SandboxSnapshotDB(user_id=user_id, lab_id=lab_id)
+                    db.add(snapshot)
+                snapshot.session_uuid = session_uuid
+                snapshot.taken_at = datetime.utcnow()
+                snapshot.objects = entries
+                snapshot.object_count = len(entries)
+                snapshot.raw_bytes = sum(len(blobs[e["digest"]]) for e in entries)
+                if deadline is not None and time.monotonic() > deadline:
+                    db.rollback()
+                    logger.warning("Snapshot of %s missed its deadline, not storing it", namespace)
+                    return None
+                db.commit()
+                logger.info(
+                    "Snapshot of %s: %s object(s), %s new blob(s)", namespace, len(entries), len(new)
+                )
+                return {"id": snapshot.id, "objects": len(entries), "new_blobs": len(new)}
+            except IntegrityError:
+                # Another replica stored the same blob or snapshot row first; re-read and retry
+                db.rollback()
+                if attempt:
+                    raise
+            finally:
+                db.close()
+
+    # --- Restore ---
+
+    async def restore_latest(
+        self, ops: KubernetesOps, namespace: str, user_id: str, lab_id: str
+    ) -> Optional[Tuple[int, Dict]]:
+        """Re-creates the user's last snapshot for the lab; None if there is none."""
+        loaded = await asyncio.to_thread(self.load, user_id, lab_id)
+        if loaded is None:
+            return None
+        snapshot_id, objects = loaded
+        result = await asyncio.to_thread(self.restore, ops, namespace, objects)
+        logger.info(
+            "Restored snapshot %s into %s: %s created, %s existing, %s failed",
+            snapshot_id, namespace, result["created"], result["existing"], len(result["failed"]),
+        )
+        return snapshot_id, result
+
+    def load(self, user_id: str, lab_id: str) -> Optional[Tuple[int, List[Dict]]]:
+        db: Session = self.db_session_factory()
+        try:
+            snapshot = (
+                db.query(SandboxSnapshotDB)
+                .filter(SandboxSnapshotDB.user_id == user_id, SandboxSnapshotDB.lab_id == lab_id)
+                .first()
+            )
+            if snapshot is None or not snapshot.objects:
+                return None
+            digests = {e["digest"] for e in snapshot.objects}
+            blobs = {
+                row.digest: orjson.loads(decompress(row.data, row.codec))
+                for row in db.query(SnapshotBlobDB).filter(SnapshotBlobDB.digest.in_(list(digests)))
+            }
+            missing = digests - set(blobs)
+            if missing:
+                logger.warning("Snapshot %s is missing %s blob(s)", snapshot.id, len(missing))
+            return snapshot.id, [blobs[e["digest"]] for e in snapshot.objects if e["digest"] in blobs]
+        finally:
+            db.close()
+
+    def restore(self, ops: KubernetesOps, namespace: str, objects: List[Dict]) -> Dict:
+        tiers = [[o for o in objects if o["kind"] in kinds] for kinds in RESTORE_TIERS]
+        ordered = set().union(*RESTORE_TIERS)
+        tiers.append([o for o in objects if o["kind"] not in ordered])
+
+        result = {"created": 0, "existing": 0, "failed": []}
+        with ThreadPoolExecutor(self.max_parallel) as pool:
+            for tier in tiers:
+                futures = [
+                    (obj, pool.submit(contextvars.copy_context().run, ops.create_object, namespace, self._retarget(obj, namespace)))
+                    for obj in tier
+                ]
+                for obj, future in futures:
+                    try:
+                        result["created" if future.result() else "existing"] += 1
+                    except Exception as e:
+                        reason = getattr(e, "reason", None) or str(e)
+                        result["failed"].append(f"{obj['kind']}/{obj['metadata']['name']}: {reason}")
+        return result
+
+    @staticmethod
+    def _retarget(obj: Dict, namespace: str) -> Dict:
+        if obj["kind"] == "RoleBinding":
+            obj = copy.deepcopy(obj)
+            for subject in obj.get("subjects") or []:
+                if subject.get("kind") == "ServiceAccount" and not subject.get("namespace"):
+                    subject["namespace"] = namespace
+        return obj
+
+    # --- Management ---
+
+    def list_for_user(self, db: Session, user_id: str) -> List[SandboxSnapshotDB]:
+        return (
+            db.query(SandboxSnapshotDB)
+            .filter(SandboxSnapshotDB.user_id == user_id)
+            .order_by(SandboxSnapshotDB.taken_at.desc())
+            .all()
+        )
+
+    def discard(self, db: Session, user_id: str, lab_id: str) -> bool:
+        deleted = (
+            db.query(SandboxSnapshotDB)
+            .filter(SandboxSnapshotDB.user_id == user_id, SandboxSnapshotDB.lab_id == lab_id)
+            .delete(synchronize_session=False)
+        )
+        db.commit()
+        return bool(deleted)
+
+    async def purge_expired(self):
+        snapshots, blobs = await asyncio.to_thread(self._purge_expired)
+        if snapshots or blobs:
+            logger.info("Purged %s sandbox snapshot(s) and %s unreferenced blob(s)", snapshots, blobs)
+
+    def _purge_expired(self) -> Tuple[int, int]:
+        cutoff = datetime.utcnow() - self.retention
+        db: Session = self.db_session_factory()
+        try:
+            snapshots = (
+                db.query(SandboxSnapshotDB)
+                .filter(SandboxSnapshotDB.taken_at < cutoff)
+                .delete(synchronize_session=False)
+            )
+            db.commit()
+            # Blobs are shared, so they go only when no snapshot references them.
+            # Ones created or reused recently are kept in case a capture committed
+            # while this ran; the delete re-checks that, since a capture can reuse
+            # a blob after it was listed here.
+            referenced = {e["digest"] for (objects,) in db.query(SandboxSnapshotDB.objects) for e in objects or []}
+            grace = datetime.utcnow() - timedelta(hours=1)
+            idle = func.coalesce(SnapshotBlobDB.last_used_at, SnapshotBlobDB.created_at) < grace
+            orphans = [
+                row.digest
+                for row in db.query(SnapshotBlobDB.digest).filter(idle)
+                if row.digest not in referenced
+            ]
+            purged = 0
+            for start in range(0, len(orphans), 500):
+                purged += db.query(SnapshotBlobDB).filter(
+                    SnapshotBlobDB.digest.in_(orphans[start : start + 500]), idle
+                ).delete(synchronize_session=False)
+            db.commit()
+            return snapshots, purged
+        finally:
+            db.close()
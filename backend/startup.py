@@ -0,0 +1,42 @@
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTracker:
+    """Times startup phases and tracks whether background bootstrap has finished.
+
+    The app starts serving (and answering liveness probes) immediately; the
+    dependency-backed bootstrap runs afterwards and flips `ready` when done.
+    """
+
+    def __init__(self, process_start: float):
+        self.process_start = process_start
+        self.ready = False
+        self.phases: Dict[str, float] = {}  # Phase name -> milliseconds
+        self.last_error: Optional[str] = None
+
+    def since_start_ms(self) -> float:
+        return (time.perf_counter() - self.process_start) * 1000
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = (time.perf_counter() - started) * 1000
+            logger.info("Startup phase '%s' took %.0f ms", name, self.phases[name])
+
+    def mark(self, name: str):
+        """Records a milestone measured from process start."""
+        self.phases[name] = self.since_start_ms()
+        logger.info("Startup milestone '%s' reached after %.0f ms", name, self.phases[name])
+
+    def mark_ready(self):
+        self.ready = True
+        self.last_error = None
+        self.mark("ready")
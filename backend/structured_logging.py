@@ -0,0 +1,250 @@
+import atexit
+import logging
+import queue
+import re
+import threading
+import time
+import uuid
+from contextvars import ContextVar, Token
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Tuple
+
+import orjson
+
+# Fields of the current request (or job), added to every record logged under it
+_context: ContextVar[Dict[str, str]] = ContextVar("log_context", default={})
+
+REDACTED = "[REDACTED]"
+# Credentials that end up in messages (headers, URLs, exception text)
+SECRET_PATTERNS = [
+    (re.compile(r"(?i)\b(bearer|basic)\s+[\w\-.~+/=]+"), r"\1 " + REDACTED),
+    (re.compile(r"\beyJ[\w-]{4,}\.[\w-]{4,}\.[\w-]*"), REDACTED),  # JWT
+    (re.compile(r"(?i)((?:set-)?cookie['\"]?\s*[:=]\s*['\"]?)[^'\"\n]+"), r"\1" + REDACTED),
+    (
+        re.compile(
+            r"(?i)((?:authorization|[\w-]*token|password|secret|api[_-]?key)['\"]?\s*[:=]\s*['\"]?)"
+            r"[^'\"\s,;&}]+"
+        ),
+        r"\1" + REDACTED,
+    ),
+]
+
+# Argument types that can't change between the log call and formatting on the listener thread
+IMMUTABLE_ARGS = (str, int, float, bool, type(None), datetime, BaseException)
+
+# Never sampled: the access log and session lifecycle (expiry, provisioning,
+# teardown, leadership) are needed in full for audits and incident timelines
+SAMPLING_EXEMPT = (
+    "uvicorn.access",
+    "background_tasks",
+    "bulk_ops",
+    "capacity_planner",
+    "drain",
+    "leader_election",
+    "snapshots",
+    "startup",
+)
+
+REQUEST_ID = re.compile(r"^[\w.\-]{1,64}$")
+SESSION_PATH = re.compile(r"^/(?:sessions|shell|admin/sessions)/([^/]+)")
+
+
+def bind(**fields) -> Token:
+    """Adds fields to the log context; pass the token to unbind() to restore the previous one."""
+    return _context.set({**_context.get(), **fields})
+
+
+def unbind(token: Token):
+    _context.reset(token)
+
+
+def redact(text: str) -> str:
+    for pattern, replacement in SECRET_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+class AsyncQueueHandler(QueueHandler):
+    """Hands records to a listener thread; logging never waits on the stream.
+
+    Only what can't be recovered later (the log context) is captured on the
+    caller's thread. Messages are interpolated, redacted and serialized on the
+    listener, unless an argument is mutable. When the queue is full, records
+    are dropped and counted rather than blocking the event loop.
+    """
+
+    def __init__(self, maxsize: int):
+        super().__init__(queue.Queue(maxsize))
+        self.dropped = 0
+        self.listener = None
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.context = _context.get()
+        args = record.args if isinstance(record.args, tuple) else (record.args,)
+        if record.args and not all(isinstance(a, IMMUTABLE_ARGS) for a in args):
+            record.msg, record.args = record.getMessage(), None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class SamplingFilter(logging.Filter):
+    """Caps how often a single message is logged below WARNING.
+
+    Records are keyed by logger and message template, so "%s"-style calls
+    sample per call site. Each key may log `burst` records per `interval`
+    seconds; the rest are dropped, and the first record of the next
+    interval reports how many (`sampled_out`). Warnings and errors, and
+    records of the `exempt` loggers (and their children), always pass.
+    """
+
+    def __init__(
+        self,
+        burst: int = 20,
+        interval: float = 10.0,
+        max_keys: int = 10000,
+        exempt: Tuple[str, ...] = SAMPLING_EXEMPT,
+    ):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.max_keys = max_keys
+        self.exempt = tuple(exempt)
+        self._exempt_children = tuple(name + "." for name in self.exempt)
+        self.suppressed = 0
+        # key -> [window start, records logged, records dropped]
+        self._windows: Dict[Tuple[str, str], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.burst <= 0:
+            return True
+        if record.name in self.exempt or record.name.startswith(self._exempt_children):
+            return True
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                if window is None and len(self._windows) >= self.max_keys:
+                    self._windows.clear()
+                if window is not None and window[2]:
+                    record.sampled_out = window[2]
+                self._windows[key] = [now, 1, 0]
+                return True
+            if window[1] < self.burst:
+                window[1] += 1
+                return True
+            window[2] += 1
+            self.suppressed += 1
+            return False
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with the log context and credentials redacted."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": redact(record.getMessage()),
+        }
+        entry.update(getattr(record, "context", None) or {})
+        if getattr(record, "sampled_out", None):
+            entry["sampled_out"] = record.sampled_out
+        if record.exc_info:
+            entry["exception"] = redact(self.formatException(record.exc_info))
+        return orjson.dumps(entry).decode()
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines for local development, redacted like the JSON output."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        context = getattr(record, "context", None)
+        if context:
+            line += " [" + " ".join(f"{k}={v}" for k, v in context.items()) + "]"
+        if getattr(record, "sampled_out", None):
+            line += f" (+{record.sampled_out} similar)"
+        return redact(line)
+
+
+def configure_logging(
+    level: str = "INFO",
+    fmt: str = "json",
+    queue_size: int = 10000,
+    sample_burst: int = 20,
+    sample_interval: float = 10.0,
+    sample_exempt: Tuple[str, ...] = SAMPLING_EXEMPT,
+) -> AsyncQueueHandler:
+    """Routes every logger (uvicorn's included) through one queue to a stderr writer thread."""
+    stream = logging.StreamHandler()
+    stream.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+    handler = AsyncQueueHandler(queue_size)
+    handler.addFilter(SamplingFilter(sample_burst, sample_interval, exempt=sample_exempt))
+    handler.listener = QueueListener(handler.queue, stream)
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+    # uvicorn configures its own stream handlers before importing the app
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers.clear()
+        uvicorn_logger.propagate = True
+
+    handler.listener.start()
+    # Writes out whatever is still queued at exit
+    atexit.register(handler.listener.stop)
+    return handler
+
+
+class RequestContextMiddleware:
+    """Binds a request id and the session uuid in the path to every record of a request.
+
+    The id comes from X-Request-ID when the caller (ingress, frontend) sent a
+    sane one, and is echoed back in the response. The user is bound by
+    authentication once it is known.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        request_id = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")
+        if not REQUEST_ID.match(request_id):
+            request_id = uuid.uuid4().hex[:16]
+        fields = {"request_id": request_id}
+        match = SESSION_PATH.match(scope["path"])
+        if match and match.group(1) != "me":
+            fields["session_uuid"] = match.group(1)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-request-id", request_id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        token = _context.set(fields)
+        try:
+            await self.app(scope, receive, send_with_id if scope["type"] == "http" else send)
+        finally:
+            _context.reset(token)
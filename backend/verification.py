@@ -0,0 +1,242 @@
+import asyncio
+import json
+import logging
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+from kubernetes_ops import KubernetesOps
+from rate_limit import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+_PATH_TOKEN = re.compile(r"([^.\[\]]+)|\[(\d+)\]")
+
+# Listing result for an object check that names no kind: a failure, not a lookup
+NO_KIND = (None, [], "check has no kind")
+
+
+def resolve_path(obj, path: str):
+    """Resolves a dotted path with list indices (spec.ports[0].port); returns (found, value)."""
+    value = obj
+    for key, index in _PATH_TOKEN.findall(path):
+        try:
+            value = value[int(index)] if index else value[key]
+        except (KeyError, IndexError, TypeError):
+            return False, None
+    return True, value
+
+
+def is_ready(kind: str, obj: Dict) -> bool:
+    status = obj.get("status") or {}
+    if kind == "Deployment" or kind == "StatefulSet":
+        desired = (obj.get("spec") or {}).get("replicas", 1)
+        return (status.get("readyReplicas") or 0) >= desired
+    if kind == "PersistentVolumeClaim":
+        return status.get("phase") == "Bound"
+    if kind == "SparkApplication":
+        state = (status.get("applicationState") or {}).get("state")
+        return state in ("RUNNING", "COMPLETED")
+    conditions = status.get("conditions") or []
+    if conditions:
+        return any(c.get("type") == "Ready" and c.get("status") == "True" for c in conditions)
+    # Kinds without a readiness notion are ready once they exist
+    return kind not in ("Pod",)
+
+
+def describe(check: Dict) -> str:
+    if check["type"] == "logs":
+        return f"logs of pod {check.get('pod')} match '{check.get('matches') or check.get('contains')}'"
+    target = f"{check.get('kind')} {check.get('name')}"
+    if check["type"] == "field":
+        if check.get("exists") is not None:
+            return f"{target} has {check['path']}"
+        return f"{target} {check['path']} == {check.get('equals')!r}"
+    return f"{target} {check['type']}"
+
+
+class VerificationEngine:
+    """Evaluates machine-checkable lab step specs against sandbox namespaces.
+
+    All checks of a verification run share one LIST per (namespace, kind).
+    Lists are reused for a short TTL and refreshed from the API server's watch
+    cache, concurrent callers for the same list share a single request, and step
+    results are memoized by the resourceVersions they were computed from.
+    """
+
+    def __init__(
+        self,
+        k8s_ops: KubernetesOps,
+        max_parallel: int = 8,
+        list_ttl: float = 2.0,
+        log_ttl: float = 5.0,
+        max_entries: int = 5000,
+    ):
+        self.k8s_ops = k8s_ops
+        self.max_parallel = max_parallel
+        self.list_ttl = list_ttl
+        self.log_ttl = log_ttl
+        self.max_entries = max_entries
+        self._lists: Dict[Tuple[str, str], Tuple[Optional[str], List[Dict], float]] = {}
+        self._logs: Dict[Tuple[str, str, Optional[str]], Tuple[str, float]] = {}
+        self._results: Dict[Tuple[str, str], Tuple[Tuple, Dict]] = {}
+        self._flights = SingleFlight()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def verify(self, namespace: str, steps: List[Dict]) -> List[Dict]:
+        """Verifies lab steps (catalog dicts) in one namespace."""
+        kinds = {
+            c["kind"]
+            for step in steps
+            for c in step.get("checks") or []
+            if c["type"] != "logs" and c.get("kind")
+        }
+        listed = dict(
+            zip(kinds, await asyncio.gather(*(self._list(namespace, k) for k in kinds)))
+        )
+
+        results = []
+        for step in steps:
+            checks = step.get("checks") or []
+            if not checks:
+                results.append({"step": step["step"], "passed": None, "checks": []})
+                continue
+
+            key = (namespace, json.dumps(checks, sort_keys=True))
+            signature = tuple(
+                (c.get("kind"), listed.get(c.get("kind"), NO_KIND)[0])
+                for c in checks
+                if c["type"] != "logs"
+            )
+            has_logs = any(c["type"] == "logs" for c in checks)
+            cached = self._results.get(key)
+            if cached and cached[0] == signature and not has_logs:
+                results.append({**cached[1], "step": step["step"]})
+                continue
+
+            check_results = []
+            for check in checks:
+                if check["type"] == "logs":
+                    check_results.append(await self._check_logs(namespace, check))
+                else:
+                    check_results.append(
+                        self._check_object(check, listed.get(check.get("kind"), NO_KIND))
+                    )
+            result = {
+                "step": step["step"],
+                "passed": all(c["passed"] for c in check_results),
+                "checks": check_results,
+            }
+            self._results[key] = (signature, result)
+            results.append(result)
+
+        self._prune()
+        return results
+
+    async def verify_many(self, targets: Dict[str, Tuple[str, List[Dict]]]) -> Dict[str, List[Dict]]:
+        """Verifies many sessions concurrently: {session_uuid: (namespace, steps)}."""
+        semaphore = self._get_semaphore()
+
+        async def run(session_uuid, namespace, steps):
+            async with semaphore:
+                return session_uuid, await self.verify(namespace, steps)
+
+        done = await asyncio.gather(*(run(u, ns, st) for u, (ns, st) in targets.items()))
+        return dict(done)
+
+    # --- Checks ---
+
+    def _check_object(self, check: Dict, listed) -> Dict:
+        resource_version, items, error = listed
+        description = describe(check)
+        if error:
+            return {"check": description, "passed": False, "detail": error}
+
+        obj = next(
+            (i for i in items if (i.get("metadata") or {}).get("name") == check.get("name")),
+            None,
+        )
+        if check["type"] == "absent":
+            return {"check": description, "passed": obj is None}
+        if obj is None:
+            return {"check": description, "passed": False, "detail": "not found"}
+        if check["type"] == "exists":
+            return {"check": description, "passed": True}
+        if check["type"] == "ready":
+            ready = is_ready(check["kind"], obj)
+            return {"check": description, "passed": ready, "detail": None if ready else "not ready"}
+        if check["type"] == "field":
+            found, value = resolve_path(obj, check["path"])
+            if check.get("exists") is not None:
+                return {"check": description, "passed": found == check["exists"]}
+            passed = found and value == check.get("equals")
+            return {
+                "check": description,
+                "passed": passed,
+                "detail": None if passed else f"found {value!r}" if found else "field missing",
+            }
+        return {"check": description, "passed": False, "detail": f"unknown check type {check['type']}"}
+
+    async def _check_logs(self, namespace: str, check: Dict) -> Dict:
+        description = describe(check)
+        key = (namespace, check.get("pod"), check.get("container"))
+        cached = self._logs.get(key)
+        if cached and time.monotonic() - cached[1] < self.log_ttl:
+            logs = cached[0]
+        else:
+            logs = await self._single_flight(
+                ("logs", *key),
+                lambda: self.k8s_ops.read_pod_log(namespace, check.get("pod"), check.get("container")),
+            )
+            self._logs[key] = (logs, time.monotonic())
+
+        if check.get("matches"):
+            passed = re.search(check["matches"], logs or "") is not None
+        else:
+            passed = (check.get("contains") or "") in (logs or "")
+        return {"check": description, "passed": passed, "detail": None if passed else "no match in recent logs"}
+
+    # --- Listing ---
+
+    async def _list(self, namespace: str, kind: str):
+        """Returns (resourceVersion, items, error) for a namespace/kind."""
+        key = (namespace, kind)
+        cached = self._lists.get(key)
+        if cached and time.monotonic() - cached[2] < self.list_ttl:
+            return cached[0], cached[1], None
+
+        previous_rv = cached[0] if cached else None
+        from kubernetes.client.rest import ApiException  # Loaded with the client by list_objects
+
+        try:
+            resource_version, items = await self._single_flight(
+                ("list", *key),
+                lambda: self.k8s_ops.list_objects(namespace, kind, previous_rv),
+            )
+        except (ApiException, ValueError) as e:
+            reason = getattr(e, "reason", None) or str(e)
+            return None, [], f"cannot list {kind}: {reason}"
+        self._lists[key] = (resource_version, items, time.monotonic())
+        return resource_version, items, None
+
+    async def _single_flight(self, key, fn):
+        """Runs fn in a worker thread, sharing the result with concurrent callers.
+
+        The call runs in its own task, so the caller that started it being
+        cancelled doesn't leave the others waiting on a future nobody resolves.
+        """
+        return await self._flights.do(key, lambda: asyncio.to_thread(fn))
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_parallel)
+        return self._semaphore
+
+    def _prune(self):
+        now = time.monotonic()
+        if len(self._lists) > self.max_entries:
+            self._lists = {k: v for k, v in self._lists.items() if now - v[2] < 60}
+        if len(self._logs) > self.max_entries:
+            self._logs = {k: v for k, v in self._logs.items() if now - v[1] < 60}
+        if len(self._results) > self.max_entries:
+            self._results.clear()
@@ -4,18 +4,62 @@ import asyncio
 import subprocess
 import os
 import pty
+from datetime import timedelta
 from sqlalchemy.orm import Session
 from database import SessionLocal
 from models import UserSessionDB, SessionStatus
+from shell_recording import RecordingStore
+from structured_logging import bind
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Each shell holds a kubectl process and a PTY, so a replica can only host so many
+MAX_SHELLS = int(os.getenv("MAX_SHELLS", "200"))
+active_shells = set()
+accepting_shells = True
+
+recording_store = RecordingStore(
+    SessionLocal,
+    enabled_by_default=os.getenv("SHELL_RECORDING_DEFAULT", "false").lower() == "true",
+    max_bytes=int(os.getenv("SHELL_RECORDING_MAX_MB", "20")) * 1024 * 1024,
+    retention=timedelta(days=int(os.getenv("SHELL_RECORDING_RETENTION_DAYS", "30"))),
+)
+
+# Close code 1012 (Service Restart) tells the terminal to reconnect, which lands on another replica
+RESTART_CLOSE_CODE = 1012
+RESTART_NOTICE = (
+    "\r\n\x1b[1;33m[playground] This server is restarting for an update. "
+    "Reconnecting you to your sandbox...\x1b[0m\r\n"
+)
+
+
+async def close_all_shells() -> int:
+    """Stops accepting shells and asks every connected terminal to reconnect elsewhere."""
+    global accepting_shells
+    accepting_shells = False
+    shells = list(active_shells)
+    for websocket in shells:
+        try:
+            await websocket.send_text(RESTART_NOTICE)
+            await websocket.close(code=RESTART_CLOSE_CODE, reason="Server restarting")
+        except Exception as e:
+            logger.debug("Failed to notify shell: %s", e)
+    logger.info("Closed %s shell(s) for drain", len(shells))
+    return len(shells)
+
+
 @router.websocket("/shell/{session_id}")
 async def websocket_shell(websocket: WebSocket, session_id: str):
     await websocket.accept()
-    
+    if not accepting_shells:
+        await websocket.close(code=RESTART_CLOSE_CODE, reason="Server restarting")
+        return
+    if len(active_shells) >= MAX_SHELLS:
+        await websocket.close(code=4013, reason="Shell capacity reached, try again shortly")
+        return
+
     db: Session = SessionLocal()
     try:
         session = db.query(UserSessionDB).filter(UserSessionDB.session_uuid == session_id).first()
@@ -24,11 +68,21 @@ async def websocket_shell(websocket: WebSocket, session_id: str):
             return
         
         sandbox_ns = session.sandbox_namespace
-        logger.info(f"Connecting to toolbox in {sandbox_ns} for session {session_id}")
+        record = recording_store.enabled_for(session)
+        user_id, lab_id = session.user_id, session.lab_id
+        bind(user=user_id)
+        kubectl_args = websocket.app.state.clusters.ops(session.cluster).kubectl_args
+        logger.info("Connecting to toolbox in %s for session %s", sandbox_ns, session_id)
         
     finally:
         db.close()
 
+    # Reconnect loops and tab spam are limited per user, not just by MAX_SHELLS
+    retry_after = await websocket.app.state.rate_limiter.check("shell", user_id)
+    if retry_after is not None:
+        await websocket.close(code=4029, reason=f"Too many shells opened, retry in {retry_after}s")
+        return
+
     # Create PTY
     master_fd, slave_fd = pty.openpty()
 
@@ -36,7 +90,7 @@ async def websocket_shell(websocket: WebSocket, session_id: str):
     # We use -i -t to allocate a TTY in the container
     try:
         proc = await asyncio.create_subprocess_exec(
-            "kubectl", "exec", "-n", sandbox_ns, "playground-toolbox", "-i", "-t",
+            "kubectl", *kubectl_args, "exec", "-n", sandbox_ns, "playground-toolbox", "-i", "-t",
             "--", "/bin/bash",
             stdin=slave_fd,
             stdout=slave_fd,
@@ -44,7 +98,7 @@ async def websocket_shell(websocket: WebSocket, session_id: str):
             preexec_fn=os.setsid
         )
     except Exception as e:
-        logger.error(f"Failed to start kubectl exec: {e}")
+        logger.error("Failed to start kubectl exec: %s", e)
         os.close(master_fd)
         os.close(slave_fd)
         await websocket.close(code=4000, reason="Failed to start shell")
@@ -53,6 +107,7 @@ async def websocket_shell(websocket: WebSocket, session_id: str):
     # Close slave_fd in parent as it's used by child
     os.close(slave_fd)
 
+    recorder = recording_store.start(session_id, user_id, lab_id) if record else None
     loop = asyncio.get_running_loop()
     output_queue = asyncio.Queue()
 
@@ -74,25 +129,34 @@ async def websocket_shell(websocket: WebSocket, session_id: str):
                 data = await output_queue.get()
                 if data is None:
                     break
-                await websocket.send_text(data.decode("utf-8", errors="replace"))
+                text = data.decode("utf-8", errors="replace")
+                await websocket.send_text(text)
+                if recorder is not None:
+                    recorder.output(text)
         except Exception as e:
-            logger.debug(f"Output pipe ended: {e}")
+            logger.debug("Output pipe ended: %s", e)
 
     output_task = asyncio.create_task(pipe_output())
+    active_shells.add(websocket)
 
     try:
         while True:
             data = await websocket.receive_text()
+            if recorder is not None:
+                recorder.input(data)
             # Write to master_fd
             try:
                 os.write(master_fd, data.encode())
             except OSError:
                 break
     except WebSocketDisconnect:
-        logger.info(f"Shell disconnected for session {session_id}")
+        logger.info("Shell disconnected for session %s", session_id)
     except Exception as e:
-        logger.error(f"Shell connection error: {e}")
+        logger.error("Shell connection error: %s", e)
     finally:
+        active_shells.discard(websocket)
+        if recorder is not None:
+            recorder.close()
         loop.remove_reader(master_fd)
         try:
             os.close(master_fd)
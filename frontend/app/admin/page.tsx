@@ -1,14 +1,29 @@
 "use client";
 
-import { useEffect, useState, Fragment } from "react";
-import { adminApi, apiRequest } from "@/lib/api";
+import { useEffect, useRef, useState, Fragment } from "react";
+import { adminApi, apiRequest, API_BASE_URL } from "@/lib/api";
 import { Users, Layout, Zap, Activity, Download, Globe, ChevronDown, ChevronUp, Trash2, Box, Layers, Database, Lock, Server } from "lucide-react";
 import { toast } from "sonner";
 import ConfirmationModal from "@/components/ConfirmationModal";
 
+// Only the columns the dashboard renders; skips the resource usage snapshots
+const SESSION_FIELDS = "session_uuid,user_id,lab_id,sandbox_namespace,status,start_time,provisioning_step";
+const PAGE_SIZE = 100;
+
+// Sessions still being provisioned have no start_time yet; keep them on top
+const startKey = (s: any) => s.start_time ?? "~";
+
+const mergeSessions = (current: any[], changed: any[]) => {
+    const byId = new Map(current.map(s => [s.session_uuid, s]));
+    changed.forEach(s => byId.set(s.session_uuid, { ...byId.get(s.session_uuid), ...s }));
+    return Array.from(byId.values()).sort((a, b) => startKey(b).localeCompare(startKey(a)));
+};
+
 export default function AdminDashboard() {
     const [stats, setStats] = useState<any>(null);
     const [sessions, setSessions] = useState<any[]>([]);
+    const [nextCursor, setNextCursor] = useState<string | null>(null);
+    const syncCursor = useRef<string | null>(null);
     const [loading, setLoading] = useState(true);
     const [expandedSession, setExpandedSession] = useState<string | null>(null);
     const [sessionResources, setSessionResources] = useState<Record<string, any>>({});
@@ -17,12 +32,14 @@ export default function AdminDashboard() {
 
     const loadData = async () => {
         try {
-            const [s, sess] = await Promise.all([
+            const [s, page] = await Promise.all([
                 adminApi.getStats(),
-                adminApi.listSessions()
+                adminApi.listSessions({ fields: SESSION_FIELDS, limit: PAGE_SIZE })
             ]);
             setStats(s);
-            setSessions(sess);
+            setSessions(page.items);
+            setNextCursor(page.next_cursor);
+            syncCursor.current = page.sync_cursor;
         } catch (err) {
             console.error(err);
         } finally {
@@ -30,10 +47,68 @@ export default function AdminDashboard() {
         }
     };
 
+    // Pulls only the sessions changed since the last sync
+    const refreshData = async () => {
+        if (!syncCursor.current) return loadData();
+        try {
+            const [s, delta] = await Promise.all([
+                adminApi.getStats(),
+                adminApi.listSessions({ fields: SESSION_FIELDS, changed_since: syncCursor.current, limit: 500 })
+            ]);
+            setStats(s);
+            if (delta.items.length > 0) {
+                setSessions(prev => mergeSessions(prev, delta.items));
+            }
+            syncCursor.current = delta.sync_cursor;
+        } catch (err) {
+            console.error(err);
+        }
+    };
+
+    const loadMore = async () => {
+        if (!nextCursor) return;
+        try {
+            const page = await adminApi.listSessions({ fields: SESSION_FIELDS, limit: PAGE_SIZE, cursor: nextCursor });
+            setSessions(prev => mergeSessions(prev, page.items));
+            setNextCursor(page.next_cursor);
+        } catch (err: any) {
+            toast.error(err.message);
+        }
+    };
+
     useEffect(() => {
-        loadData();
-        const interval = setInterval(loadData, 10000); // Refresh every 10s
-        return () => clearInterval(interval);
+        // Snapshot + lifecycle deltas pushed from the backend
+        const source = new EventSource(`${API_BASE_URL}/admin/events`);
+        source.addEventListener("snapshot", (e) => {
+            const snapshot = JSON.parse((e as MessageEvent).data);
+            setStats(snapshot.stats);
+            setSessions(mergeSessions([], snapshot.sessions));
+            setNextCursor(snapshot.next_cursor);
+            syncCursor.current = snapshot.sync_cursor;
+            setLoading(false);
+        });
+        source.addEventListener("delta", (e) => {
+            const { events } = JSON.parse((e as MessageEvent).data);
+            const created = events.filter((ev: any) => ev.event === "created").length;
+            if (created > 0) {
+                setStats((prev: any) => prev && ({
+                    ...prev,
+                    total_sessions_all_time: prev.total_sessions_all_time + created,
+                    total_sessions_today: (prev.total_sessions_today ?? 0) + created,
+                }));
+            }
+            setSessions(prev => mergeSessions(prev, events.map((ev: any) => ev.session)));
+        });
+        source.onerror = () => {
+            // EventSource reconnects on its own; fall back to a one-off fetch meanwhile
+            if (!syncCursor.current) loadData();
+        };
+        // Each replica only pushes its own events; a slow delta resync catches the rest
+        const interval = setInterval(refreshData, 60000);
+        return () => {
+            source.close();
+            clearInterval(interval);
+        };
     }, []);
 
     const handleTerminate = (id: string) => {
@@ -45,7 +120,7 @@ export default function AdminDashboard() {
         try {
             await adminApi.terminateSession(terminatingId);
             toast.success("Session terminated");
-            loadData();
+            refreshData();
         } catch (err: any) {
             toast.error(err.message);
         } finally {
@@ -122,8 +197,12 @@ export default function AdminDashboard() {
         </div>
     );
 
-    const activeSessions = sessions.filter(s => s.status === 'active');
-    const inactiveSessions = sessions.filter(s => s.status !== 'active');
+    const activeSessions = sessions.filter(s => s.status === 'active' || s.status === 'provisioning');
+    const inactiveSessions = sessions.filter(s => s.status !== 'active' && s.status !== 'provisioning');
+    const activeCount = sessions.filter(s => s.status === 'active').length;
+    const utilizationPct = stats?.max_concurrent_sessions
+        ? (activeCount / stats.max_concurrent_sessions) * 100
+        : stats?.cluster_utilization_pct;
 
     return (
         <div className="max-w-7xl mx-auto px-4 sm:px-6 lg:px-8 py-12">
@@ -155,7 +234,7 @@ export default function AdminDashboard() {
                         </div>
                         <span className="text-sm font-bold text-muted uppercase tracking-widest">Active Users</span>
                     </div>
-                    <div className="text-5xl font-extrabold text-slate-900 dark:text-white mb-2">{stats?.active_sessions}</div>
+                    <div className="text-5xl font-extrabold text-slate-900 dark:text-white mb-2">{activeCount}</div>
                     <div className="flex items-center gap-2 text-sm text-muted">
                         <div className="h-1.5 w-1.5 rounded-full bg-hpe animate-pulse" />
                         Live concurrency
@@ -173,7 +252,9 @@ export default function AdminDashboard() {
                         <span className="text-sm font-bold text-muted uppercase tracking-widest">Total Labs</span>
                     </div>
                     <div className="text-5xl font-extrabold text-slate-900 dark:text-white mb-2">{stats?.total_sessions_all_time}</div>
-                    <div className="text-sm text-muted">Completed sessions</div>
+                    <div className="text-sm text-muted">
+                        {stats?.total_sessions_today ?? 0} today · {stats?.completions_today ?? 0} completed
+                    </div>
                 </div>
 
                 <div className="card p-8 group relative overflow-hidden">
@@ -186,11 +267,11 @@ export default function AdminDashboard() {
                         </div>
                         <span className="text-sm font-bold text-muted uppercase tracking-widest">Utilization</span>
                     </div>
-                    <div className="text-5xl font-extrabold text-slate-900 dark:text-white mb-4">{stats?.cluster_utilization_pct?.toFixed(1)}%</div>
+                    <div className="text-5xl font-extrabold text-slate-900 dark:text-white mb-4">{utilizationPct?.toFixed(1)}%</div>
                     <div className="w-full bg-slate-100 dark:bg-slate-800 h-3 rounded-full overflow-hidden shadow-inner">
                         <div
                             className="bg-gradient-to-r from-amber-400 to-amber-600 h-full transition-all duration-1000 ease-out rounded-full"
-                            style={{ width: `${stats?.cluster_utilization_pct}%` }}
+                            style={{ width: `${utilizationPct}%` }}
                         />
                     </div>
                 </div>
@@ -205,7 +286,7 @@ export default function AdminDashboard() {
                             <span className="inline-flex items-center px-2 py-0.5 rounded-full text-xs font-bold bg-hpe/10 text-hpe uppercase tracking-widest">Live</span>
                         </div>
                         <div className="text-sm text-muted font-medium">
-                            Refreshing every 10s
+                            Live updates
                         </div>
                     </div>
                     <div className="overflow-x-auto">
@@ -244,7 +325,9 @@ export default function AdminDashboard() {
                                                 </span>
                                             </td>
                                             <td className="px-8 py-5 text-sm text-muted font-medium">
-                                                {Math.floor((new Date().getTime() - new Date(session.created_at).getTime()) / 60000)}m active
+                                                {session.status === 'provisioning' || session.provisioning_step
+                                                    ? `Provisioning${(session.step || session.provisioning_step) ? ` (${session.step || session.provisioning_step})` : ""}...`
+                                                    : `${Math.floor((new Date().getTime() - new Date(session.start_time).getTime()) / 60000)}m active`}
                                             </td>
                                             <td className="px-8 py-5 text-right">
                                                 <button
@@ -338,12 +421,19 @@ export default function AdminDashboard() {
                                                     {session.status}
                                                 </span>
                                             </td>
-                                            <td className="px-8 py-4">{new Date(session.created_at).toLocaleString()}</td>
+                                            <td className="px-8 py-4">{new Date(session.start_time).toLocaleString()}</td>
                                         </tr>
                                     ))}
                                 </tbody>
                             </table>
                         </div>
+                        {nextCursor && (
+                            <div className="px-8 py-4 border-t border-slate-200 dark:border-slate-800 text-center">
+                                <button onClick={loadMore} className="text-sm text-hpe hover:underline">
+                                    Load older sessions
+                                </button>
+                            </div>
+                        )}
                     </div>
                 )}
             </div>
@@ -2,7 +2,7 @@
 
 import { useEffect, useState } from "react";
 import { useSearchParams, useParams, useRouter } from "next/navigation";
-import { labsApi, apiRequest } from "@/lib/api";
+import { labsApi, sessionsApi, apiRequest } from "@/lib/api";
 import { CheckCircle, Square, Copy, Trash2, Play, BookOpen, ExternalLink, ArrowRight, Terminal as TerminalIcon, Code, Info } from "lucide-react";
 import Editor from "@/components/Editor";
 import ConfirmationModal from "@/components/ConfirmationModal";
@@ -40,6 +40,10 @@ export default function LabPage() {
     const [manifest, setManifest] = useState("");
     const [isEndModalOpen, setIsEndModalOpen] = useState(false);
     const [isDeleteModalOpen, setIsDeleteModalOpen] = useState(false);
+    const [verifying, setVerifying] = useState(false);
+    const [verifyResults, setVerifyResults] = useState<Record<number, any>>({});
+    const [validating, setValidating] = useState(false);
+    const [validation, setValidation] = useState<any>(null);
 
     const handleEndSession = () => setIsEndModalOpen(true);
 
@@ -104,17 +108,26 @@ export default function LabPage() {
                 }
                 
                 setLab(data);
+
+                // Resume after the last step this session completed
+                if (sessionId) {
+                    const progress = await sessionsApi.getProgress(sessionId).catch(() => null);
+                    const done = new Set<number>(progress?.completed_steps ?? []);
+                    const resumeAt = data.steps.findIndex((s: any) => s.step !== undefined && !done.has(s.step));
+                    if (done.size > 0 && resumeAt > 0) setCurrentStep(resumeAt);
+                }
             } catch (err) {
                 console.error(err);
                 toast.error("Failed to load lab");
             }
         }
         loadLab();
-    }, [params.labId]);
+    }, [params.labId, sessionId]);
 
     // Update manifest state when step changes
     useEffect(() => {
         setManifest(""); // Clear manifest on step change to wait for user input/copy
+        setValidation(null);
     }, [currentStep]);
 
     const isManifestValid = (content: string) => {
@@ -127,6 +140,37 @@ export default function LabPage() {
         }
     };
 
+    const handleValidate = async () => {
+        if (!sessionId) return;
+        setValidating(true);
+        try {
+            setValidation(await sessionsApi.validateManifest(sessionId, manifest));
+        } catch (err: any) {
+            toast.error(err.message || "Validation failed");
+        } finally {
+            setValidating(false);
+        }
+    };
+
+    const handleVerify = async (step: number) => {
+        if (!sessionId) return;
+        setVerifying(true);
+        try {
+            const result = await sessionsApi.verify(sessionId, [step]);
+            const stepResult = result.steps.find((s: any) => s.step === step);
+            setVerifyResults(prev => ({ ...prev, [step]: stepResult }));
+            if (stepResult?.passed) {
+                toast.success("Step verified!");
+            } else {
+                toast.error("Not quite there yet - see the checks below");
+            }
+        } catch (err: any) {
+            toast.error(err.message || "Verification failed");
+        } finally {
+            setVerifying(false);
+        }
+    };
+
     const handleFinish = async () => {
         if (!sessionId) return;
         try {
@@ -406,6 +450,26 @@ export default function LabPage() {
                                                         <div className="text-sm text-slate-600 dark:text-slate-400">
                                                             {renderContent({ content: activeStep.verification })}
                                                         </div>
+                                                        {activeStep.checks?.length > 0 && sessionId && (
+                                                            <div className="mt-4">
+                                                                <button
+                                                                    onClick={() => handleVerify(activeStep.step)}
+                                                                    disabled={verifying}
+                                                                    className="btn btn-secondary text-xs px-3 py-1.5 disabled:opacity-50"
+                                                                >
+                                                                    {verifying ? "Checking..." : "Check my work"}
+                                                                </button>
+                                                                {verifyResults[activeStep.step] && (
+                                                                    <ul className="mt-3 space-y-1 text-xs">
+                                                                        {verifyResults[activeStep.step].checks.map((c: any, i: number) => (
+                                                                            <li key={i} className={c.passed ? "text-green-600" : "text-rose-600"}>
+                                                                                {c.passed ? "✓" : "✗"} {c.check}{c.detail ? ` (${c.detail})` : ""}
+                                                                            </li>
+                                                                        ))}
+                                                                    </ul>
+                                                                )}
+                                                            </div>
+                                                        )}
                                                     </div>
                                                 )}
                                             </>
@@ -425,6 +489,9 @@ export default function LabPage() {
                             </button>
                             <button
                                 onClick={() => {
+                                    if (sessionId && activeStep.step !== undefined) {
+                                        sessionsApi.recordProgress(sessionId, activeStep.step).catch(console.error);
+                                    }
                                     if (currentStep === lab.steps.length - 1) {
                                         handleFinish();
                                     } else {
@@ -456,6 +523,14 @@ export default function LabPage() {
                                             Delete
                                         </button>
                                     )}
+                                    <button
+                                        onClick={handleValidate}
+                                        disabled={!isManifestValid(manifest) || validating}
+                                        className="text-xs bg-slate-800 hover:bg-slate-700 text-slate-300 px-3 py-1.5 rounded transition-colors flex items-center gap-1.5 disabled:opacity-50 disabled:cursor-not-allowed"
+                                    >
+                                        <CheckCircle size={12} />
+                                        {validating ? "Validating..." : "Validate"}
+                                    </button>
                                     <button
                                         onClick={async () => {
                                             if (sessionId) {
@@ -494,10 +569,38 @@ export default function LabPage() {
                                     The content updates automatically with each step, but your changes persist until you switch steps.
                                 </p>
                             </div>
+                            {validation && (
+                                <div className="bg-slate-950 border-b border-slate-800 p-3 text-xs font-mono max-h-48 overflow-y-auto">
+                                    {validation.errors.map((e: any, i: number) => (
+                                        <div key={`e${i}`} className="text-rose-400">
+                                            ✗ {e.line ? `line ${e.line}: ` : ""}{e.path ? `${e.path}: ` : ""}{e.message}
+                                        </div>
+                                    ))}
+                                    {validation.warnings.map((w: any, i: number) => (
+                                        <div key={`w${i}`} className="text-amber-400">! {w.message}</div>
+                                    ))}
+                                    {validation.objects.map((o: any, i: number) => (
+                                        <div key={`o${i}`} className="mt-1">
+                                            <div className="text-green-400">
+                                                ✓ {o.kind}/{o.name}: {o.action === "create" ? "will be created" : o.action === "update" ? "will be updated" : "unchanged"}
+                                            </div>
+                                            {o.changes.map((c: any, j: number) => (
+                                                <div key={j} className="pl-4 text-slate-400">
+                                                    {c.op === "added" ? "+" : c.op === "removed" ? "-" : "~"} {c.path}
+                                                    {c.op !== "removed" && `: ${JSON.stringify(c.new)}`}
+                                                </div>
+                                            ))}
+                                        </div>
+                                    ))}
+                                </div>
+                            )}
                             <div className="flex-1 relative">
                                 <Editor
                                     value={manifest}
-                                    onChange={(val) => setManifest(val || "")}
+                                    onChange={(val) => {
+                                        setManifest(val || "");
+                                        setValidation(null);
+                                    }}
                                 />
                             </div>
                         </div>
@@ -56,6 +56,7 @@ export default function XTermTerminal({ sessionId: propSessionId }: TerminalProp
         let mounted = true;
         let term: any = null;
         let resizeObserver: ResizeObserver | null = null;
+        let reconnectTimer: ReturnType<typeof setTimeout> | null = null;
 
         const initTerminal = async () => {
             if (!terminalRef.current || xtermRef.current) return;
@@ -122,7 +123,6 @@ export default function XTermTerminal({ sessionId: propSessionId }: TerminalProp
                 term.writeln("\x1b[1;32mHPE PCAI Playground Terminal (v2)\x1b[0m");
                 
                 if (sessionId) {
-                    term.writeln("Connecting to sandbox...");
                     const protocol = window.location.protocol === "https:" ? "wss:" : "ws:";
                     let wsUrl = `${protocol}//${window.location.host}/api/shell/${sessionId}`;
 
@@ -130,40 +130,54 @@ export default function XTermTerminal({ sessionId: propSessionId }: TerminalProp
                         wsUrl = `ws://localhost:8000/shell/${sessionId}`;
                     }
 
-                    try {
-                        const ws = new WebSocket(wsUrl);
-                        wsRef.current = ws;
+                    term.onData((data: string) => {
+                        const ws = wsRef.current;
+                        if (ws && ws.readyState === WebSocket.OPEN) {
+                            ws.send(data);
+                        }
+                    });
 
-                        ws.onopen = () => {
-                            term?.writeln("\x1b[1;32mConnected!\x1b[0m");
-                            fitAddon.fit();
-                            term?.focus();
-                        };
+                    const connect = () => {
+                        if (!mounted) return;
+                        term?.writeln("Connecting to sandbox...");
+                        try {
+                            const ws = new WebSocket(wsUrl);
+                            wsRef.current = ws;
 
-                        term.onData((data: string) => {
-                            if (ws && ws.readyState === WebSocket.OPEN) {
-                                ws.send(data);
-                            }
-                        });
+                            ws.onopen = () => {
+                                term?.writeln("\x1b[1;32mConnected!\x1b[0m");
+                                fitAddon.fit();
+                                term?.focus();
+                            };
+
+                            ws.onmessage = (ev) => {
+                                term?.write(ev.data, () => {
+                                    term?.scrollToBottom();
+                                });
+                            };
+
+                            ws.onclose = (ev) => {
+                                if (!mounted || wsRef.current !== ws) return;
+                                // 1012: the backend replica is restarting; another one will take the shell
+                                if (ev.code === 1012) {
+                                    term?.writeln("\r\n\x1b[1;33mServer restarting, reconnecting...\x1b[0m");
+                                    reconnectTimer = setTimeout(connect, 2000 + Math.random() * 1000);
+                                    return;
+                                }
+                                term?.writeln("\r\n\x1b[1;31mConnection closed.\x1b[0m");
+                            };
+
+                            ws.onerror = (err) => {
+                                console.error("WebSocket Error:", err);
+                                term?.writeln("\r\n\x1b[1;31mWebSocket connection failed.\x1b[0m");
+                            };
+                        } catch (err) {
+                            console.error("WebSocket creation error:", err);
+                            term?.writeln("\r\n\x1b[1;31mFailed to create WebSocket connection.\x1b[0m");
+                        }
+                    };
 
-                        ws.onmessage = (ev) => {
-                            term?.write(ev.data, () => {
-                                term?.scrollToBottom();
-                            });
-                        };
-
-                        ws.onclose = () => {
-                            term?.writeln("\r\n\x1b[1;31mConnection closed.\x1b[0m");
-                        };
-
-                        ws.onerror = (err) => {
-                            console.error("WebSocket Error:", err);
-                            term?.writeln("\r\n\x1b[1;31mWebSocket connection failed.\x1b[0m");
-                        };
-                    } catch (err) {
-                        console.error("WebSocket creation error:", err);
-                        term.writeln("\r\n\x1b[1;31mFailed to create WebSocket connection.\x1b[0m");
-                    }
+                    connect();
                 } else {
                     term.writeln("\x1b[1;33mNo active session. Start a lab to use the terminal.\x1b[0m");
                 }
@@ -178,6 +192,7 @@ export default function XTermTerminal({ sessionId: propSessionId }: TerminalProp
         return () => {
             mounted = false;
             if (resizeObserver) resizeObserver.disconnect();
+            if (reconnectTimer) clearTimeout(reconnectTimer);
             if (wsRef.current) {
                 wsRef.current.close();
                 wsRef.current = null;
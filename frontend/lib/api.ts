@@ -38,14 +38,44 @@ export const sessionsApi = {
     listMy: () => apiRequest("/sessions/me"),
     extend: (id: string) => apiRequest(`/sessions/${id}/extend`, { method: "POST" }),
     terminate: (id: string) => apiRequest(`/sessions/${id}`, { method: "DELETE" }),
+    getProgress: (id: string) => apiRequest(`/sessions/${id}/progress`),
+    verify: (id: string, steps?: number[]) => apiRequest(`/sessions/${id}/verify`, {
+        method: "POST",
+        body: JSON.stringify({ steps }),
+    }),
+    validateManifest: (id: string, manifest: string) => apiRequest(`/sessions/${id}/validate-manifest`, {
+        method: "POST",
+        body: JSON.stringify({ manifest }),
+    }),
+    recordProgress: (id: string, stepNumber: number) => apiRequest(`/sessions/${id}/progress`, {
+        method: "POST",
+        body: JSON.stringify({ step_number: stepNumber }),
+    }),
 };
 
 export const adminApi = {
-    listSessions: (status?: string) => {
-        const path = status ? `/admin/sessions?status=${status}` : "/admin/sessions";
-        return apiRequest(path);
+    listSessions: (params: Record<string, string | number | undefined> = {}) => {
+        const searchParams = new URLSearchParams(
+            Object.entries(params)
+                .filter(([, value]) => value !== undefined)
+                .map(([key, value]) => [key, String(value)])
+        ).toString();
+        return apiRequest(`/admin/sessions${searchParams ? `?${searchParams}` : ""}`);
     },
     terminateSession: (id: string) => apiRequest(`/admin/sessions/${id}`, { method: "DELETE" }),
+    bulkTerminate: (filter: Record<string, any>) => apiRequest("/admin/sessions/bulk/terminate", {
+        method: "POST",
+        body: JSON.stringify({ filter }),
+    }),
+    bulkExtend: (filter: Record<string, any>, hours = 1) => apiRequest("/admin/sessions/bulk/extend", {
+        method: "POST",
+        body: JSON.stringify({ filter, hours }),
+    }),
+    bulkProvision: (labId: string, userIds: string[]) => apiRequest("/admin/sessions/bulk/provision", {
+        method: "POST",
+        body: JSON.stringify({ lab_id: labId, user_ids: userIds }),
+    }),
+    getJob: (jobId: string) => apiRequest(`/admin/jobs/${jobId}`),
     getStats: () => apiRequest("/admin/stats"),
 };
 
@@ -1,10 +1,24 @@
 #!/usr/bin/env python3
-import os
+import argparse
+import fnmatch
 import hashlib
 import json
-import subprocess
+import os
 import re
+import subprocess
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import blake3
+except ImportError:  # Optional: fall back to xxhash, then to blake2b from hashlib
+    blake3 = None
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
 
 # Configuration
 COMPONENTS = {
@@ -17,25 +31,312 @@ CACHE_FILE = ".smart_build_cache.json"
 CHART_FILE = "helm/playground/Chart.yaml"
 VALUES_FILE = "helm/playground/values.yaml"
 
-def get_dir_hash(directory):
-    """Calculate a hash of the directory contents."""
-    hash_md5 = hashlib.md5()
+# Never part of an image, even if a .dockerignore forgets them
+ALWAYS_IGNORED = ["__pycache__", "*.pyc", "node_modules", ".next", ".git"]
+# Sent to the builder regardless of .dockerignore
+ALWAYS_HASHED = ["Dockerfile", ".dockerignore"]
+# Inputs that are only COPY'd for a dependency install layer
+DEPENDENCY_MANIFESTS = ["requirements*.txt", "package.json", "package-lock.json", "yarn.lock", "pnpm-lock.yaml"]
+DATA_FILES = ["*.json", "*.yaml", "*.yml", "*.csv", "*.md"]
+
+if blake3 is not None:
+    HASH_NAME, new_hasher = "blake3", blake3.blake3
+elif xxhash is not None:
+    HASH_NAME, new_hasher = "xxh3_128", xxhash.xxh3_128
+else:
+    HASH_NAME, new_hasher = "blake2b", hashlib.blake2b
+
+print_lock = threading.Lock()
+
+
+def log(message):
+    with print_lock:
+        print(message, flush=True)
+
+
+def compile_pattern(pattern):
+    """Translates a .dockerignore pattern into a regex over context-relative paths."""
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+            if pattern.startswith("/", i):
+                regex += "/?"
+                i += 1
+        elif pattern[i] == "*":
+            regex += "[^/]*"
+            i += 1
+        elif pattern[i] == "?":
+            regex += "[^/]"
+            i += 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+    # A matching directory excludes everything below it
+    return re.compile(f"^{regex}(/.*)?$")
+
+
+def load_ignore_rules(directory):
+    """Returns [(regex, negated)] from the component's .dockerignore, in order."""
+    rules = []
+    path = os.path.join(directory, ".dockerignore")
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                negated = line.startswith("!")
+                pattern = os.path.normpath(line.lstrip("!").strip()).lstrip("/")
+                rules.append((compile_pattern(pattern), negated))
+    return rules
+
+
+def is_ignored(rel_path, name, rules):
+    if any(fnmatch.fnmatch(name, pattern) for pattern in ALWAYS_IGNORED):
+        return True
+    if rel_path in ALWAYS_HASHED:
+        return False
+    ignored = False
+    # Docker semantics: the last matching rule wins
+    for regex, negated in rules:
+        if regex.match(rel_path):
+            ignored = not negated
+    return ignored
+
+
+def context_files(directory):
+    """Lists the files Docker would send as build context, pruning ignored directories."""
+    rules = load_ignore_rules(directory)
+    # A negated rule may re-include files below an ignored directory
+    can_prune = not any(negated for _, negated in rules)
+    result = []
     for root, dirs, files in os.walk(directory):
-        # Sort for consistency
-        dirs.sort()
-        files.sort()
-        for names in files:
-            if any(x in names for x in ['__pycache__', 'node_modules', '.next', '.pyc']):
+        rel_root = os.path.relpath(root, directory)
+        rel_root = "" if rel_root == "." else rel_root + "/"
+        dirs[:] = [
+            d for d in dirs
+            if not (any(fnmatch.fnmatch(d, p) for p in ALWAYS_IGNORED)
+                    or (can_prune and is_ignored(rel_root + d, d, rules)))
+        ]
+        for name in files:
+            rel_path = rel_root + name
+            if not is_ignored(rel_path, name, rules):
+                result.append(rel_path)
+    return sorted(result)
+
+
+def hash_file(path):
+    hasher = new_hasher()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def hash_context(directory, file_cache, seen_files, pool):
+    """Hashes a component's build context, reusing digests of unchanged files.
+
+    A file is rehashed only when its (size, mtime, inode) differs from its
+    entry in `file_cache`; the rest are hashed in parallel on `pool`. Entries
+    for every file in the context are written to `seen_files`.
+    """
+    digests = {}
+    pending = {}
+    for rel_path in context_files(directory):
+        path = os.path.join(directory, rel_path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        key = [st.st_size, st.st_mtime_ns, st.st_ino]
+        cached = file_cache.get(path)
+        if cached and cached[:3] == key:
+            digests[rel_path] = cached[3]
+            seen_files[path] = cached
+        else:
+            pending[rel_path] = (key, pool.submit(hash_file, path))
+
+    for rel_path, (key, future) in pending.items():
+        try:
+            digest = future.result()
+        except OSError:
+            continue
+        digests[rel_path] = digest
+        seen_files[os.path.join(directory, rel_path)] = key + [digest]
+
+    return digests, len(pending)
+
+def combine_digests(digests):
+    combined = new_hasher()
+    for rel_path in sorted(digests):
+        combined.update(f"{rel_path}\0{digests[rel_path]}\n".encode())
+    return f"{HASH_NAME}:{combined.hexdigest()}"
+
+# --- Build graph ---
+
+def classify(rel_path):
+    """Which kind of input a context file is, for the build plan."""
+    name = os.path.basename(rel_path)
+    if name in ALWAYS_HASHED:
+        return "build"
+    if any(fnmatch.fnmatch(name, pattern) for pattern in DEPENDENCY_MANIFESTS):
+        return "dependencies"
+    if any(fnmatch.fnmatch(name, pattern) for pattern in DATA_FILES):
+        return "data"
+    return "source"
+
+def parse_dockerfile(directory):
+    """Returns the Dockerfile's instructions with continuations joined and comments dropped."""
+    instructions = []
+    current = ""
+    with open(os.path.join(directory, "Dockerfile")) as f:
+        for line in f:
+            stripped = line.strip()
+            if not current and (not stripped or stripped.startswith("#")):
+                continue
+            if stripped.startswith("#"):
+                continue  # Comment inside a continued instruction
+            if stripped.endswith("\\"):
+                current += stripped[:-1].strip() + " "
                 continue
-            file_path = os.path.join(root, names)
-            hash_md5.update(file_path.encode())
-            try:
-                with open(file_path, "rb") as f:
-                    for chunk in iter(lambda: f.read(4096), b""):
-                        hash_md5.update(chunk)
-            except (OSError, IOError):
-                pass
-    return hash_md5.hexdigest()
+            instructions.append(" ".join((current + stripped).split()))
+            current = ""
+    if current:
+        instructions.append(" ".join(current.split()))
+    return instructions
+
+def context_layers(instructions):
+    """COPY/ADD instructions that read from the build context, with their source patterns."""
+    layers = []
+    for index, instruction in enumerate(instructions):
+        words = instruction.split()
+        if words[0].upper() not in ("COPY", "ADD"):
+            continue
+        args = [w for w in words[1:] if not w.startswith("--")]
+        if any(w.startswith("--from") for w in words[1:]) or len(args) < 2:
+            continue  # Copies from another stage, not the context
+        sources = [os.path.normpath(src).lstrip("/") for src in args[:-1]]
+        layers.append({
+            "index": index,
+            "instruction": instruction,
+            "patterns": [None if src == "." else compile_pattern(src) for src in sources],
+        })
+    return layers
+
+def layer_matches(layer, rel_path):
+    return any(pattern is None or pattern.match(rel_path) for pattern in layer["patterns"])
+
+def base_images(instructions):
+    return [i.split()[1] for i in instructions if i.split()[0].upper() == "FROM" and len(i.split()) > 1]
+
+def component_dependencies(instructions_by_component):
+    """Components whose Dockerfile builds FROM another component's image."""
+    graph = {}
+    for name, instructions in instructions_by_component.items():
+        graph[name] = sorted(
+            other for other in instructions_by_component
+            if other != name and any(
+                image.split(":")[0] == f"{REGISTRY_PREFIX}-{other}" for image in base_images(instructions)
+            )
+        )
+    return graph
+
+def build_waves(names, graph):
+    """Groups components so each wave only depends on earlier waves."""
+    remaining = set(names)
+    waves = []
+    while remaining:
+        wave = sorted(n for n in remaining if not any(d in remaining for d in graph.get(n, [])))
+        if not wave:
+            raise SystemExit(f"❌ Dependency cycle between components: {sorted(remaining)}")
+        waves.append(wave)
+        remaining -= set(wave)
+    return waves
+
+def plan_component(directory, instructions, digests, build_record):
+    """Works out which layers of a component changed since its last successful build."""
+    built_files = build_record.get("files")
+    built_instructions = build_record.get("instructions")
+
+    if built_files is None:
+        changed_files = sorted(digests)
+    else:
+        changed_files = sorted(
+            path for path in set(digests) | set(built_files)
+            if digests.get(path) != built_files.get(path)
+        )
+    # Dockerfile edits are judged by their instructions, so comment-only edits don't rebuild
+    changed_files = [path for path in changed_files if classify(path) != "build"]
+
+    first_changed = None
+    if built_instructions is None:
+        first_changed = 0
+    elif instructions != built_instructions:
+        first_changed = next(
+            (i for i, (old, new) in enumerate(zip(built_instructions, instructions)) if old != new),
+            min(len(built_instructions), len(instructions)),
+        )
+
+    layers = []
+    for layer in context_layers(instructions):
+        changed = [path for path in changed_files if layer_matches(layer, path)]
+        layers.append({
+            "index": layer["index"],
+            "instruction": layer["instruction"],
+            "inputs": sum(1 for path in digests if layer_matches(layer, path)),
+            "changed_files": changed,
+        })
+        if changed and (first_changed is None or layer["index"] < first_changed):
+            first_changed = layer["index"]
+
+    for layer in layers:
+        layer["cached"] = first_changed is None or layer["index"] < first_changed
+
+    by_kind = {}
+    for path in changed_files:
+        by_kind.setdefault(classify(path), []).append(path)
+
+    return {
+        "directory": directory,
+        "hash": combine_digests(digests),
+        "action": "skip" if first_changed is None else "build",
+        "reason": None if first_changed is None else "inputs changed",
+        "rebuild_from": None if first_changed is None else {
+            "index": first_changed,
+            "instruction": instructions[first_changed] if first_changed < len(instructions) else None,
+        },
+        "changed_files": by_kind,
+        "layers": layers,
+    }
+
+def build_plan(cache, digests_by_component, instructions_by_component, version):
+    graph = component_dependencies(instructions_by_component)
+    components = {
+        name: plan_component(COMPONENTS[name], instructions_by_component[name], digests, cache["builds"].get(name, {}))
+        for name, digests in digests_by_component.items()
+    }
+    waves = build_waves(list(components), graph)
+    # A rebuilt base image means its dependents must be rebuilt on top of it
+    for wave in waves:
+        for name in wave:
+            if components[name]["action"] == "skip" and any(components[d]["action"] == "build" for d in graph[name]):
+                components[name]["action"] = "build"
+                components[name]["reason"] = "base image rebuilt"
+                components[name]["rebuild_from"] = {"index": 0, "instruction": instructions_by_component[name][0]}
+    to_build = [[n for n in wave if components[n]["action"] == "build"] for wave in waves]
+    return {
+        "hash_algorithm": HASH_NAME,
+        "version": {
+            "current": version,
+            "next": increment_patch_version(version) if any(to_build) else None,
+        },
+        "dependencies": graph,
+        "waves": [wave for wave in to_build if wave],
+        "components": components,
+    }
 
 def get_current_chart_version():
     with open(CHART_FILE, 'r') as f:
@@ -80,70 +381,150 @@ def update_values_tag(component, new_tag):
     with open(VALUES_FILE, 'w') as f:
         f.write(content)
 
-def run_command(command):
-    print(f"Executing: {command}")
+def run_command(command, prefix=""):
+    log(f"{prefix}Executing: {command}")
     process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
     for line in iter(process.stdout.readline, b''):
-        sys.stdout.write(line.decode())
+        with print_lock:
+            sys.stdout.write(prefix + line.decode())
     process.stdout.close()
     return process.wait()
 
-def main():
+def load_cache():
     if not os.path.exists(CACHE_FILE):
-        cache = {}
-    else:
-        with open(CACHE_FILE, 'r') as f:
-            cache = json.load(f)
+        return {"components": {}, "builds": {}, "files": {}}
+    with open(CACHE_FILE, 'r') as f:
+        cache = json.load(f)
+    if "components" not in cache:
+        # Older caches only stored per-component hashes
+        cache = {"components": cache, "files": {}}
+    cache.setdefault("builds", {})
+    return cache
 
-    changed_any = False
-    current_hashes = {}
-    
-    for name, directory in COMPONENTS.items():
-        if not os.path.exists(directory):
-            continue
-        
-        dir_hash = get_dir_hash(directory)
-        current_hashes[name] = dir_hash
-        
-        if cache.get(name) != dir_hash:
-            print(f"✨ Changes detected in {name}")
-            changed_any = True
-        else:
-            print(f"✅ No changes in {name}")
+def save_cache(cache):
+    with open(CACHE_FILE, 'w') as f:
+        json.dump(cache, f, indent=2)
+
+def build_component(name, directory, version):
+    image_name = f"{REGISTRY_PREFIX}-{name}"
+    log(f"📦 Building {image_name}:{version}...")
+    started = time.perf_counter()
+    # We use latest as well for convenience. The registry layer cache lets a
+    # fresh builder reuse unchanged layers (e.g. dependency installs).
+    cache_ref = f"{image_name}:buildcache"
+    cmd = (
+        f"cd {directory} && docker buildx build --platform linux/amd64 "
+        f"-t {image_name}:{version} -t {image_name}:latest "
+        f"--cache-from type=registry,ref={cache_ref} --cache-to type=registry,ref={cache_ref},mode=max "
+        f"--push ."
+    )
+    ok = run_command(cmd, prefix=f"[{name}] ") == 0
+    elapsed = time.perf_counter() - started
+    log(f"✅ Built and pushed {image_name}" if ok else f"❌ Failed to build {image_name}")
+    return ok, elapsed
+
+def print_report(hash_times, build_results):
+    print("\n⏱️  Summary")
+    for name, (seconds, files, rehashed) in hash_times.items():
+        line = f"  {name:<10} hash {seconds:6.2f}s ({rehashed}/{files} files rehashed)"
+        if name in build_results:
+            ok, build_seconds = build_results[name]
+            line += f"  build {build_seconds:7.1f}s {'ok' if ok else 'FAILED'}"
+        print(line)
+
+def describe(name, component):
+    if component["action"] == "skip":
+        print(f"✅ No changes in {name}")
+        return
+    print(f"✨ Changes detected in {name} ({component['reason']})")
+    for kind, paths in sorted(component["changed_files"].items()):
+        shown = ", ".join(paths[:5]) + (f" and {len(paths) - 5} more" if len(paths) > 5 else "")
+        print(f"   {kind}: {shown}")
+    for layer in component["layers"]:
+        print(f"   {'cached ' if layer['cached'] else 'rebuild'}  {layer['instruction']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and push the components that changed since the last run.")
+    parser.add_argument("--jobs", type=int, default=len(COMPONENTS), help="concurrent image builds")
+    parser.add_argument("--plan", "--dry-run", dest="plan", action="store_true",
+                        help="print the build plan as JSON and exit without building or changing files")
+    args = parser.parse_args()
+
+    cache = load_cache()
+    seen_files = {}
+    digests_by_component = {}
+    instructions_by_component = {}
+    hash_times = {}
+
+    with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as pool:
+        for name, directory in COMPONENTS.items():
+            if not os.path.exists(directory):
+                continue
+
+            started = time.perf_counter()
+            digests, rehashed = hash_context(directory, cache["files"], seen_files, pool)
+            hash_times[name] = (time.perf_counter() - started, len(digests), rehashed)
+            digests_by_component[name] = digests
+            instructions_by_component[name] = parse_dockerfile(directory)
+
+    for name, digests in digests_by_component.items():
+        if name not in cache["builds"] and cache["components"].get(name) == combine_digests(digests):
+            # Built before per-file records existed and unchanged since
+            cache["builds"][name] = {"instructions": instructions_by_component[name], "files": digests}
+
+    plan = build_plan(cache, digests_by_component, instructions_by_component, get_current_chart_version())
+    if args.plan:
+        print(json.dumps(plan, indent=2))
+        return
 
-    if not changed_any:
+    for name, component in plan["components"].items():
+        describe(name, component)
+
+    # Only keep digests for files that still exist
+    cache["files"] = seen_files
+
+    if not plan["waves"]:
+        save_cache(cache)
+        print_report(hash_times, {})
         print("🙌 No components changed. Nothing to do.")
         return
 
     # Bump version
-    old_version = get_current_chart_version()
-    new_version = increment_patch_version(old_version)
+    old_version = plan["version"]["current"]
+    new_version = plan["version"]["next"]
     print(f"⬆️  Bumping version: {old_version} -> {new_version}")
     
     update_chart_version(new_version)
-    
-    for name, directory in COMPONENTS.items():
-        if cache.get(name) != current_hashes[name]:
-            image_name = f"{REGISTRY_PREFIX}-{name}"
-            print(f"📦 Building {image_name}:{new_version}...")
-            
-            # Run docker build
-            # We use latest as well for convenience
-            cmd = f"cd {directory} && docker buildx build --platform linux/amd64 -t {image_name}:{new_version} -t {image_name}:latest --push ."
-            if run_command(cmd) == 0:
-                print(f"✅ Built and pushed {image_name}")
-                update_values_tag(name, new_version)
-                cache[name] = current_hashes[name]
-            else:
-                print(f"❌ Failed to build {image_name}")
-                sys.exit(1)
-
-    # Save cache
-    with open(CACHE_FILE, 'w') as f:
-        json.dump(cache, f, indent=2)
+
+    # Components in a wave have independent contexts and build side by side;
+    # later waves build FROM images of earlier ones
+    build_results = {}
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        for wave in plan["waves"]:
+            if not all(build_results.get(d, (True,))[0] for name in wave for d in plan["dependencies"][name]):
+                print(f"⏭️  Skipping {', '.join(wave)}: a base image failed to build")
+                break
+            futures = {name: pool.submit(build_component, name, COMPONENTS[name], new_version) for name in wave}
+            build_results.update({name: future.result() for name, future in futures.items()})
+
+    for name, (ok, _) in build_results.items():
+        if ok:
+            update_values_tag(name, new_version)
+            cache["components"][name] = plan["components"][name]["hash"]
+            cache["builds"][name] = {
+                "instructions": instructions_by_component[name],
+                "files": digests_by_component[name],
+            }
+
+    # Save cache (successful builds are not repeated on the next run)
+    save_cache(cache)
+    print_report(hash_times, build_results)
+
+    if len(build_results) < sum(len(wave) for wave in plan["waves"]) or not all(ok for ok, _ in build_results.values()):
+        sys.exit(1)
     
     print(f"\n🚀 Success! Version {new_version} is ready for deployment.")
     print(f"Run './helm/refresh.sh' to update your cluster.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()